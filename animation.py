@@ -0,0 +1,309 @@
+"""
+Converts animated images (GIF, multi-frame TIFF, APNG, WebP) into animated ASCII art.
+
+The frames are decoded lazily one after another, frames identical to the previous one are merged
+(their durations are added), and the remaining frames are converted in parallel. Just a small window
+of frames is in memory at any time; the results are streamed in order into the output files:
+an ANSI playback script (FORMAT_ANSI_SCRIPT), an animated SVG image and an animated PNG image (APNG).
+"""
+import hashlib
+import logging
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+from ansi_writer import write_ansi, COLORS_TRUECOLOR
+from approaches import convert_approach
+from ascii_engine import ENGINE_BUILTIN
+from artifacts import FORMAT_SVG, FORMAT_PNG
+from image_context import ImageContext
+from image_ingestion import check_byte_budget, open_image, decode_downscaled, DEFAULT_MAX_WIDTH, DEFAULT_MAX_PIXELS, DEFAULT_MAX_BYTES
+from metrics import METRICS
+from png_renderer import render_image, DEFAULT_FONT_FILENAME
+from svg_renderer import get_svg_dimensions, get_palette, write_style, write_grid
+
+FORMAT_ANSI_SCRIPT = "sh"
+ANIMATION_FORMATS = [FORMAT_ANSI_SCRIPT, FORMAT_SVG, FORMAT_PNG]
+
+# used if the image does not define the duration of its frames (e.g., TIFF)
+DEFAULT_FRAME_DURATION = 100  # milliseconds
+DEFAULT_MAX_FRAMES = 500
+# the delay of APNG frames is an unsigned 16 bit number of milliseconds
+MAX_PNG_FRAME_DURATION = 65535
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+ANSI_SCRIPT_FRAME_DELIMITER = "ASCII_ART_FRAME"
+
+
+def count_frames(data, max_pixels=DEFAULT_MAX_PIXELS):
+    return getattr(open_image(data, max_pixels), "n_frames", 1)
+
+
+def iter_frames(data, max_width=DEFAULT_MAX_WIDTH, max_pixels=DEFAULT_MAX_PIXELS, max_bytes=DEFAULT_MAX_BYTES, max_frames=DEFAULT_MAX_FRAMES):
+    """
+    Yields the frames of the image as (downscaled Pillow image, duration in milliseconds), decoding one frame at a time.
+    Frames identical to the previous one are merged into it, all frames get the size of the first one.
+    At most max_frames frames of the image are read.
+    """
+    check_byte_budget(data, max_bytes)
+    image = open_image(data, max_pixels)
+    frame_count = min(getattr(image, "n_frames", 1), max_frames)
+
+    previous, previous_hash, previous_duration = None, None, 0
+    for index in range(frame_count):
+        image.seek(index)
+        duration = image.info.get("duration") or DEFAULT_FRAME_DURATION
+        frame = decode_downscaled(image.copy(), max_width)
+        if previous is not None and frame.size != previous.size:
+            frame = frame.resize(previous.size, Image.Resampling.BOX)
+        frame_hash = hashlib.blake2b(frame.mode.encode("ascii") + frame.tobytes(), digest_size=16).digest()
+        if frame_hash == previous_hash:
+            previous_duration += duration
+            continue
+        if previous is not None:
+            yield previous, previous_duration
+        previous, previous_hash, previous_duration = frame, frame_hash, duration
+    if previous is not None:
+        yield previous, previous_duration
+
+
+def get_png_chunks(png_data):
+    """
+    Returns the (type, data) pairs of the chunks of a PNG file.
+    """
+    chunks = []
+    position = len(PNG_SIGNATURE)
+    while position < len(png_data):
+        length, chunk_type = struct.unpack(">I4s", png_data[position:position + 8])
+        chunks.append((chunk_type, png_data[position + 8:position + 8 + length]))
+        position += 12 + length
+    return chunks
+
+
+def convert_frame(frame, approach, width, formats, engine=ENGINE_BUILTIN, ansi_colors=COLORS_TRUECOLOR, output_width=None, font_filename=DEFAULT_FONT_FILENAME):
+    """
+    Converts one frame (executed in parallel): returns its CellGrid, its ANSI text and the chunks of its PNG image (if requested).
+    """
+    with METRICS.span("animation_frame"):
+        with ImageContext(image=frame) as context:
+            grid = convert_approach(approach, context, width, engine=engine)
+        result = {"grid": grid, "ansi": None, "png_chunks": None}
+        if FORMAT_ANSI_SCRIPT in formats:
+            result["ansi"] = write_ansi(grid, ansi_colors)
+        if FORMAT_PNG in formats:
+            # the frames are already rendered in parallel
+            buffer = BytesIO()
+            render_image(grid, output_width, font_filename=font_filename, max_workers=1).save(buffer, format="PNG")
+            result["png_chunks"] = get_png_chunks(buffer.getvalue())
+        return result
+
+
+class AnsiScriptWriter:
+    """
+    Writes a shell script that plays the ANSI frames in a loop in the terminal (stop it with Ctrl+C).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.out = open(filename, "w", encoding="utf-8")
+        self.out.write("#!/bin/sh\n")
+        self.out.write("# animated ASCII art, stop it with Ctrl+C\n")
+        self.out.write("trap 'printf \"\\033[0m\\033[?25h\\n\"; exit' INT TERM\n")
+        self.out.write("printf '\\033[?25l\\033[2J'\n")
+        self.out.write("while :; do\n")
+
+    def add_frame(self, result, duration):
+        self.out.write("printf '\\033[H'\n")
+        self.out.write(f"cat <<'{ANSI_SCRIPT_FRAME_DELIMITER}'\n")
+        self.out.write(result["ansi"])
+        self.out.write(f"{ANSI_SCRIPT_FRAME_DELIMITER}\n")
+        self.out.write(f"sleep {duration / 1000:.3f}\n")
+
+    def close(self):
+        self.out.write("done\n")
+        self.out.close()
+
+
+class SvgAnimationWriter:
+    """
+    Writes an animated SVG image: each frame is a group that is shown for its duration (SMIL),
+    the frames are chained and restarted after the last one. The colors are shared by all frames,
+    the CSS classes of new colors are defined next to the first frame using them.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.out = open(filename, "w", encoding="utf-8")
+        self.palette = {}
+        self.frames = 0
+        # the last frame restarts the animation, hence a frame is written as soon as the next one is known
+        self._pending = None
+
+    def add_frame(self, result, duration):
+        grid = result["grid"]
+        if self.frames == 0:
+            svg_width, svg_height = get_svg_dimensions(grid)
+            self.out.write(f'<svg viewBox="0 0 {svg_width:.1f} {svg_height:.1f}" xmlns="http://www.w3.org/2000/svg">\n')
+            self.out.write(f"<title>{escape(f'{grid.columns}x{grid.rows} animated ASCII art')}</title>\n")
+            write_style(self.out, self.palette)
+        self._write_pending(is_last=False)
+
+        known_colors = len(self.palette)
+        get_palette(grid, self.palette)
+        content = StringWriter()
+        if len(self.palette) > known_colors:
+            write_style(content, self.palette, colors=list(self.palette.keys())[known_colors:])
+        write_grid(content, grid, self.palette)
+        self._pending = (self.frames, content.getvalue(), duration)
+        self.frames += 1
+
+    def _write_pending(self, is_last):
+        if self._pending is None:
+            return
+        index, content, duration = self._pending
+        self._pending = None
+        if is_last and index == 0:
+            # a single frame, nothing to animate
+            self.out.write(f"<g>\n{content}</g>\n")
+            return
+        frame_id = "last" if is_last else f"f{index}"
+        begin = "0s;last.end" if index == 0 else f"f{index - 1}.end"
+        self.out.write(f'<g display="none"><set id="{frame_id}" attributeName="display" to="inline" begin="{begin}" dur="{duration / 1000:.3f}s"/>\n')
+        self.out.write(content)
+        self.out.write("</g>\n")
+
+    def close(self):
+        self._write_pending(is_last=True)
+        if self.frames > 0:
+            self.out.write("</svg>\n")
+        self.out.close()
+
+
+class StringWriter:
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+class ApngWriter:
+    """
+    Writes an animated PNG image (APNG) frame by frame from the chunks of the PNG images of the frames.
+    The number of frames is written into the animation control chunk when the file is closed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.out = open(filename, "wb")
+        self.frames = 0
+        self.sequence_number = 0
+        self._animation_control_position = None
+
+    def write_chunk(self, chunk_type, data):
+        self.out.write(struct.pack(">I", len(data)) + chunk_type + data)
+        self.out.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def add_frame(self, result, duration):
+        chunks = result["png_chunks"]
+        header = dict(chunks)[b"IHDR"]
+        width, height = struct.unpack(">II", header[:8])
+        if self.frames == 0:
+            self.out.write(PNG_SIGNATURE)
+            self.write_chunk(b"IHDR", header)
+            self._animation_control_position = self.out.tell()
+            self.write_chunk(b"acTL", struct.pack(">II", 0, 0))  # the number of frames is updated by close()
+
+        self.write_chunk(b"fcTL", struct.pack(">IIIIIHHBB", self.sequence_number, width, height, 0, 0,
+                                              min(duration, MAX_PNG_FRAME_DURATION), 1000, 0, 0))
+        self.sequence_number += 1
+        for chunk_type, data in chunks:
+            if chunk_type != b"IDAT":
+                continue
+            if self.frames == 0:
+                # the first frame is also the default image of viewers without APNG support
+                self.write_chunk(b"IDAT", data)
+            else:
+                self.write_chunk(b"fdAT", struct.pack(">I", self.sequence_number) + data)
+                self.sequence_number += 1
+        self.frames += 1
+
+    def close(self):
+        if self.frames > 0:
+            self.write_chunk(b"IEND", b"")
+            self.out.seek(self._animation_control_position)
+            self.write_chunk(b"acTL", struct.pack(">II", self.frames, 0))
+        self.out.close()
+
+
+WRITERS = {
+    FORMAT_ANSI_SCRIPT: AnsiScriptWriter,
+    FORMAT_SVG: SvgAnimationWriter,
+    FORMAT_PNG: ApngWriter
+}
+
+
+def convert_animation(data, approach, width, outputs, executor=None, window=None, engine=ENGINE_BUILTIN, ansi_colors=COLORS_TRUECOLOR,
+                      output_width=1024, font_filename=DEFAULT_FONT_FILENAME, max_width=DEFAULT_MAX_WIDTH, max_pixels=DEFAULT_MAX_PIXELS,
+                      max_bytes=DEFAULT_MAX_BYTES, max_frames=DEFAULT_MAX_FRAMES, on_progress=None):
+    """
+    Converts all frames of the animated image (bytes) and writes the requested formats.
+
+    outputs: dictionary {format: filename} with formats of ANIMATION_FORMATS
+    executor: runs the frame conversions (anything with submit(function, *args, **kwargs) returning a future,
+              e.g., the shared ConversionPool), by default a thread pool of this call is used
+    window: maximum number of frames in flight (default: twice the number of workers)
+    on_progress: called with the number of written frames and the number of frames of the image
+    Returns the number of written frames and the number of merged (identical) frames.
+    """
+    frame_count = min(count_frames(data, max_pixels), max_frames)
+    own_executor = None
+    if executor is None:
+        executor = own_executor = ThreadPoolExecutor()
+    if window is None:
+        window = 2 * (getattr(executor, "max_workers", None) or getattr(executor, "_max_workers", None) or 4)
+
+    writers = {output_format: WRITERS[output_format](filename) for output_format, filename in outputs.items()}
+    frame_options = {
+        "engine": engine, "ansi_colors": ansi_colors, "output_width": output_width, "font_filename": font_filename
+    }
+    written = 0
+    try:
+        pending = deque()
+
+        def write_next():
+            future, duration = pending.popleft()
+            result = future.result()
+            for writer in writers.values():
+                writer.add_frame(result, duration)
+            return 1
+
+        for frame, duration in iter_frames(data, max_width=max_width, max_pixels=max_pixels, max_bytes=max_bytes, max_frames=max_frames):
+            pending.append((executor.submit(convert_frame, frame, approach, width, list(outputs.keys()), **frame_options), duration))
+            if len(pending) >= window:
+                written += write_next()
+                if on_progress is not None:
+                    on_progress(written, frame_count)
+        while pending:
+            written += write_next()
+            if on_progress is not None:
+                on_progress(written, frame_count)
+    finally:
+        for future, _ in pending:
+            future.cancel()
+        for writer in writers.values():
+            writer.close()
+        if own_executor is not None:
+            own_executor.shutdown(wait=False, cancel_futures=True)
+
+    logging.info(f"converted animation with {frame_count} frames into {written} frames ({frame_count - written} identical frames merged): "
+                 + ", ".join(outputs.values()))
+    return {"frames": written, "merged": frame_count - written}
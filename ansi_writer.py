@@ -0,0 +1,105 @@
+from functools import lru_cache
+
+import numpy as np
+
+from cell_grid import ANSI_PALETTE, ANSI_RESET, get_256_color
+
+COLORS_TRUECOLOR = "truecolor"
+COLORS_256 = "256"
+COLORS_16 = "16"
+
+# the lookup tables map colors reduced to LUT_BITS per channel to the nearest palette color
+LUT_BITS = 5
+
+
+def get_palette(colors):
+    """
+    Returns the palette (RGB tuples) and the escape code parameters of each palette color
+    as (foreground, background) pairs.
+    """
+    if colors == COLORS_256:
+        # the 16 base colors are left out, as they depend on the theme of the terminal
+        palette = [get_256_color(index) for index in range(16, 256)]
+        codes = [(f"38;5;{index}", f"48;5;{index}") for index in range(16, 256)]
+    elif colors == COLORS_16:
+        palette = list(ANSI_PALETTE)
+        codes = [(str(30 + index), str(40 + index)) for index in range(8)] + [(str(90 + index), str(100 + index)) for index in range(8)]
+    else:
+        raise ValueError(f"unsupported color mode: {colors}")
+    return palette, codes
+
+
+@lru_cache(maxsize=4)
+def get_lookup_table(colors):
+    """
+    Precomputes the nearest palette color of every color with LUT_BITS per channel
+    (uint8 array of shape 2^LUT_BITS x 2^LUT_BITS x 2^LUT_BITS with palette indices).
+    """
+    palette = np.array(get_palette(colors)[0], dtype=np.int32)
+    levels = 1 << LUT_BITS
+    step = 256 // levels
+    centers = np.arange(levels, dtype=np.int32) * step + step // 2
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 3)
+    table = np.empty(len(grid), dtype=np.uint8)
+    # chunked, s.t., the distance matrix stays small
+    for start in range(0, len(grid), 4096):
+        chunk = grid[start:start + 4096]
+        distances = ((chunk[:, np.newaxis, :] - palette[np.newaxis, :, :]) ** 2).sum(axis=2)
+        table[start:start + 4096] = distances.argmin(axis=1)
+    return table.reshape(levels, levels, levels)
+
+
+def map_colors(rgb, colors):
+    """
+    Maps the RGB colors (uint8 array of shape ... x 3) to palette indices using the lookup table.
+    """
+    reduced = rgb >> (8 - LUT_BITS)
+    return get_lookup_table(colors)[reduced[..., 0], reduced[..., 1], reduced[..., 2]]
+
+
+def get_sgr_parameters(color, is_background, colors, codes):
+    if color is None:
+        return "49" if is_background else "39"
+    if colors == COLORS_TRUECOLOR:
+        return ("48;2;%d;%d;%d" if is_background else "38;2;%d;%d;%d") % color
+    return codes[color][1 if is_background else 0]
+
+
+def write_ansi(grid, colors=COLORS_TRUECOLOR):
+    """
+    Serializes the grid as ANSI text with as few escape sequences as possible: an escape sequence is just written
+    where the color changes, and foreground and background changes are merged into one sequence.
+    The colors are written as 24-bit colors or downsampled to the 256 or 16 color palette of terminals.
+    """
+    codes = None
+    if colors != COLORS_TRUECOLOR:
+        # the colors are replaced by palette indices, s.t., cells mapped to the same palette color form one run
+        _, codes = get_palette(colors)
+        foreground = map_colors(grid.foreground, colors)
+        background = map_colors(grid.background, colors)
+        grid = type(grid)(grid.codes, np.zeros_like(grid.foreground), np.zeros_like(grid.background), grid.has_foreground, grid.has_background)
+        grid.foreground[:, :, 2] = foreground
+        grid.background[:, :, 2] = background
+
+    lines = []
+    for segments in grid.iter_segments():
+        line = []
+        current_foreground, current_background = None, None
+        for _, text, foreground, background in segments:
+            if colors != COLORS_TRUECOLOR:
+                foreground = foreground[2] if foreground is not None else None
+                background = background[2] if background is not None else None
+            parameters = []
+            if foreground != current_foreground:
+                parameters.append(get_sgr_parameters(foreground, False, colors, codes))
+            if background != current_background:
+                parameters.append(get_sgr_parameters(background, True, colors, codes))
+            if parameters:
+                line.append("\x1b[" + ";".join(parameters) + "m")
+            line.append(text)
+            current_foreground, current_background = foreground, background
+        # reset at the end of each line, s.t., the background color does not bleed into the line break
+        if current_foreground is not None or current_background is not None:
+            line.append(ANSI_RESET)
+        lines.append("".join(line))
+    return "\n".join(lines) + "\n"
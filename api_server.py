@@ -0,0 +1,498 @@
+"""
+HTTP API for converting images into ASCII art without the web UI, e.g.:
+
+    python -m api_server
+    curl -F image=@logo.png "http://localhost:8502/api/convert?approach=With%20colors%20(I)&width=80&format=txt"
+    curl -X POST "http://localhost:8502/api/convert?url=https://avatars.githubusercontent.com/u/120292474&format=png&mode=async"
+
+Conversions run in a bounded worker pool; if all workers are busy and the queue is full, requests are rejected
+with HTTP 429. Small jobs are answered synchronously, large jobs (or mode=async) return a job id that is polled
+at /api/jobs/<id> and whose result is fetched from /api/jobs/<id>/result.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+import tornado.httputil
+import tornado.ioloop
+import tornado.web
+from decouple import config
+from PIL import Image
+
+from approaches import APPROACHES, convert_approach, ascii_image_converter_with_colors
+from artifacts import Artifacts, create_producers, FORMAT_TEXT, FORMAT_HTML, FORMAT_SVG, FORMAT_PNG
+from ascii_engine import ENGINE_BUILTIN
+from conversion_cache import ConversionCache, hash_bytes
+from conversion_pool import ConversionPool
+from downloader import Downloader
+from image_context import ImageContext
+from image_ingestion import ingest_image, map_file
+from metrics import METRICS, PROMETHEUS_CONTENT_TYPE
+from png_renderer import DEFAULT_FONT_FILENAME
+from single_flight import SingleFlight
+
+UPLOAD_DIRECTORY = config('UPLOAD_DIRECTORY')
+CACHE_DIRECTORY = config('CACHE_DIRECTORY', default=UPLOAD_DIRECTORY + "/cache")
+CACHE_MAX_SIZE_MB = config('CACHE_MAX_SIZE_MB', default=512, cast=int)
+ASCII_ENGINE = config('ASCII_ENGINE', default=ENGINE_BUILTIN)
+PNG_FONT = config('PNG_FONT', default=DEFAULT_FONT_FILENAME)
+MAX_INPUT_PIXELS = config('MAX_INPUT_PIXELS', default=100_000_000, cast=int)
+MAX_INPUT_SIZE_MB = config('MAX_INPUT_SIZE_MB', default=50, cast=int)
+DOWNLOAD_CACHE_DIRECTORY = config('DOWNLOAD_CACHE_DIRECTORY', default=UPLOAD_DIRECTORY + "/downloads")
+DOWNLOAD_CACHE_MAX_AGE = config('DOWNLOAD_CACHE_MAX_AGE', default=300, cast=int)
+DOWNLOAD_TIMEOUT = config('DOWNLOAD_TIMEOUT', default=30, cast=int)
+DOWNLOAD_TOTAL_TIMEOUT = config('DOWNLOAD_TOTAL_TIMEOUT', default=60, cast=int)
+DOWNLOAD_CACHE_MAX_SIZE_MB = config('DOWNLOAD_CACHE_MAX_SIZE_MB', default=256, cast=int)
+API_PORT = config('API_PORT', default=8502, cast=int)
+API_WORKERS = config('API_WORKERS', default=0, cast=int) # 0: number of CPU cores
+API_QUEUE_SIZE = config('API_QUEUE_SIZE', default=16, cast=int) # jobs waiting for a worker, more are rejected with HTTP 429
+API_SYNC_MAX_WIDTH = config('API_SYNC_MAX_WIDTH', default=120, cast=int) # wider ASCII art (and PNG images) are converted asynchronously in mode "auto"
+API_JOB_TTL = config('API_JOB_TTL', default=600, cast=int) # seconds a finished job is kept
+
+MIN_WIDTH = 10
+MAX_WIDTH = 300
+MAX_OUTPUT_WIDTH = 4096
+DEFAULT_OUTPUT_WIDTH = 1024
+INGESTION_PIXELS_PER_CHARACTER = 4
+SPOOL_CHUNK_SIZE = 1024 * 1024
+IMAGE_CONTEXT_CACHE_ENTRIES = 16
+
+MODE_SYNC = "sync"
+MODE_ASYNC = "async"
+MODE_AUTO = "auto"
+
+MIME_TYPES = {
+    FORMAT_TEXT: "text/plain; charset=utf-8",
+    FORMAT_HTML: "text/html; charset=utf-8",
+    FORMAT_SVG: "image/svg+xml",
+    FORMAT_PNG: "image/png"
+}
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class ServiceSaturatedError(Exception):
+    """
+    Raised if all workers are busy and the queue is full.
+    """
+
+
+class InvalidImageError(ValueError):
+    """
+    Raised if the image cannot be ingested (unknown or truncated file, decompression bomb, budget exceeded).
+    """
+
+
+class Job:
+    def __init__(self, output_format):
+        self.id = uuid.uuid4().hex
+        self.output_format = output_format
+        self.status = JOB_QUEUED
+        self.filename = None  # a copy of the result kept for the TTL of the job
+        self.error = None
+        self.finished = None
+
+    def to_json(self):
+        return {"id": self.id, "status": self.status, "format": self.output_format, "error": self.error}
+
+
+class ConversionService:
+    """
+    Runs the conversions of the API in a bounded pool of worker threads, using the same conversion functions,
+    renderers and conversion cache as the web UI.
+    """
+
+    def __init__(self, working_directory, cache, downloader, workers=0, queue_size=16, job_ttl=600):
+        self.working_directory = working_directory
+        self.jobs_directory = os.path.join(working_directory, "jobs")
+        self.cache = cache
+        self.downloader = downloader
+        self.pool = ConversionPool(workers)
+        self.max_pending = self.pool.max_workers + queue_size
+        self.job_ttl = job_ttl
+        self.producers = create_producers(png_font=PNG_FONT, png_max_workers=1)
+        self._pending = 0
+        self._jobs = {}
+        self._image_contexts = OrderedDict()
+        self._single_flight = SingleFlight()
+        self._lock = threading.Lock()
+        # the files of the API are temporary (the results are kept in the conversion cache), leftovers of previous runs are removed
+        shutil.rmtree(self.working_directory, ignore_errors=True)
+        os.makedirs(self.jobs_directory, exist_ok=True)
+
+    def submit(self, job, image_filename, url, approach, width, output_format, output_width):
+        """
+        Queues the conversion of the uploaded image file (which is removed afterwards) or the image at the URL,
+        raises ServiceSaturatedError if the pool is saturated.
+        Returns the future of the result: the content of the requested format (synchronous requests)
+        or the filename of a copy of it that is kept for the TTL of the job.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ServiceSaturatedError(f"all {self.max_pending} conversion slots are in use")
+            self._pending += 1
+            expired_jobs = self._remove_expired_jobs()
+            if job is not None:
+                self._jobs[job.id] = job
+        for expired_job in expired_jobs:
+            self._remove_job_file(expired_job)
+
+        def run():
+            if job is not None:
+                job.status = JOB_RUNNING
+            try:
+                return self.convert_and_keep(job, image_filename, url, approach, width, output_format, output_width)
+            finally:
+                if image_filename is not None:
+                    os.remove(image_filename)
+
+        future = self.pool.submit(run)
+        future.add_done_callback(lambda future: self._finished(job, future))
+        return future
+
+    def convert_and_keep(self, job, image_filename, url, approach, width, output_format, output_width):
+        """
+        Converts the image and reads (or copies) the result before the conversion cache might evict it.
+        """
+        for attempt in range(2):
+            filename = self.convert(image_filename, url, approach, width, output_format, output_width)
+            try:
+                if job is None:
+                    with open(filename, "rb") as f:
+                        return f.read()
+                job_filename = os.path.join(self.jobs_directory, f"{job.id}.{output_format}")
+                shutil.copyfile(filename, job_filename)
+                return job_filename
+            except FileNotFoundError:
+                # evicted in the meantime, converted again
+                if attempt > 0:
+                    raise
+
+    def _finished(self, job, future):
+        with self._lock:
+            self._pending -= 1
+        if job is None:
+            return
+        if future.exception() is not None:
+            job.status = JOB_FAILED
+            job.error = str(future.exception())
+        else:
+            job.status = JOB_DONE
+            job.filename = future.result()
+        job.finished = time.time()
+
+    def _remove_expired_jobs(self):
+        now = time.time()
+        expired_jobs = [job for job in self._jobs.values() if job.finished is not None and now - job.finished > self.job_ttl]
+        for job in expired_jobs:
+            del self._jobs[job.id]
+        return expired_jobs
+
+    @staticmethod
+    def _remove_job_file(job):
+        if job.filename is not None:
+            try:
+                os.remove(job.filename)
+            except FileNotFoundError:
+                pass
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_image_context(self, image_hash, data):
+        """
+        Returns the decoded image, the least recently used ones are dropped (and released as soon as no conversion uses them).
+        Concurrent requests of the same new image wait for one ingestion.
+        """
+        with self._lock:
+            if image_hash in self._image_contexts:
+                self._image_contexts.move_to_end(image_hash)
+                return self._image_contexts[image_hash]
+        context = self._single_flight.do(("ingest", image_hash), self.ingest, data)
+        with self._lock:
+            self._image_contexts[image_hash] = context
+            while len(self._image_contexts) > IMAGE_CONTEXT_CACHE_ENTRIES:
+                self._image_contexts.popitem(last=False)
+        return context
+
+    def ingest(self, data):
+        """
+        Decodes the image into memory, the working copy written by the ingestion is removed right away.
+        Raises InvalidImageError if the image cannot be ingested.
+        """
+        with tempfile.TemporaryDirectory(dir=self.working_directory) as directory:
+            working_filename = os.path.join(directory, "input.png")
+            try:
+                ingest_image(data, working_filename, max_width=MAX_WIDTH * INGESTION_PIXELS_PER_CHARACTER,
+                             max_pixels=MAX_INPUT_PIXELS, max_bytes=MAX_INPUT_SIZE_MB * 1024 * 1024)
+                with Image.open(working_filename) as image:
+                    image.load()
+                    return ImageContext(image=image.copy())
+            except (ValueError, OSError, EOFError, Image.DecompressionBombError) as e:
+                raise InvalidImageError(f"the image could not be read: {e}") from e
+
+    def convert(self, image_filename, url, approach, width, output_format, output_width):
+        """
+        Converts the image (given by its file or URL) and returns the filename of the requested format in the conversion cache.
+        """
+        # memory-mapped, the image is not loaded as a whole (uncompressed images are read strip by strip by the ingestion)
+        mapped_image = map_file(image_filename) if image_filename is not None else self.downloader.fetch_mapped(url)
+        with mapped_image as data:
+            image_hash = hash_bytes(data)
+            options = {"output_width": output_width} if output_format == FORMAT_PNG else {}
+            cache_key = lambda output_format, output_width=None: self.cache.key(image_hash, approach, width, output_format, output_width)
+
+            filename = self.cache.get(cache_key(output_format, **options), output_format)
+            if filename is not None:
+                return filename
+
+            context = self.get_image_context(image_hash, data)
+        # concurrent requests of other formats of the same ASCII art wait for one conversion
+        grid = self._single_flight.do((image_hash, approach, width), convert_approach, approach, context, width, engine=ASCII_ENGINE)
+        # the produced files are copied into the conversion cache, the originals are removed afterwards
+        with tempfile.TemporaryDirectory(dir=self.working_directory) as directory:
+            base_filename = os.path.join(directory, f"{APPROACHES[approach]['download_filename']}_width_{width}")
+            artifacts = Artifacts(grid, base_filename, self.producers, cache=self.cache, cache_key=cache_key)
+            return artifacts.get(output_format, **options)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def write_error(self, status_code, **kwargs):
+        message = self._reason
+        if "exc_info" in kwargs and isinstance(kwargs["exc_info"][1], tornado.web.HTTPError) and kwargs["exc_info"][1].log_message:
+            message = kwargs["exc_info"][1].log_message
+        if status_code == 429:
+            # set here, as the headers are cleared before the error is written
+            self.set_header("Retry-After", "1")
+        self.finish({"error": message})
+
+    async def send_data(self, data, output_format):
+        self.set_header("Content-Type", MIME_TYPES[output_format])
+        self.write(data)
+        await self.finish()
+
+
+def find_multipart_parts(body, boundary):
+    """
+    Returns the (headers, start, end) of each part of the multipart/form-data body (bytes or memory map) without copying the contents.
+    """
+    parts = []
+    delimiter = b"--" + boundary
+    position = body.find(delimiter)
+    while position != -1:
+        headers_start = position + len(delimiter)
+        if body[headers_start:headers_start + 2] == b"--":
+            # the closing delimiter
+            break
+        headers_end = body.find(b"\r\n\r\n", headers_start)
+        end = body.find(b"\r\n" + delimiter, headers_end)
+        if headers_end == -1 or end == -1:
+            raise tornado.web.HTTPError(400, "invalid multipart/form-data body")
+        headers = tornado.httputil.HTTPHeaders.parse(body[headers_start:headers_end].decode("utf-8").strip())
+        parts.append((headers, headers_end + 4, end))
+        position = end + 2
+    return parts
+
+
+@tornado.web.stream_request_body
+class ConvertHandler(BaseHandler):
+    """
+    POST /api/convert with an image file (multipart form field "image") or an URL (argument "url").
+    Arguments: approach, width, format (txt, html, svg, png), output_width (PNG only), mode (sync, async, auto).
+    The request body is spooled to a temporary file, the uploaded image is not kept in memory.
+    """
+
+    def prepare(self):
+        self.body_file = tempfile.TemporaryFile(dir=self.service.working_directory)
+
+    def data_received(self, chunk):
+        self.body_file.write(chunk)
+
+    def on_finish(self):
+        self.body_file.close()
+
+    def on_connection_close(self):
+        self.body_file.close()
+
+    def spool_uploaded_image(self):
+        """
+        Parses the arguments of the request body and copies the uploaded image (if any) into a file of its own.
+        Returns the filename of the image or None.
+        """
+        self.body_file.flush()
+        content_type = self.request.headers.get("Content-Type", "")
+        body_size = self.body_file.tell()
+        if not content_type.startswith("multipart/form-data"):
+            # e.g., url=... as form-urlencoded body
+            self.body_file.seek(0)
+            body = self.body_file.read() if content_type.startswith("application/x-www-form-urlencoded") else b""
+            tornado.httputil.parse_body_arguments(content_type, body, self.request.body_arguments, self.request.files, self.request.headers)
+            self.merge_body_arguments()
+            return None
+
+        match = re.search(r'boundary="?([^";]+)"?', content_type)
+        if match is None or body_size == 0:
+            raise tornado.web.HTTPError(400, "invalid multipart/form-data body")
+        image_filename = None
+        with mmap.mmap(self.body_file.fileno(), 0, access=mmap.ACCESS_READ) as body:
+            for headers, start, end in find_multipart_parts(body, match.group(1).encode("latin-1")):
+                disposition = dict(re.findall(r'(\w+)="([^"]*)"', headers.get("Content-Disposition", "")))
+                if "filename" not in disposition:
+                    self.request.body_arguments.setdefault(disposition.get("name", ""), []).append(body[start:end])
+                elif disposition.get("name") == "image" and image_filename is None:
+                    file_descriptor, image_filename = tempfile.mkstemp(prefix=".upload-", dir=self.service.working_directory)
+                    with os.fdopen(file_descriptor, "wb") as f:
+                        for position in range(start, end, SPOOL_CHUNK_SIZE):
+                            f.write(body[position:min(end, position + SPOOL_CHUNK_SIZE)])
+        self.merge_body_arguments()
+        return image_filename
+
+    def merge_body_arguments(self):
+        for name, values in self.request.body_arguments.items():
+            self.request.arguments.setdefault(name, []).extend(values)
+
+    def get_int_argument(self, name, default, minimum, maximum):
+        try:
+            value = int(self.get_argument(name, str(default)))
+        except ValueError:
+            raise tornado.web.HTTPError(400, f"{name} must be an integer")
+        if not minimum <= value <= maximum:
+            raise tornado.web.HTTPError(400, f"{name} must be between {minimum} and {maximum}")
+        return value
+
+    def submit(self, image_filename):
+        """
+        Validates the arguments and queues the conversion, returns the job (None if synchronous), the future and the format.
+        """
+        approach = self.get_argument("approach", ascii_image_converter_with_colors)
+        if approach not in APPROACHES:
+            raise tornado.web.HTTPError(400, f"unknown approach: {approach}")
+        output_format = self.get_argument("format", FORMAT_TEXT)
+        if output_format not in MIME_TYPES:
+            raise tornado.web.HTTPError(400, f"unknown format: {output_format}")
+        width = self.get_int_argument("width", 60, MIN_WIDTH, MAX_WIDTH)
+        output_width = self.get_int_argument("output_width", DEFAULT_OUTPUT_WIDTH, 1, MAX_OUTPUT_WIDTH)
+        mode = self.get_argument("mode", MODE_AUTO)
+        if mode not in (MODE_SYNC, MODE_ASYNC, MODE_AUTO):
+            raise tornado.web.HTTPError(400, f"unknown mode: {mode}")
+        if mode == MODE_AUTO:
+            mode = MODE_ASYNC if output_format == FORMAT_PNG or width > API_SYNC_MAX_WIDTH else MODE_SYNC
+
+        url = None
+        if image_filename is None:
+            url = self.get_argument("url", None)
+            if not url:
+                raise tornado.web.HTTPError(400, "either an image file or an URL is required")
+
+        job = Job(output_format) if mode == MODE_ASYNC else None
+        try:
+            future = self.service.submit(job, image_filename, url, approach, width, output_format, output_width)
+        except ServiceSaturatedError as e:
+            raise tornado.web.HTTPError(429, str(e))
+        return job, future, output_format
+
+    async def post(self):
+        image_filename = self.spool_uploaded_image()
+        try:
+            job, future, output_format = self.submit(image_filename)
+        except Exception:
+            # not queued, the uploaded image is not needed anymore
+            if image_filename is not None:
+                os.remove(image_filename)
+            raise
+
+        if job is not None:
+            self.set_status(202)
+            self.set_header("Location", f"/api/jobs/{job.id}")
+            await self.finish(job.to_json())
+            return
+
+        try:
+            data = await asyncio.wrap_future(future)
+        except ValueError as e:
+            # including InvalidImageError and the budget errors of the downloader
+            raise tornado.web.HTTPError(400, str(e))
+        except requests.RequestException as e:
+            raise tornado.web.HTTPError(502, f"the image could not be downloaded: {e}")
+        await self.send_data(data, output_format)
+
+
+class JobHandler(BaseHandler):
+    def get(self, job_id):
+        job = self.service.get_job(job_id)
+        if job is None:
+            raise tornado.web.HTTPError(404, "unknown job")
+        self.finish(job.to_json())
+
+
+class JobResultHandler(BaseHandler):
+    async def get(self, job_id):
+        job = self.service.get_job(job_id)
+        if job is None:
+            raise tornado.web.HTTPError(404, "unknown job")
+        if job.status == JOB_FAILED:
+            raise tornado.web.HTTPError(422, job.error)
+        if job.status != JOB_DONE:
+            raise tornado.web.HTTPError(409, f"the job is {job.status}")
+        try:
+            with open(job.filename, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise tornado.web.HTTPError(410, "the result of the job is not available anymore")
+        await self.send_data(data, job.output_format)
+
+
+class ApproachesHandler(BaseHandler):
+    def get(self):
+        self.finish({approach: {"color": settings["color"], "description": settings["description"]} for approach, settings in APPROACHES.items()})
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.finish(METRICS.to_prometheus())
+
+
+def create_application(service):
+    arguments = {"service": service}
+    return tornado.web.Application([
+        (r"/api/convert", ConvertHandler, arguments),
+        (r"/api/jobs/([0-9a-f]+)", JobHandler, arguments),
+        (r"/api/jobs/([0-9a-f]+)/result", JobResultHandler, arguments),
+        (r"/api/approaches", ApproachesHandler, arguments),
+        (r"/metrics", MetricsHandler),
+    ])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    cache = ConversionCache(CACHE_DIRECTORY, CACHE_MAX_SIZE_MB * 1024 * 1024)
+    downloader = Downloader(DOWNLOAD_CACHE_DIRECTORY, read_timeout=DOWNLOAD_TIMEOUT, total_timeout=DOWNLOAD_TOTAL_TIMEOUT, max_bytes=MAX_INPUT_SIZE_MB * 1024 * 1024,
+                            max_pixels=MAX_INPUT_PIXELS, max_age=DOWNLOAD_CACHE_MAX_AGE, max_cache_bytes=DOWNLOAD_CACHE_MAX_SIZE_MB * 1024 * 1024)
+    service = ConversionService(os.path.join(UPLOAD_DIRECTORY, "api"), cache, downloader,
+                                workers=API_WORKERS, queue_size=API_QUEUE_SIZE, job_ttl=API_JOB_TTL)
+    application = create_application(service)
+    # the request body contains the uploaded image (plus the multipart overhead)
+    application.listen(API_PORT, max_body_size=MAX_INPUT_SIZE_MB * 1024 * 1024 + 64 * 1024)
+    logging.info(f"API listening on port {API_PORT}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
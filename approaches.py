@@ -0,0 +1,129 @@
+import logging
+
+from ascii_engine import convert_with_parameters, ENGINE_BUILTIN
+from cell_grid import CellGrid
+from image_context import ImageContext
+from metrics import METRICS
+
+ascii_image_converter_with_colors = "With colors (I)"
+ascii_image_converter_with_colors_complex = "With colors (II)"
+ascii_magic_with_colors = "With colors (III)"
+
+ascii_image_converter_with_background_colors = "With background (I)"
+ascii_image_converter_with_background_colors_complex = "With background (II)"
+ascii_image_converter_only_background_color = "Only background"
+
+ascii_image_converter_neutral = "No colors (I)"
+ascii_image_converter_neutral_complex = "No colors (II)"
+ascii_magic_neutral = "No colors (III)"
+
+# the available approaches; each one is either converted using ascii-image-converter parameters,
+# using ascii_magic, or derived from the ASCII art of another approach
+APPROACHES = {
+    ascii_image_converter_with_colors: {
+        "color": True,
+        "description": "ascii-image-converter: with simple, colored ASCII characters",
+        "download_filename": "ascii-image-with-colors",
+        "parameters": ["--color"]
+    },
+    ascii_image_converter_with_colors_complex: {
+        "color": True,
+        "description": "ascii-image-converter: with complex, colored ASCII characters",
+        "download_filename": "ascii-image-with-colors-complex",
+        "parameters": ["--color", "--complex"]
+    },
+    ascii_magic_with_colors: {
+        "color": True,
+        "description": "ascii_magic: with simple, colored ASCII characters",
+        "download_filename": "ascii-image-with-colors-ascii-magic",
+        "ascii_magic_monochrome": False
+    },
+
+    ascii_image_converter_with_background_colors: {
+        "color": True,
+        "description": "ascii-image-converter: with simple, one-colored ASCII characters and background colors",
+        "download_filename": "ascii-image-with-colors-color-bg",
+        "parameters": ["--color", "--color-bg"]
+    },
+    ascii_image_converter_with_background_colors_complex: {
+        "color": True,
+        "description": "ascii-image-converter: with complex, one-colored ASCII characters and background colors",
+        "download_filename": "ascii-image-with-colors-colorbg-complex",
+        "parameters": ["--color", "--color-bg", "--complex"]
+    },
+    ascii_image_converter_only_background_color: {
+        "color": True,
+        "description": "ascii-image-converter: with background colors only (each character is a whitespace)",
+        "download_filename": "ascii-image-with-colors-colorbg-only-background",
+        "derived_from": ascii_image_converter_with_background_colors
+    },
+
+    ascii_image_converter_neutral: {
+        "color": False,
+        "description": "ascii-image-converter: with simple, one-color ASCII characters",
+        "download_filename": "ascii-image-no-colors",
+        "parameters": []
+    },
+    ascii_image_converter_neutral_complex: {
+        "color": False,
+        "description": "ascii-image-converter: with complex, one-color ASCII characters",
+        "download_filename": "ascii-image-no-colors-complex",
+        "parameters": ["--complex"]
+    },
+    ascii_magic_neutral: {
+        "color": False,
+        "description": "ascii_magic: with simple, one-color ASCII characters",
+        "download_filename": "ascii-image-no-colors-ascii-magic",
+        "ascii_magic_monochrome": True
+    }
+}
+
+
+def convert_with_ascii_magic(image, width, monochrome):
+    """
+    Converts the (already decoded) Pillow image using ascii_magic.
+    """
+    # imported on first use, as the ascii_magic approaches might be deactivated
+    from ascii_magic import AsciiArt
+
+    with METRICS.span("ascii_magic") as span:
+        art = AsciiArt.from_pillow_image(image)
+        ascii_art = art.to_ascii(columns=width, monochrome=monochrome)
+        span.output_bytes = len(ascii_art.encode("utf-8"))
+    return CellGrid.from_ansi(ascii_art, columns=width)
+
+
+def convert_approach(approach, image, width, engine=ENGINE_BUILTIN, get_grid=None):
+    """
+    Converts the input image to ASCII art using the given approach.
+    Returns the ASCII art as CellGrid (or None if the approach is not implemented).
+
+    image: the ImageContext of the input image (decoded once and shared by all approaches and widths) or its filename
+    get_grid: function (approach) -> CellGrid returning the ASCII art of another approach of the same image and width,
+              used by derived approaches (by default, it is converted again)
+    """
+    settings = APPROACHES.get(approach)
+    if settings is None:
+        return None
+
+    if not isinstance(image, ImageContext):
+        with ImageContext(image) as context:
+            return convert_approach(approach, context, width, engine=engine, get_grid=get_grid)
+
+    if "derived_from" in settings:
+        if get_grid is None:
+            grid = convert_approach(settings["derived_from"], image, width, engine=engine)
+        else:
+            grid = get_grid(settings["derived_from"])
+        # the background colors only, each character is a whitespace
+        return grid.without_characters()
+
+    if "ascii_magic_monochrome" in settings:
+        return convert_with_ascii_magic(image.image, width, monochrome=settings["ascii_magic_monochrome"])
+
+    parameters = settings["parameters"] + ["--width", str(width)]
+    logging.info(f"convert {image.image_filename} using {engine} with parameters: " + " ".join(parameters))
+    # the built-in engine uses the cell statistics, the external binary a working copy downscaled for the width
+    if engine == ENGINE_BUILTIN:
+        return convert_with_parameters(image.statistics, image.image_filename, parameters, engine=engine)
+    return convert_with_parameters(None, image.get_working_filename(width), parameters, engine=engine)
@@ -0,0 +1,112 @@
+import logging
+import threading
+
+from ansi_writer import write_ansi, COLORS_TRUECOLOR
+from html_renderer import write_html
+from png_renderer import render_png, DEFAULT_FONT_FILENAME
+from svg_renderer import write_svg
+
+FORMAT_TEXT = "txt"
+FORMAT_HTML = "html"
+FORMAT_SVG = "svg"
+FORMAT_PNG = "png"
+
+
+def write_text(artifacts, filename, ansi_colors=COLORS_TRUECOLOR):
+    """
+    Writes the text file with minimal escape sequences (only where the color changes) using the given colors.
+    """
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(write_ansi(artifacts.grid, ansi_colors))
+    return filename
+
+
+def create_producers(ansi_colors=COLORS_TRUECOLOR, png_font=DEFAULT_FONT_FILENAME, png_max_workers=None):
+    """
+    Returns producers of all formats that are created directly from the grid (PNG images are rendered by Pillow).
+    The text file is written with minimal escape sequences using the given colors.
+    """
+    def produce_text(artifacts, filename):
+        return write_text(artifacts, filename, ansi_colors)
+
+    def produce_svg(artifacts, filename):
+        return write_svg(artifacts.grid, filename, title=f"{artifacts.grid.columns}x{artifacts.grid.rows} ASCII art")
+
+    def produce_png(artifacts, filename, output_width):
+        return render_png(artifacts.grid, filename, output_width, font_filename=png_font, max_workers=png_max_workers)
+
+    return {
+        FORMAT_TEXT: produce_text,
+        FORMAT_HTML: lambda artifacts, filename: write_html(artifacts.ascii_art, filename),
+        FORMAT_SVG: produce_svg,
+        FORMAT_PNG: produce_png
+    }
+
+
+class Artifacts:
+    """
+    The downloadable formats (plain text, HTML, SVG, PNG) of one generated ASCII art (a CellGrid).
+
+    Nothing is produced up front: a format is created when it is requested for the first
+    time (for a preview or a download) and memoized afterwards. If a conversion cache and
+    a cache_key function are given, the produced files are also shared across reruns and sessions.
+    A producer is a function (artifacts, filename, **options) returning the created filename or None;
+    it might request other formats of the same artifacts (e.g., the PNG image might be created from the SVG image).
+    """
+
+    def __init__(self, grid, base_filename, producers, cache=None, cache_key=None):
+        self.grid = grid
+        self.base_filename = base_filename
+        self.producers = {FORMAT_TEXT: write_text}
+        self.producers.update(producers)
+        self.cache = cache
+        self.cache_key = cache_key
+        self._filenames = {}
+        self._lock = threading.RLock()
+
+    @property
+    def ascii_art(self):
+        return self.grid.to_ansi()
+
+    def get_filename(self, output_format, **options):
+        suffix = "".join(f"_{name}-{value}" for name, value in sorted(options.items()))
+        return f"{self.base_filename}{suffix}.{output_format}"
+
+    def get(self, output_format, **options):
+        """
+        Returns the filename of the requested format, produces it if it was not requested before.
+        """
+        memo_key = (output_format, tuple(sorted(options.items())))
+        with self._lock:
+            if memo_key in self._filenames:
+                return self._filenames[memo_key]
+
+            producer = self.producers[output_format]
+            filename = self.get_filename(output_format, **options)
+            if self.cache is not None and self.cache_key is not None:
+                # produced once, even if other artifacts of the same image request it concurrently
+                filename = self.cache.get_or_create(self.cache_key(output_format, **options), output_format,
+                                                    lambda: producer(self, filename, **options))
+            else:
+                filename = producer(self, filename, **options)
+            logging.info(f"{output_format} artifact: {filename}")
+            self._filenames[memo_key] = filename
+            return filename
+
+    def read(self, output_format, **options):
+        """
+        Returns the content of the requested format (or None if it could not be produced).
+        A cached file that was evicted in the meantime is produced again.
+        """
+        for attempt in range(2):
+            filename = self.get(output_format, **options)
+            if filename is None:
+                return None
+            try:
+                with open(filename, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                if self.cache is None or attempt > 0:
+                    raise
+                with self._lock:
+                    self._filenames.pop((output_format, tuple(sorted(options.items()))), None)
@@ -0,0 +1,139 @@
+import logging
+import shutil
+import subprocess
+
+import numpy as np
+from PIL import Image
+
+from cell_grid import CellGrid
+from cell_statistics import CellStatistics
+from metrics import METRICS
+
+# the character ramps of ascii-image-converter (from dark to bright)
+ASCII_CHARACTERS_SIMPLE = " .:-=+*#%@"
+ASCII_CHARACTERS_COMPLEX = " .'`^\",:;Il!i><~+_-?][}{1)(|\\/tfjrxnuvczXYUJCLQ0OZmwqpdbkhao*#MW&8%B@$"
+
+# terminal characters are about twice as high as wide
+CHARACTER_ASPECT_RATIO = 0.5
+
+ENGINE_BUILTIN = "builtin"
+ENGINE_EXTERNAL = "ascii-image-converter"
+
+
+def parse_parameters(parameters):
+    """
+    Translates the command line parameters of ascii-image-converter into the options of the built-in engine.
+    """
+    options = {"width": None, "color": False, "color_bg": False, "complex": False}
+    i = 0
+    while i < len(parameters):
+        parameter = parameters[i]
+        if parameter == "--width":
+            options["width"] = int(parameters[i + 1])
+            i += 1
+        elif parameter == "--color":
+            options["color"] = True
+        elif parameter == "--color-bg":
+            options["color_bg"] = True
+        elif parameter == "--complex":
+            options["complex"] = True
+        else:
+            raise ValueError(f"parameter not supported by the built-in engine: {parameter}")
+        i += 1
+    return options
+
+
+def load_rgb_array(image):
+    """
+    Returns the image (a Pillow image or a filename) as RGB uint8 array.
+    Transparent pixels are composed onto black, as done by ascii-image-converter.
+    """
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as opened_image:
+            opened_image.load()
+            image = opened_image.copy()
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = np.asarray(image.convert("RGBA"), dtype=np.uint16)
+        return (rgba[:, :, :3] * rgba[:, :, 3:4] // 255).astype(np.uint8)
+    return np.asarray(image.convert("RGB"), dtype=np.uint8)
+
+
+def get_ascii_height(image_width, image_height, width):
+    return max(1, int(width * image_height / image_width * CHARACTER_ASPECT_RATIO))
+
+
+def get_luminance(cells):
+    # the same integer weights as Go's color.GrayModel used by ascii-image-converter
+    cells = cells.astype(np.uint32)
+    return ((19595 * cells[:, :, 0] + 38470 * cells[:, :, 1] + 7471 * cells[:, :, 2] + 32768) >> 16).astype(np.uint8)
+
+
+def get_character_indices(luminance, characters):
+    return (luminance.astype(np.uint32) * (len(characters) - 1) // 255).astype(np.intp)
+
+
+def get_cell_statistics(image):
+    """
+    Returns the cell statistics of the image (a Pillow image, an RGB array, a filename or already computed CellStatistics).
+    """
+    if isinstance(image, CellStatistics):
+        return image
+    with METRICS.span("cell_statistics"):
+        return CellStatistics(image if isinstance(image, np.ndarray) else load_rgb_array(image))
+
+
+def convert_image_to_grid(image, width, color=False, color_bg=False, complex=False):
+    """
+    Converts the image (a Pillow image, an RGB array, a filename or its CellStatistics) into a CellGrid.
+    The output matches the one of ascii-image-converter for the supported options,
+    except that each character cell is the area average of its pixels.
+    """
+    statistics = get_cell_statistics(image)
+    height = get_ascii_height(statistics.width, statistics.height, width)
+    cells = statistics.cell_averages(width, height)
+
+    ramp = ASCII_CHARACTERS_COMPLEX if complex else ASCII_CHARACTERS_SIMPLE
+    ramp_codes = np.frombuffer(ramp.encode("utf-32-le"), dtype=np.uint32)
+    codes = ramp_codes[get_character_indices(get_luminance(cells), ramp)]
+    colored = np.full(codes.shape, color or color_bg, dtype=bool)
+    if color_bg:
+        return CellGrid(codes, background=cells, has_background=colored)
+    return CellGrid(codes, foreground=cells, has_foreground=colored)
+
+
+def convert_image_to_ascii(image, width, color=False, color_bg=False, complex=False):
+    """
+    Converts the image into ASCII art text (see convert_image_to_grid).
+    """
+    return convert_image_to_grid(image, width, color=color, color_bg=color_bg, complex=complex).to_ansi()
+
+
+def convert_with_ascii_image_converter(image_filename, parameters):
+    """
+    Runs the external ascii-image-converter binary and returns its output as CellGrid.
+    """
+    command = ["ascii-image-converter"] + parameters + [image_filename]
+    logging.info("execute: " + " ".join(command))
+    with METRICS.span("convert_external", subprocess=True) as span:
+        result = subprocess.run(command, capture_output=True, check=True)
+        span.output_bytes = len(result.stdout)
+        return CellGrid.from_ansi(result.stdout.decode("utf-8"))
+
+
+def convert_with_parameters(image, image_filename, parameters, engine=ENGINE_BUILTIN):
+    """
+    Converts the image using ascii-image-converter style parameters (e.g., ["--color", "--width", "60"])
+    and returns a CellGrid.
+    The built-in engine is used by default; the external ascii-image-converter binary is used
+    if it is explicitly requested or as fallback if the built-in engine does not support the parameters.
+    """
+    if engine == ENGINE_BUILTIN:
+        try:
+            options = parse_parameters(parameters)
+            with METRICS.span("convert_builtin"):
+                return convert_image_to_grid(image if image is not None else image_filename, **options)
+        except ValueError as e:
+            if shutil.which(ENGINE_EXTERNAL) is None:
+                raise
+            logging.warning(f"built-in engine failed ({e}), falling back to {ENGINE_EXTERNAL}")
+    return convert_with_ascii_image_converter(image_filename, parameters)
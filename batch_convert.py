@@ -0,0 +1,214 @@
+"""
+Converts whole directories of images into ASCII art without the web UI, e.g.:
+
+    python -m batch_convert images/ "more/*.jpg" --output-directory banners --width 60 100 --format txt svg
+
+The outputs of an image are written to <output directory>/<image path without extension>/, an image is skipped
+if it was already converted with the same content hash and settings (see the manifest.json file of each image).
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ansi_writer import COLORS_TRUECOLOR, COLORS_256, COLORS_16
+from approaches import APPROACHES, convert_approach
+from artifacts import Artifacts, create_producers, FORMAT_TEXT, FORMAT_HTML, FORMAT_SVG, FORMAT_PNG
+from ascii_engine import ENGINE_BUILTIN, ENGINE_EXTERNAL
+from conversion_cache import hash_bytes
+from image_context import ImageContext
+from image_ingestion import ingest_image, map_file, DEFAULT_MAX_PIXELS, DEFAULT_MAX_BYTES
+from png_renderer import DEFAULT_FONT_FILENAME
+
+ALLOWED_EXTENSIONS = ["jpg", "jpeg", "png", "bmp", "webp", "gif", "tiff"]
+FORMATS = [FORMAT_TEXT, FORMAT_HTML, FORMAT_SVG, FORMAT_PNG]
+MANIFEST_FILENAME = "manifest.json"
+# images are decoded with a few pixels per character of the widest ASCII art (as done by the web UI)
+INGESTION_PIXELS_PER_CHARACTER = 4
+
+
+def get_glob_base(pattern):
+    """
+    Returns the directory of the glob pattern before its first wildcard (e.g., "photos" for "photos/**/*.png").
+    """
+    parts = os.path.normpath(pattern).split(os.sep)
+    static_parts = []
+    for part in parts:
+        if glob.has_magic(part):
+            break
+        static_parts.append(part)
+    # a pattern without wildcards is just a filename
+    base = os.sep.join(static_parts if len(static_parts) < len(parts) else static_parts[:-1])
+    return base or os.curdir
+
+
+def find_images(inputs):
+    """
+    Returns (input filename, output name) pairs of all images in the given directories (recursively) and glob patterns.
+    The output name is the path of the image relative to the given directory (or to the directory of the glob pattern)
+    without extension. Images whose output names would collide (e.g., a.png and a.jpg) keep their extension,
+    remaining collisions (e.g., the same relative path in two inputs) get a numbered suffix.
+    """
+    images = {}
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for directory, _, filenames in os.walk(input_path):
+                for filename in filenames:
+                    full_filename = os.path.join(directory, filename)
+                    images.setdefault(os.path.abspath(full_filename), (full_filename, os.path.relpath(full_filename, input_path)))
+        else:
+            base = get_glob_base(input_path)
+            for filename in glob.glob(input_path, recursive=True):
+                if os.path.isfile(filename):
+                    images.setdefault(os.path.abspath(filename), (filename, os.path.relpath(filename, base)))
+    images = sorted(
+        (filename, name) for filename, name in images.values()
+        if os.path.splitext(filename)[1][1:].lower() in ALLOWED_EXTENSIONS
+    )
+
+    stems = [os.path.splitext(name)[0] for _, name in images]
+    names = [stem if stems.count(stem) == 1 else name for stem, (_, name) in zip(stems, images)]
+    unique_names = []
+    for name in names:
+        unique_name, suffix = name, 1
+        while unique_name in unique_names:
+            suffix += 1
+            unique_name = f"{name}_{suffix}"
+        unique_names.append(unique_name)
+    return [(filename, name) for (filename, _), name in zip(images, unique_names)]
+
+
+def read_manifest(manifest_filename):
+    try:
+        with open(manifest_filename, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def convert_image(input_filename, output_directory, settings, force=False):
+    """
+    Converts one image using all selected approaches, widths and formats (executed in a worker process).
+    Returns the list of created files or None if the image was skipped.
+    """
+    with map_file(input_filename) as data:
+        return convert_mapped_image(data, input_filename, output_directory, settings, force)
+
+
+def convert_mapped_image(data, input_filename, output_directory, settings, force):
+    image_hash = hash_bytes(data)
+
+    manifest_filename = os.path.join(output_directory, MANIFEST_FILENAME)
+    manifest = read_manifest(manifest_filename)
+    if not force and manifest is not None and manifest.get("hash") == image_hash and manifest.get("settings") == settings \
+            and all(os.path.isfile(os.path.join(output_directory, filename)) for filename in manifest.get("files", [])):
+        logging.info(f"skip {input_filename}, it was already converted")
+        return None
+
+    os.makedirs(output_directory, exist_ok=True)
+    # a file of its own per conversion, s.t., concurrent or interrupted runs do not share the working copy
+    file_descriptor, working_filename = tempfile.mkstemp(prefix=".input-", suffix=".png", dir=output_directory)
+    os.close(file_descriptor)
+    try:
+        ingest_image(data, working_filename,
+                     max_width=max(settings["widths"]) * INGESTION_PIXELS_PER_CHARACTER,
+                     max_pixels=settings["max_pixels"], max_bytes=settings["max_bytes"])
+        # decoded once for all approaches and widths, released after the image was converted
+        with ImageContext(working_filename) as context:
+            # one thread per process, as the images are already converted in parallel
+            producers = create_producers(ansi_colors=settings["ansi_colors"], png_font=settings["font"], png_max_workers=1)
+            files = []
+            for width in settings["widths"]:
+                grids = {}
+
+                def get_grid(approach):
+                    if approach not in grids:
+                        grids[approach] = convert_approach(approach, context, width, engine=settings["engine"], get_grid=get_grid)
+                    return grids[approach]
+
+                for approach in settings["approaches"]:
+                    base_filename = os.path.join(output_directory, f"{APPROACHES[approach]['download_filename']}_width_{width}")
+                    artifacts = Artifacts(get_grid(approach), base_filename, producers)
+                    for output_format in settings["formats"]:
+                        if output_format == FORMAT_PNG:
+                            filename = artifacts.get(output_format, output_width=settings["png_width"])
+                        else:
+                            filename = artifacts.get(output_format)
+                        files.append(os.path.relpath(filename, output_directory))
+    finally:
+        os.remove(working_filename)
+
+    with open(manifest_filename, "w") as f:
+        json.dump({"input": input_filename, "hash": image_hash, "settings": settings, "files": files}, f, indent=4)
+    return files
+
+
+def initialize_worker():
+    logging.basicConfig(level=logging.INFO)
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(prog="python -m batch_convert", description="Converts images into ASCII art without the web UI.")
+    parser.add_argument("inputs", nargs="+", help="directories (searched recursively) or glob patterns of image files")
+    parser.add_argument("--output-directory", "-o", required=True, help="the directory where the ASCII art files are written to")
+    parser.add_argument("--approach", "-a", action="append", choices=list(APPROACHES.keys()), help="the approaches to use (can be repeated, default: all)")
+    parser.add_argument("--width", "-w", nargs="+", type=int, default=[60], help="the numbers of characters per line (default: 60)")
+    parser.add_argument("--format", "-f", nargs="+", choices=FORMATS, default=[FORMAT_TEXT, FORMAT_SVG], help="the output formats (default: txt svg)")
+    parser.add_argument("--png-width", type=int, default=1024, help="the width of PNG images in pixels (default: 1024)")
+    parser.add_argument("--png-font", default=DEFAULT_FONT_FILENAME, help="the TrueType font of PNG images")
+    parser.add_argument("--ansi-colors", choices=[COLORS_TRUECOLOR, COLORS_256, COLORS_16], default=COLORS_TRUECOLOR, help="the colors of the text files (default: truecolor)")
+    parser.add_argument("--engine", choices=[ENGINE_BUILTIN, ENGINE_EXTERNAL], default=ENGINE_BUILTIN, help="the ASCII art engine (default: builtin)")
+    parser.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS, help="images with more pixels are rejected")
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES, help="image files with more bytes are rejected")
+    parser.add_argument("--workers", "-j", type=int, default=None, help="the number of worker processes (default: number of CPU cores)")
+    parser.add_argument("--force", action="store_true", help="convert all images, even if they were already converted")
+    return parser
+
+
+def main(argv=None):
+    args = get_argument_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    settings = {
+        "approaches": args.approach or list(APPROACHES.keys()),
+        "widths": args.width,
+        "formats": args.format,
+        "png_width": args.png_width,
+        "font": args.png_font,
+        "ansi_colors": args.ansi_colors,
+        "engine": args.engine,
+        "max_pixels": args.max_pixels,
+        "max_bytes": args.max_bytes
+    }
+    images = find_images(args.inputs)
+    logging.info(f"found {len(images)} images")
+
+    converted, skipped, failed = 0, 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=initialize_worker) as executor:
+        futures = {
+            executor.submit(convert_image, input_filename, os.path.join(args.output_directory, name), settings, args.force): input_filename
+            for input_filename, name in images
+        }
+        for future in as_completed(futures):
+            try:
+                files = future.result()
+            except Exception as e:
+                logging.error(f"ERROR: conversion of {futures[future]} failed: {e}")
+                failed += 1
+                continue
+            if files is None:
+                skipped += 1
+            else:
+                logging.info(f"converted {futures[future]} into {len(files)} files")
+                converted += 1
+
+    logging.info(f"converted: {converted}, skipped: {skipped}, failed: {failed}")
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""
+Stage-level benchmark of the conversion and rendering pipeline (runs locally, no network required):
+
+    python benchmarks/pipeline_benchmark.py --baseline benchmarks/baseline.json
+    python benchmarks/pipeline_benchmark.py --save-baseline benchmarks/baseline.json
+
+Synthetic input images of several sizes and formats are generated, each is processed like in the web UI
+(ingestion, decoding and cell statistics, every approach at every width, text/HTML/SVG/PNG output). The time (median of
+the repetitions) and the peak memory of each stage are reported. The peak memory is the resident set size (RSS, including
+the allocations of Pillow and other C code) the stage adds on top of its inputs, each stage is run once more in a fresh
+subprocess to measure it (on Linux, the peak is reset right before the stage; elsewhere, the growth of the peak is used).
+If a baseline is given, stages that became slower or need more memory than the tolerance allows are reported as
+regressions and the exit code is 1.
+
+The baseline stores the durations relative to a fixed calibration workload measured in the same run (the medium JPEG
+converted at width 150 and rendered as SVG and PNG), s.t., it can be compared on other machines, and the peak RSS in MB.
+The relative durations still depend on the CPU and the library versions, so record a baseline on your machine (with
+--save-baseline, before the change) if the committed one reports regressions for unchanged code.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ansi_writer import write_ansi  # noqa: E402
+from approaches import APPROACHES, convert_approach  # noqa: E402
+from cell_grid import CellGrid  # noqa: E402
+from html_renderer import write_html  # noqa: E402
+from image_context import ImageContext  # noqa: E402
+from image_ingestion import ingest_image  # noqa: E402
+from metrics import get_peak_rss_bytes  # noqa: E402
+from png_renderer import render_png  # noqa: E402
+from svg_renderer import write_svg  # noqa: E402
+
+# name: (width, height, format)
+INPUTS = {
+    "small-png": (256, 256, "PNG"),
+    "medium-jpeg": (1600, 1200, "JPEG"),
+    "large-tiff": (4000, 3000, "TIFF"),
+    "large-jpeg": (6000, 4000, "JPEG")
+}
+WIDTHS = [10, 60, 150, 300]
+STAGES = ["ingest", "statistics", "convert", "parse", "ansi", "html", "svg", "png", "inkscape"]
+# the same as the web UI: images are decoded with 4 pixels per character of the widest ASCII art
+INGESTION_MAX_WIDTH = 300 * 4
+PNG_OUTPUT_WIDTH = 1024
+# the workload the durations of the baseline are relative to
+CALIBRATION_INPUT = "medium-jpeg"
+CALIBRATION_APPROACH = "With colors (I)"
+CALIBRATION_WIDTH = 150
+
+
+def create_input_image(filename, width, height, image_format):
+    """
+    Creates a deterministic synthetic image: color gradients, some shapes and noise.
+    """
+    rng = np.random.default_rng(42)
+    y, x = np.mgrid[0:height, 0:width]
+    rgb = np.empty((height, width, 3), dtype=np.float32)
+    rgb[:, :, 0] = 255 * x / width
+    rgb[:, :, 1] = 255 * y / height
+    rgb[:, :, 2] = 127 + 127 * np.sin(x / width * 12) * np.cos(y / height * 8)
+    circle = (x - width / 2) ** 2 + (y - height / 2) ** 2 < (min(width, height) / 3) ** 2
+    rgb[circle] = 255 - rgb[circle]
+    rgb += rng.normal(0, 12, rgb.shape)
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), "RGB").save(filename, image_format)
+
+
+def create_image_context(filename):
+    context = ImageContext(filename)
+    # computed up front, as done by the first conversion of the web UI
+    context.statistics
+    return context
+
+
+def measure(function, repeat):
+    """
+    Returns the median duration (seconds) of the repetitions and the result.
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), result
+
+
+def convert_with_inkscape(svg_filename, png_filename, output_width):
+    subprocess.run(["inkscape", "--export-filename", png_filename, "-w", str(output_width), svg_filename], check=True, capture_output=True)
+    return png_filename
+
+
+def read_grid(filename, width):
+    with open(filename, "r", encoding="utf-8") as f:
+        return CellGrid.from_ansi(f.read(), columns=width)
+
+
+def prepare_stage(spec):
+    """
+    Loads the inputs of the stage described by spec (in the subprocess measuring its memory) and returns the stage as function.
+    """
+    stage = spec["stage"]
+    if stage == "ingest":
+        with open(spec["input"], "rb") as f:
+            data = f.read()
+        return lambda: ingest_image(data, spec["output"], max_width=INGESTION_MAX_WIDTH)
+    if stage == "statistics":
+        return lambda: create_image_context(spec["working"])
+    if stage == "convert":
+        context = create_image_context(spec["working"])
+        base_grids = {approach: read_grid(filename, spec["width"]) for approach, filename in spec["base_grids"].items()}
+        return lambda: convert_approach(spec["approach"], context, spec["width"], get_grid=base_grids.get)
+    if stage == "inkscape":
+        return lambda: convert_with_inkscape(spec["svg"], spec["output"], PNG_OUTPUT_WIDTH)
+    with open(spec["grid"], "r", encoding="utf-8") as f:
+        ascii_art = f.read()
+    grid = CellGrid.from_ansi(ascii_art, columns=spec["width"])
+    return {
+        "parse": lambda: CellGrid.from_ansi(ascii_art, columns=spec["width"]),
+        "ansi": lambda: write_ansi(grid),
+        "html": lambda: write_html(ascii_art, spec["output"]),
+        "svg": lambda: write_svg(grid, spec["output"]),
+        "png": lambda: render_png(grid, spec["output"], PNG_OUTPUT_WIDTH)
+    }[stage]
+
+
+def get_rss_bytes():
+    """
+    Returns the current and the peak RSS (bytes) of this process.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        # VmHWM is reset by reset_peak_rss(), unlike ru_maxrss (which includes the RSS of the parent process at fork)
+        return int(status["VmRSS"].split()[0]) * 1024, int(status["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError):
+        # no procfs: the peak so far is the best estimate of the current RSS
+        return get_peak_rss_bytes(), get_peak_rss_bytes()
+
+
+def reset_peak_rss():
+    try:
+        # resets the high-water mark of the RSS (Linux 4.0+), s.t., the peak of the inputs is not included
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def measure_peak_rss(spec):
+    """
+    Runs the stage once (in a fresh process) and returns the peak RSS (bytes) it added on top of its inputs.
+    """
+    function = prepare_stage(spec)
+    if spec["stage"] == "inkscape":
+        function()
+        # the peak RSS of the Inkscape process
+        return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    before, _ = get_rss_bytes()
+    reset_peak_rss()
+    function()
+    _, peak = get_rss_bytes()
+    return max(0, peak - before)
+
+
+def measure_peak_rss_in_new_process(spec):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)])
+    return int(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def measure_calibration(directory, repeat):
+    """
+    Returns the median duration (seconds) of the calibration workload: ingestion, conversion and SVG and PNG output.
+    """
+    image_width, image_height, image_format = INPUTS[CALIBRATION_INPUT]
+    input_filename = os.path.join(directory, f"calibration.{image_format.lower()}")
+    working_filename = os.path.join(directory, "calibration_working.png")
+    create_input_image(input_filename, image_width, image_height, image_format)
+    with open(input_filename, "rb") as f:
+        data = f.read()
+
+    def run():
+        ingest_image(data, working_filename, max_width=INGESTION_MAX_WIDTH)
+        with create_image_context(working_filename) as context:
+            grid = convert_approach(CALIBRATION_APPROACH, context, CALIBRATION_WIDTH)
+        write_svg(grid, os.path.join(directory, "calibration.svg"))
+        render_png(grid, os.path.join(directory, "calibration.png"), PNG_OUTPUT_WIDTH)
+
+    # at least 5 repetitions, all durations of the run are divided by it
+    duration, _ = measure(run, max(repeat, 5))
+    print(f"calibration {duration * 1000:.1f} ms", flush=True)
+    return duration
+
+
+def run_benchmarks(inputs, widths, approaches, stages, repeat, directory, memory=True):
+    results = {}
+
+    def record(stage, input_name, width, approach, function, memory_spec):
+        duration, result = measure(function, repeat)
+        peak = measure_peak_rss_in_new_process(dict(memory_spec, stage=stage, width=width)) if memory else None
+        key = "|".join([stage, input_name, str(width or "-"), approach or "-"])
+        results[key] = {"seconds": duration, "peak_rss_bytes": peak}
+        peak_text = f"{peak / 2 ** 20:9.1f} MB" if peak is not None else ""
+        print(f"{stage:<10} {input_name:<12} {str(width or '-'):>5} {approach or '-':<22} {duration * 1000:10.1f} ms {peak_text}", flush=True)
+        return result
+
+    inkscape_available = shutil.which("inkscape") is not None
+    if "inkscape" in stages and not inkscape_available:
+        print("inkscape is not installed, the inkscape stage is skipped")
+
+    for input_name in inputs:
+        image_width, image_height, image_format = INPUTS[input_name]
+        input_filename = os.path.join(directory, f"{input_name}.{image_format.lower()}")
+        create_input_image(input_filename, image_width, image_height, image_format)
+        with open(input_filename, "rb") as f:
+            data = f.read()
+
+        working_filename = os.path.join(directory, f"{input_name}_working.png")
+        ingest = lambda: ingest_image(data, working_filename, max_width=INGESTION_MAX_WIDTH)
+        if "ingest" in stages:
+            record("ingest", input_name, None, None, ingest,
+                   {"input": input_filename, "output": os.path.join(directory, f"{input_name}_memory.png")})
+        else:
+            ingest()
+
+        create_context = lambda: create_image_context(working_filename)
+        if "statistics" in stages:
+            context = record("statistics", input_name, None, None, create_context, {"working": working_filename})
+        else:
+            context = create_context()
+
+        for width in widths:
+            grids = {}
+            # the grids are passed to the subprocesses measuring the memory as text files
+            grid_filenames = {}
+
+            def get_grid(approach):
+                if approach not in grids:
+                    grids[approach] = convert_approach(approach, context, width)
+                return grids[approach]
+
+            def write_grid(approach):
+                grid_filenames[approach] = os.path.join(directory, f"{input_name}_{APPROACHES[approach]['download_filename']}_{width}_grid.txt")
+                with open(grid_filenames[approach], "w", encoding="utf-8") as f:
+                    f.write(grids[approach].to_ansi())
+
+            for approach in approaches:
+                base_grids = {}
+                if "derived_from" in APPROACHES[approach]:
+                    # just the derivation is measured, not the conversion of the base approach
+                    base_approach = APPROACHES[approach]["derived_from"]
+                    get_grid(base_approach)
+                    if base_approach not in grid_filenames:
+                        write_grid(base_approach)
+                    base_grids[base_approach] = grid_filenames[base_approach]
+                convert = lambda: convert_approach(approach, context, width, get_grid=get_grid)
+                if "convert" in stages:
+                    grid = record("convert", input_name, width, approach, convert,
+                                  {"working": working_filename, "approach": approach, "base_grids": base_grids})
+                else:
+                    grid = convert()
+                grids[approach] = grid
+                write_grid(approach)
+
+                ascii_art = grid.to_ansi()
+                base_filename = os.path.join(directory, f"{input_name}_{APPROACHES[approach]['download_filename']}_{width}")
+                grid_spec = {"grid": grid_filenames[approach]}
+                if "parse" in stages:
+                    record("parse", input_name, width, approach, lambda: CellGrid.from_ansi(ascii_art, columns=width), grid_spec)
+                if "ansi" in stages:
+                    record("ansi", input_name, width, approach, lambda: write_ansi(grid), grid_spec)
+                if "html" in stages:
+                    record("html", input_name, width, approach, lambda: write_html(ascii_art, base_filename + ".html"),
+                           dict(grid_spec, output=base_filename + "_memory.html"))
+                if "svg" in stages or "inkscape" in stages:
+                    write = lambda: write_svg(grid, base_filename + ".svg")
+                    if "svg" in stages:
+                        record("svg", input_name, width, approach, write, dict(grid_spec, output=base_filename + "_memory.svg"))
+                    else:
+                        write()
+                if "png" in stages:
+                    record("png", input_name, width, approach, lambda: render_png(grid, base_filename + ".png", PNG_OUTPUT_WIDTH),
+                           dict(grid_spec, output=base_filename + "_memory.png"))
+                if "inkscape" in stages and inkscape_available:
+                    record("inkscape", input_name, width, approach, lambda: convert_with_inkscape(base_filename + ".svg", base_filename + "_inkscape.png", PNG_OUTPUT_WIDTH),
+                           {"svg": base_filename + ".svg", "output": base_filename + "_inkscape_memory.png"})
+    return results
+
+
+def create_baseline(results, calibration_seconds):
+    """
+    Returns the baseline of the results: the durations relative to the calibration workload and the peak RSS in MB.
+    """
+    stages = {}
+    for key, result in results.items():
+        stages[key] = {"relative_seconds": float(f"{result['seconds'] / calibration_seconds:.3g}")}
+        if result["peak_rss_bytes"] is not None:
+            stages[key]["peak_rss_mb"] = round(result["peak_rss_bytes"] / 2 ** 20, 1)
+    return {"calibration_seconds": round(calibration_seconds, 4), "stages": stages}
+
+
+def write_baseline(filename, baseline):
+    # one stage per line, s.t., changes of the baseline are readable in diffs
+    lines = [f"        {json.dumps(key)}: {json.dumps(stage, sort_keys=True)}" for key, stage in sorted(baseline["stages"].items())]
+    with open(filename, "w") as f:
+        f.write(f'{{\n    "calibration_seconds": {json.dumps(baseline["calibration_seconds"])},\n    "stages": {{\n')
+        f.write(",\n".join(lines))
+        f.write("\n    }\n}\n")
+
+
+def compare_with_baseline(results, baseline, calibration_seconds, tolerance, minimum_seconds, minimum_bytes):
+    """
+    Returns the keys of the stages that are slower or need more memory than baseline * tolerance, each key once
+    (very short stages and small allocations are ignored, as they are noisy).
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline["stages"]:
+            continue
+        stage = baseline["stages"][key]
+        reasons = []
+        # the duration the baseline expects on this machine
+        before, after = stage["relative_seconds"] * calibration_seconds, result["seconds"]
+        if after > minimum_seconds and after > before * tolerance:
+            reasons.append(f"{before * 1000:.1f} ms -> {after * 1000:.1f} ms ({after / before:.2f}x)")
+        before, after = stage.get("peak_rss_mb"), result["peak_rss_bytes"]
+        if before is not None and after is not None and after > minimum_bytes and after > before * 2 ** 20 * tolerance:
+            reasons.append(f"{before:.1f} MB -> {after / 2 ** 20:.1f} MB peak RSS")
+        if reasons:
+            regressions.append(key)
+            print(f"REGRESSION {key}: {', '.join(reasons)}")
+    return regressions
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks each stage of the conversion and rendering pipeline.")
+    parser.add_argument("--inputs", nargs="+", choices=list(INPUTS.keys()), default=list(INPUTS.keys()))
+    parser.add_argument("--widths", nargs="+", type=int, default=WIDTHS)
+    parser.add_argument("--approaches", nargs="+", choices=list(APPROACHES.keys()), default=list(APPROACHES.keys()))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed repetitions of each stage (default: 3)")
+    parser.add_argument("--output", help="writes the results (absolute durations and peak RSS in bytes) as JSON file")
+    parser.add_argument("--save-baseline", help="writes the results as new baseline JSON file (durations relative to the calibration workload)")
+    parser.add_argument("--baseline", help="compares the results with the given baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown factor compared to the baseline (default: 1.25)")
+    parser.add_argument("--minimum-ms", type=float, default=5, help="stages faster than this are not compared (default: 5 ms)")
+    parser.add_argument("--minimum-mb", type=float, default=16, help="stages needing less memory are not compared (default: 16 MB)")
+    parser.add_argument("--no-memory", action="store_true", help="skips the memory measurement (one subprocess per stage, it dominates the runtime)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = get_argument_parser().parse_args(argv)
+    if args.child:
+        print(measure_peak_rss(json.loads(args.child)))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="ascii-art-benchmark-") as directory:
+        calibration_seconds = measure_calibration(directory, args.repeat)
+        results = run_benchmarks(args.inputs, args.widths, args.approaches, args.stages, args.repeat, directory, memory=not args.no_memory)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"calibration_seconds": calibration_seconds, "results": results}, f, indent=4, sort_keys=True)
+    if args.save_baseline:
+        write_baseline(args.save_baseline, create_baseline(results, calibration_seconds))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare_with_baseline(results, baseline, calibration_seconds, args.tolerance, args.minimum_ms / 1000, args.minimum_mb * 2 ** 20):
+            return 1
+        print("no regressions compared to the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
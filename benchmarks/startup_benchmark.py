@@ -0,0 +1,92 @@
+"""
+Benchmark of the fixed overhead of the web UI (runs locally, no browser or network required):
+
+    python benchmarks/startup_benchmark.py
+
+The cold start is the first run of the Streamlit script in a new process (including all imports),
+an idle rerun is a further run without a selected image (e.g., after a widget click). Each cold start
+is measured in a separate process; the median and maximum of all runs are reported.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_FILENAME = os.path.join(REPOSITORY_DIRECTORY, "image-to-ascii-art-converter-web-ui.py")
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+
+def measure_runs(reruns):
+    """
+    Runs the script once (cold start) and reruns it the given number of times, returns the durations in seconds.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(SCRIPT_FILENAME, default_timeout=120)
+    durations = []
+    for _ in range(reruns + 1):
+        start = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(f"the script failed: {app.exception[0].value}")
+    return {"cold_start": durations[0], "reruns": durations[1:]}
+
+
+def run_in_new_process(reruns, environment):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", "--reruns", str(reruns)],
+        cwd=REPOSITORY_DIRECTORY, env=environment, stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks the cold start and idle reruns of the web UI.")
+    parser.add_argument("--processes", type=int, default=5, help="number of cold starts, each in a new process (default: 5)")
+    parser.add_argument("--reruns", type=int, default=20, help="number of idle reruns per process (default: 20)")
+    parser.add_argument("--output", help="writes the results as JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = get_argument_parser().parse_args(argv)
+    if args.child:
+        print(json.dumps(measure_runs(args.reruns)))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="ascii-art-startup-") as directory:
+        environment = dict(os.environ)
+        environment.setdefault("UPLOAD_DIRECTORY", directory)
+        # the benchmark must not change the index.html file of the installed Streamlit package
+        environment["REPLACE_INDEX_HTML_CONTENT"] = "False"
+        environment["METRICS_PORT"] = "0"
+        runs = [run_in_new_process(args.reruns, environment) for _ in range(args.processes)]
+
+    cold_starts = [run["cold_start"] for run in runs]
+    reruns = [duration for run in runs for duration in run["reruns"]]
+    results = {
+        "cold_start_median_seconds": statistics.median(cold_starts),
+        "cold_start_max_seconds": max(cold_starts),
+        "rerun_median_seconds": statistics.median(reruns) if reruns else None,
+        "rerun_max_seconds": max(reruns) if reruns else None
+    }
+    for name, value in results.items():
+        if value is not None:
+            print(f"{name:<28} {value * 1000:10.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import re
+
+import numpy as np
+
+ANSI_RESET = "\x1b[0m"
+
+# the "One Dark" terminal theme (used for the 16 and 256 color escape codes)
+ANSI_PALETTE = [
+    (0x3f, 0x44, 0x51), (0xe0, 0x55, 0x61), (0x8c, 0xc2, 0x65), (0xd1, 0x8f, 0x52),
+    (0x4a, 0xa5, 0xf0), (0xc1, 0x62, 0xde), (0x42, 0xb3, 0xc2), (0xe6, 0xe6, 0xe6),
+    (0x4f, 0x56, 0x66), (0xff, 0x61, 0x6e), (0xa5, 0xe0, 0x75), (0xf0, 0xa4, 0x5d),
+    (0x4d, 0xc4, 0xff), (0xde, 0x73, 0xff), (0x4c, 0xd1, 0xe0), (0xff, 0xff, 0xff)
+]
+
+ANSI_ESCAPE_SEQUENCE = re.compile(r"\x1b\[([0-9;]*)m")
+# one 24-bit colored character per escape sequence, as written by ascii-image-converter and the built-in engine
+ANSI_TRUECOLOR_CELL = re.compile(r"\x1b\[(38|48);2;(\d{1,3});(\d{1,3});(\d{1,3})m([^\x1b\n])\x1b\[0m")
+
+
+def get_256_color(index):
+    """
+    Returns the RGB color of the given xterm 256-color index.
+    """
+    if index < 16:
+        return ANSI_PALETTE[index]
+    if index < 232:
+        index -= 16
+        levels = [0, 95, 135, 175, 215, 255]
+        return levels[index // 36], levels[(index // 6) % 6], levels[index % 6]
+    gray = 8 + (index - 232) * 10
+    return gray, gray, gray
+
+
+def apply_sgr_parameters(parameters, foreground, background):
+    """
+    Applies the parameters of one SGR escape sequence to the current foreground and background colors.
+    Colors are RGB tuples, None represents the default color.
+    """
+    codes = [int(code) if code else 0 for code in parameters.split(";")] if parameters else [0]
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        if code == 0:
+            foreground, background = None, None
+        elif code in (38, 48) and i + 1 < len(codes):
+            if codes[i + 1] == 2 and i + 4 < len(codes):
+                color = tuple(codes[i + 2:i + 5])
+                i += 4
+            elif codes[i + 1] == 5 and i + 2 < len(codes):
+                color = get_256_color(codes[i + 2])
+                i += 2
+            else:
+                color = None
+                i += 1
+            if code == 38:
+                foreground = color
+            else:
+                background = color
+        elif code == 39:
+            foreground = None
+        elif code == 49:
+            background = None
+        elif 30 <= code <= 37:
+            foreground = ANSI_PALETTE[code - 30]
+        elif 90 <= code <= 97:
+            foreground = ANSI_PALETTE[code - 90 + 8]
+        elif 40 <= code <= 47:
+            background = ANSI_PALETTE[code - 40]
+        elif 100 <= code <= 107:
+            background = ANSI_PALETTE[code - 100 + 8]
+        i += 1
+    return foreground, background
+
+
+class CellGrid:
+    """
+    The canonical in-memory representation of an ASCII art shared by all renderers and transformations.
+
+    codes: character code points (uint32, rows x columns)
+    foreground, background: RGB colors (uint8, rows x columns x 3)
+    has_foreground, has_background: False where the default color of the medium is used (bool, rows x columns)
+
+    If the grid was parsed from ANSI text, the text is kept, s.t., it is never serialized again.
+    """
+
+    def __init__(self, codes, foreground=None, background=None, has_foreground=None, has_background=None, text=None):
+        rows, columns = codes.shape
+        self.codes = codes
+        self.foreground = foreground if foreground is not None else np.zeros((rows, columns, 3), dtype=np.uint8)
+        self.background = background if background is not None else np.zeros((rows, columns, 3), dtype=np.uint8)
+        self.has_foreground = has_foreground if has_foreground is not None else np.zeros((rows, columns), dtype=bool)
+        self.has_background = has_background if has_background is not None else np.zeros((rows, columns), dtype=bool)
+        self.text = text
+        self._color_runs = None
+
+    @property
+    def rows(self):
+        return self.codes.shape[0]
+
+    @property
+    def columns(self):
+        return self.codes.shape[1]
+
+    @classmethod
+    def from_ansi(cls, text, columns=None):
+        """
+        Parses ANSI colored text into a grid. The common format of one 24-bit color escape sequence
+        per character is parsed in a vectorized way, any other text is tokenized sequentially.
+        """
+        lines = text.rstrip("\n").split("\n")
+        grid = cls._from_truecolor_cells(lines, columns)
+        if grid is None:
+            grid = cls._from_escape_sequences(lines, columns)
+        grid.text = text
+        return grid
+
+    @classmethod
+    def _from_truecolor_cells(cls, lines, columns):
+        cells = []
+        for line in lines:
+            line_cells = ANSI_TRUECOLOR_CELL.findall(line)
+            # the matched cells have to cover the complete line
+            if not line_cells or ANSI_TRUECOLOR_CELL.sub("", line) != "":
+                return None
+            cells.append(line_cells)
+        rows = len(cells)
+        if columns is None:
+            columns = len(cells[0])
+        if any(len(line_cells) != columns for line_cells in cells):
+            return None
+
+        cells = np.array(cells)  # rows x columns x (kind, r, g, b, character)
+        kinds = cells[:, :, 0]
+        if not (kinds == kinds[0, 0]).all():
+            return None
+        codes = np.frombuffer("".join(cells[:, :, 4].ravel().tolist()).encode("utf-32-le"), dtype=np.uint32).reshape(rows, columns)
+        colors = cells[:, :, 1:4].astype(np.uint8)
+        if kinds[0, 0] == "38":
+            return cls(codes, foreground=colors, has_foreground=np.ones((rows, columns), dtype=bool))
+        return cls(codes, background=colors, has_background=np.ones((rows, columns), dtype=bool))
+
+    @classmethod
+    def _from_escape_sequences(cls, lines, columns):
+        parsed_lines = []
+        foreground, background = None, None
+        for line in lines:
+            segments = []
+            position = 0
+            for match in ANSI_ESCAPE_SEQUENCE.finditer(line):
+                if match.start() > position:
+                    segments.append((line[position:match.start()], foreground, background))
+                foreground, background = apply_sgr_parameters(match.group(1), foreground, background)
+                position = match.end()
+            if position < len(line):
+                segments.append((line[position:], foreground, background))
+            parsed_lines.append(segments)
+
+        if columns is None:
+            columns = max([sum(len(text) for text, _, _ in segments) for segments in parsed_lines] + [1])
+        grid = cls(np.full((len(parsed_lines), columns), ord(" "), dtype=np.uint32))
+        for row, segments in enumerate(parsed_lines):
+            column = 0
+            for text, foreground, background in segments:
+                end = min(column + len(text), columns)
+                if end > column:
+                    grid.codes[row, column:end] = np.frombuffer(text[:end - column].encode("utf-32-le"), dtype=np.uint32)
+                    if foreground is not None:
+                        grid.foreground[row, column:end] = foreground
+                        grid.has_foreground[row, column:end] = True
+                    if background is not None:
+                        grid.background[row, column:end] = background
+                        grid.has_background[row, column:end] = True
+                column += len(text)
+        return grid
+
+    def get_lines(self):
+        return ["".join(map(chr, row)) for row in self.codes.tolist()]
+
+    def to_ansi(self):
+        """
+        Serializes the grid as ANSI text: every colored character is written with its own
+        24-bit escape sequence followed by a reset (as done by ascii-image-converter).
+        """
+        if self.text is not None:
+            return self.text
+        if not self.has_foreground.any() and not self.has_background.any():
+            self.text = "".join(line + "\n" for line in self.get_lines())
+            return self.text
+
+        lines = []
+        for characters, fg, bg, has_fg, has_bg in zip(self.get_lines(), self.foreground.tolist(), self.background.tolist(),
+                                                      self.has_foreground.tolist(), self.has_background.tolist()):
+            cells = []
+            for character, (fr, fg_, fb), (br, bg_, bb), with_fg, with_bg in zip(characters, fg, bg, has_fg, has_bg):
+                if with_fg and with_bg:
+                    cells.append(f"\x1b[38;2;{fr};{fg_};{fb}m\x1b[48;2;{br};{bg_};{bb}m{character}{ANSI_RESET}")
+                elif with_fg:
+                    cells.append(f"\x1b[38;2;{fr};{fg_};{fb}m{character}{ANSI_RESET}")
+                elif with_bg:
+                    cells.append(f"\x1b[48;2;{br};{bg_};{bb}m{character}{ANSI_RESET}")
+                else:
+                    cells.append(character)
+            lines.append("".join(cells))
+        self.text = "\n".join(lines) + "\n"
+        return self.text
+
+    def without_characters(self):
+        """
+        Returns a new grid with the same colors where every character is blank (e.g., to show just the background colors).
+        The colors and their runs are shared with this grid, not copied.
+        """
+        grid = CellGrid(np.full(self.codes.shape, ord(" "), dtype=np.uint32), self.foreground, self.background, self.has_foreground, self.has_background)
+        grid._color_runs = self._color_runs
+        return grid
+
+    def get_color_runs(self):
+        """
+        Returns the (start, end, foreground, background) runs of each row, consecutive cells with equal colors are merged;
+        colors are RGB tuples or None. The runs are computed once per grid.
+        """
+        if self._color_runs is None:
+            # pack the colors of each cell into one integer, s.t., run boundaries are found by comparing neighbours
+            foreground = self.foreground.astype(np.int64)
+            background = self.background.astype(np.int64)
+            keys = np.where(self.has_foreground, (1 << 24) | (foreground[:, :, 0] << 16) | (foreground[:, :, 1] << 8) | foreground[:, :, 2], 0) << 25
+            keys |= np.where(self.has_background, (1 << 24) | (background[:, :, 0] << 16) | (background[:, :, 1] << 8) | background[:, :, 2], 0)
+            boundaries = keys[:, 1:] != keys[:, :-1]
+
+            self._color_runs = []
+            for row_keys, row_boundaries in zip(keys.tolist(), boundaries):
+                starts = [0] + (np.flatnonzero(row_boundaries) + 1).tolist()
+                ends = starts[1:] + [self.columns]
+                self._color_runs.append([
+                    (start, end, self._unpack_color(row_keys[start] >> 25), self._unpack_color(row_keys[start]))
+                    for start, end in zip(starts, ends)
+                ])
+        return self._color_runs
+
+    @staticmethod
+    def _unpack_color(key):
+        if not key & (1 << 24):
+            return None
+        return (key >> 16) & 0xff, (key >> 8) & 0xff, key & 0xff
+
+    def iter_segments(self):
+        """
+        Yields the (column, text, foreground, background) segments of each row; colors are RGB tuples or None.
+        """
+        for characters, runs in zip(self.get_lines(), self.get_color_runs()):
+            yield [(start, characters[start:end], foreground, background) for start, end, foreground, background in runs]
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class CellStatistics:
+    """
+    Summed-area tables (integral images) of the RGB channels of one image.
+
+    They are computed once per image. Afterwards, the average color of the character cells
+    of any ASCII art width is derived in one vectorized pass without touching the pixels again.
+    """
+
+    def __init__(self, rgb):
+        height, width, _ = rgb.shape
+        self.width = width
+        self.height = height
+        # uint32 is sufficient as long as the sum of a channel over the whole image fits into it
+        dtype = np.uint32 if 255 * width * height < 2 ** 32 else np.uint64
+        self.sums = np.zeros((height + 1, width + 1, 3), dtype=dtype)
+        np.cumsum(rgb, axis=0, dtype=dtype, out=self.sums[1:, 1:])
+        np.cumsum(self.sums[1:, 1:], axis=1, dtype=dtype, out=self.sums[1:, 1:])
+
+    @property
+    def nbytes(self):
+        return self.sums.nbytes
+
+    @staticmethod
+    def get_edges(size, cells):
+        """
+        Returns the start and end pixel of each cell, every cell covers at least one pixel.
+        """
+        starts = np.arange(cells, dtype=np.int64) * size // cells
+        ends = np.maximum(starts + 1, np.arange(1, cells + 1, dtype=np.int64) * size // cells)
+        return np.minimum(starts, size - 1), np.minimum(ends, size)
+
+    def cell_averages(self, columns, rows):
+        """
+        Returns the average RGB color of each cell of a grid with the given number of columns and rows
+        (uint8 array of shape rows x columns x 3).
+        """
+        x0, x1 = self.get_edges(self.width, columns)
+        y0, y1 = self.get_edges(self.height, rows)
+        y0, y1 = y0[:, np.newaxis], y1[:, np.newaxis]
+        # unsigned arithmetic wraps around, but the result of the inclusion-exclusion is always in range
+        sums = (self.sums[y1, x1] - self.sums[y0, x1] - self.sums[y1, x0] + self.sums[y0, x0]).astype(np.int64)
+        areas = ((y1 - y0) * (x1 - x0))[:, :, np.newaxis]
+        return ((sums + areas // 2) // areas).astype(np.uint8)
@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from metrics import METRICS
+from single_flight import SingleFlight
+
+
+def hash_file(filename, chunk_size=1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of the content of the given file.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ConversionCache:
+    """
+    On-disk, content-addressed cache for the generated ASCII art artifacts.
+
+    An entry is addressed by the hash of the source image bytes, the approach,
+    the number of characters per line, the output format and (for PNG images) the
+    output width. Hence, the same image at the same settings is converted only once,
+    independent of the Streamlit session, rerun or working directory asking for it.
+    The cache is limited to max_bytes; the least recently used entries are evicted first.
+    The entries and their sizes are tracked in memory, the directory is walked only at startup.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        os.makedirs(self.directory, exist_ok=True)
+        # path -> size in bytes, the least recently used entry first
+        self._entries = OrderedDict((path, size) for _, size, path in sorted(self._scan()))
+        self._size = sum(self._entries.values())
+
+    @staticmethod
+    def key(image_hash, approach, width, output_format, output_width=None):
+        parts = [image_hash, approach, str(width), output_format]
+        if output_width is not None:
+            parts.append(str(output_width))
+        return hash_bytes("\x00".join(parts).encode("utf-8"))
+
+    def _path(self, key, output_format):
+        return os.path.join(self.directory, key[:2], key + "." + output_format)
+
+    def get(self, key, output_format):
+        """
+        Returns the filename of the cached artifact or None if it is not cached (yet).
+        The file can be evicted by a concurrent put, callers treat a vanished file as a miss (see read()).
+        """
+        path = self._path(key, output_format)
+        with self._lock:
+            if path not in self._entries and os.path.isfile(path):
+                # written by another process sharing the directory
+                self._add_entry_locked(path)
+            if path in self._entries:
+                try:
+                    # the modification time is used as the "last used" time of the LRU eviction after a restart
+                    os.utime(path)
+                except FileNotFoundError:
+                    self._remove_entry(path)
+                else:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    METRICS.record_cache("conversion_cache", True)
+                    return path
+            self.misses += 1
+            METRICS.record_cache("conversion_cache", False)
+            return None
+
+    def read(self, key, output_format):
+        """
+        Returns the content of the cached artifact or None if it is not cached (or was evicted in the meantime).
+        """
+        path = self.get(key, output_format)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_text(self, key, output_format="txt"):
+        data = self.read(key, output_format)
+        return data.decode("utf-8") if data is not None else None
+
+    def put_file(self, key, output_format, src_filename):
+        """
+        Copies the given file into the cache and returns the filename of the cached copy.
+        """
+        path = self._path(key, output_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".%s.tmp" % threading.get_ident()
+        shutil.copyfile(src_filename, tmp_path)
+        os.replace(tmp_path, path)  # atomic, concurrent writers of the same entry produce the same content
+        self._add_entry(path)
+        return path
+
+    def get_or_create(self, key, output_format, create):
+        """
+        Returns the filename of the cached artifact. If it is not cached, create() is called to produce it
+        (returning a filename or None) and the result is cached. Concurrent requests of the same missing entry
+        wait for the one running create() instead of producing it again.
+        """
+        path = self.get(key, output_format)
+        if path is not None:
+            return path
+        return self._single_flight.do((key, output_format), self._create, key, output_format, create)
+
+    def _create(self, key, output_format, create):
+        path = self._path(key, output_format)
+        with self._lock:
+            if path in self._entries:
+                # created by a request that finished in the meantime
+                return path
+        filename = create()
+        if filename is None:
+            return None
+        return self.put_file(key, output_format, filename)
+
+    def put_text(self, key, text, output_format="txt"):
+        path = self._path(key, output_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".%s.tmp" % threading.get_ident()
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        self._add_entry(path)
+        return path
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _add_entry(self, path):
+        with self._lock:
+            self._add_entry_locked(path)
+
+    def _add_entry_locked(self, path):
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        self._remove_entry(path)
+        self._entries[path] = size
+        self._size += size
+        self._evict()
+
+    def _remove_entry(self, path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._size -= size
+
+    def size(self):
+        with self._lock:
+            return self._size
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits into its size budget.
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        evictions = 0
+        # the most recently used entry is kept, even if it alone exceeds the budget
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            evictions += 1
+        if evictions > 0:
+            self.evictions += evictions
+            logging.info(f"conversion cache: evicted {evictions} entries, size is now {self._size} bytes (budget: {self.max_bytes} bytes)")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self._single_flight.coalesced,
+            "max_bytes": self.max_bytes
+        }
@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, CancelledError, FIRST_COMPLETED, wait
+
+
+class ConversionPool:
+    """
+    A shared, process-wide scheduler that every conversion of all sessions passes through.
+
+    At most max_workers jobs run concurrently, all other jobs are queued per session. The sessions are
+    served round-robin, s.t., a session with many jobs (or many reruns) does not starve the others.
+    If a session submits new jobs (e.g., the script was rerun because the width changed), its jobs that
+    are still queued belong to the superseded run and are cancelled.
+    """
+
+    def __init__(self, max_workers=None):
+        if max_workers is None or max_workers < 1:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.cancelled = 0
+        self._running = 0
+        self._queues = OrderedDict()  # session id -> deque of (future, function, args, kwargs)
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [threading.Thread(target=self._work, name=f"conversion_{i}", daemon=True) for i in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"conversion pool: started with {max_workers} workers")
+
+    def _enqueue(self, session_id, function, args, kwargs):
+        future = Future()
+        self._queues.setdefault(session_id, deque()).append((future, function, args, kwargs))
+        return future
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queues one job (not bound to a session), returns its future.
+        """
+        with self._condition:
+            future = self._enqueue(None, function, args, kwargs)
+            self._condition.notify()
+        return future
+
+    def submit_all(self, jobs, thread_initializer=None, session_id=None):
+        """
+        Queues all given jobs of one session at once.
+        jobs is a dictionary of the form {key: (function, args, kwargs)}.
+        The optional thread_initializer is called in the worker thread before each job,
+        e.g., to attach the Streamlit script context of the calling session (the attributes it attaches
+        to the thread are removed after the job).
+        The still queued jobs of a previous call with the same session_id are cancelled.
+        Returns a dictionary {future: key}.
+        """
+        futures = {}
+        with self._condition:
+            if session_id is not None:
+                self._cancel_queued(session_id)
+            for key, (function, args, kwargs) in jobs.items():
+                futures[self._enqueue(session_id, _run_job, (thread_initializer, function, args, kwargs), {})] = key
+            self._condition.notify_all()
+        return futures
+
+    def _cancel_queued(self, session_id):
+        queue = self._queues.pop(session_id, None)
+        if queue:
+            for future, _, _, _ in queue:
+                future.cancel()
+            self.cancelled += len(queue)
+            logging.info(f"conversion pool: cancelled {len(queue)} superseded jobs of session {session_id}")
+
+    def _next_job(self):
+        with self._condition:
+            while not self._shutdown:
+                # the first session in the rotation; sessions without queued jobs are removed
+                for session_id, queue in self._queues.items():
+                    job = queue.popleft()
+                    if queue:
+                        self._queues.move_to_end(session_id)
+                    else:
+                        del self._queues[session_id]
+                    self._running += 1
+                    return job
+                self._condition.wait()
+            return None
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            future, function, args, kwargs = job
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = function(*args, **kwargs)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._condition:
+                    self._running -= 1
+
+    def queue_position(self, future):
+        """
+        Returns the approximate position of the queued job (1: next one) or None if it is not queued (anymore).
+        """
+        with self._condition:
+            for session_id, queue in self._queues.items():
+                for index, (queued_future, _, _, _) in enumerate(queue):
+                    if queued_future is future:
+                        # the sessions are served round-robin, the other sessions get up to index + 1 turns before
+                        return index + 1 + sum(min(len(other_queue), index + 1) for other_session_id, other_queue in self._queues.items() if other_session_id != session_id)
+        return None
+
+    def results_as_completed(self, jobs, thread_initializer=None, session_id=None, on_waiting=None, poll_interval=0.5):
+        """
+        Runs all given jobs and yields (key, result, exception) in the order of completion.
+        While waiting, on_waiting is called with {key: queue position (None if running)} of the unfinished jobs.
+        """
+        futures = self.submit_all(jobs, thread_initializer, session_id)
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = futures[future]
+                if future.cancelled():
+                    yield key, None, CancelledError(f"job {key} was cancelled")
+                    continue
+                exception = future.exception()
+                if exception is not None:
+                    logging.error(f"conversion pool: job {key} failed: {exception}")
+                    yield key, None, exception
+                else:
+                    yield key, future.result(), None
+            if pending and on_waiting is not None:
+                on_waiting({futures[future]: self.queue_position(future) for future in pending})
+
+    def stats(self):
+        with self._condition:
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "sessions": len(self._queues),
+                "cancelled": self.cancelled
+            }
+
+    def shutdown(self):
+        with self._condition:
+            self._shutdown = True
+            for session_id in list(self._queues.keys()):
+                self._cancel_queued(session_id)
+            self._condition.notify_all()
+
+
+def _run_job(thread_initializer, function, args, kwargs):
+    if thread_initializer is None:
+        return function(*args, **kwargs)
+    thread = threading.current_thread()
+    attributes = set(vars(thread))
+    thread_initializer(thread)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        # the worker thread is shared by all sessions, the attributes attached by the initializer are removed again
+        for name in set(vars(thread)) - attributes:
+            delattr(thread, name)
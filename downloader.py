@@ -0,0 +1,302 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from PIL import ImageFile
+
+from metrics import METRICS
+from single_flight import SingleFlight
+from image_ingestion import ImageBudgetExceededError, map_file, DEFAULT_MAX_BYTES, DEFAULT_MAX_PIXELS
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class Downloader:
+    """
+    Downloads images using one shared, pooled HTTP session.
+
+    Every download is bounded by connect/read timeouts, a total deadline, a maximum number of bytes and
+    (as soon as the image header arrived) a maximum number of pixels. Downloaded files
+    are cached by URL; after max_age seconds the cache entry is revalidated using its
+    ETag/Last-Modified headers. The cache is limited to max_cache_bytes, the least recently used
+    entries are evicted first. Concurrent fetches of the same URL are coalesced into one request.
+    """
+
+    def __init__(self, cache_directory, connect_timeout=5, read_timeout=30, total_timeout=60, max_bytes=DEFAULT_MAX_BYTES, max_pixels=DEFAULT_MAX_PIXELS,
+                 max_age=300, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES, pool_size=10):
+        self.cache_directory = cache_directory
+        self.timeout = (connect_timeout, min(read_timeout, total_timeout))
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_age = max_age
+        self.max_cache_bytes = max_cache_bytes
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+        # cache key -> size of its data and meta files, the least recently used entry first; the directory is walked only here
+        self._cache_entries = OrderedDict((key, size) for key, (_, size) in sorted(self._scan_cache().items(), key=lambda item: item[1][0]))
+        self._cache_size = sum(self._cache_entries.values())
+        self._cache_lock = threading.Lock()
+
+        # imported on first use, as the web UI needs it only for downloads
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "image-to-ascii-art"
+
+        self._single_flight = SingleFlight()
+
+    @staticmethod
+    def _cache_key(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _cache_filenames(self, key):
+        base = os.path.join(self.cache_directory, key)
+        return base + ".data", base + ".json"
+
+    def _scan_cache(self):
+        """
+        Returns the cache key -> (last used time, size) of the entries in the cache directory.
+        """
+        entries = {}
+        for name in os.listdir(self.cache_directory):
+            key, extension = os.path.splitext(name)
+            if extension not in (".data", ".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_directory, name))
+            except FileNotFoundError:
+                continue
+            last_used, size = entries.get(key, (0, 0))
+            entries[key] = (max(last_used, stat.st_mtime), size + stat.st_size)
+        return entries
+
+    def _read_cache(self, url):
+        """
+        Returns the filename of the cached data and the meta data of the URL or (None, None) if it is not cached.
+        """
+        key = self._cache_key(url)
+        data_filename, meta_filename = self._cache_filenames(key)
+        try:
+            with open(meta_filename, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if not os.path.isfile(data_filename):
+            return None, None
+        with self._cache_lock:
+            if key in self._cache_entries:
+                self._cache_entries.move_to_end(key)
+        return data_filename, meta
+
+    def _add_cache_entry(self, key):
+        """
+        Records the (new or rewritten) entry and evicts the least recently used entries exceeding the cache budget.
+        """
+        size = 0
+        for filename in self._cache_filenames(key):
+            try:
+                size += os.path.getsize(filename)
+            except FileNotFoundError:
+                pass
+        with self._cache_lock:
+            self._cache_size -= self._cache_entries.pop(key, 0)
+            self._cache_entries[key] = size
+            self._cache_size += size
+            evicted = []
+            # the most recently used entry is kept, even if it alone exceeds the budget
+            while self._cache_size > self.max_cache_bytes and len(self._cache_entries) > 1:
+                evicted_key, evicted_size = self._cache_entries.popitem(last=False)
+                self._cache_size -= evicted_size
+                evicted.append(evicted_key)
+        for evicted_key in evicted:
+            for filename in self._cache_filenames(evicted_key):
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+        if evicted:
+            logging.info(f"download cache: evicted {len(evicted)} entries, size is now {self._cache_size} bytes (budget: {self.max_cache_bytes} bytes)")
+
+    def _write_cache(self, url, tmp_data_filename, response):
+        """
+        Moves the downloaded data into the cache and stores its meta data, returns the filename of the cached data.
+        """
+        key = self._cache_key(url)
+        data_filename, meta_filename = self._cache_filenames(key)
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched": time.time()
+        }
+        os.replace(tmp_data_filename, data_filename)
+        tmp_meta_filename = meta_filename + ".%s.tmp" % threading.get_ident()
+        with open(tmp_meta_filename, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta_filename, meta_filename)
+        self._add_cache_entry(key)
+        return data_filename
+
+    def _touch_cache(self, url, meta):
+        key = self._cache_key(url)
+        _, meta_filename = self._cache_filenames(key)
+        meta["fetched"] = time.time()
+        with open(meta_filename, "w") as f:
+            json.dump(meta, f)
+        self._add_cache_entry(key)
+
+    def fetch(self, url):
+        """
+        Returns the bytes of the given URL, from the cache if it is still valid.
+        """
+        with self.fetch_mapped(url) as data:
+            return bytes(data)
+
+    def fetch_mapped(self, url):
+        """
+        Returns the content of the given URL as read-only memory map of the cached file (to be used in a with statement),
+        s.t., the image is not loaded into memory as a whole.
+        """
+        try:
+            return map_file(self.fetch_file(url))
+        except FileNotFoundError:
+            # evicted by a concurrent download in the meantime
+            return map_file(self.fetch_file(url))
+
+    def fetch_file(self, url):
+        """
+        Downloads the given URL into the cache (unless the cached file is still valid) and returns the filename of the cached file.
+        """
+        parsed_url = urlparse(url)
+        if parsed_url.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported URL scheme: {parsed_url.scheme}")
+
+        # concurrent fetches of the same URL are coalesced
+        return self._single_flight.do(url, self._fetch, url)
+
+    def _fetch(self, url):
+        with METRICS.span("download") as span:
+            filename, span.cache_hit = self._fetch_or_revalidate(url)
+            span.output_bytes = os.path.getsize(filename)
+            return filename
+
+    def _fetch_or_revalidate(self, url):
+        """
+        Returns the filename of the cached file of the given URL and whether it was taken from the cache.
+        The response body is written to the file as it arrives.
+        """
+        cached_filename, meta = self._read_cache(url)
+        headers = {}
+        if cached_filename is not None:
+            if time.time() - meta["fetched"] < self.max_age:
+                logging.info(f"download cache hit: {url}")
+                return cached_filename, True
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        deadline = time.monotonic() + self.total_timeout
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304 and cached_filename is not None:
+                logging.info(f"download cache revalidated: {url}")
+                self._touch_cache(url, meta)
+                return cached_filename, True
+            response.raise_for_status()
+
+            content_length = response.headers.get("Content-Length")
+            if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+                raise ImageBudgetExceededError(f"the image file is too large ({content_length} bytes, allowed: {self.max_bytes} bytes)")
+
+            data_filename, _ = self._cache_filenames(self._cache_key(url))
+            tmp_data_filename = data_filename + ".%s.tmp" % threading.get_ident()
+            try:
+                with open(tmp_data_filename, "wb") as f:
+                    size = self._read_bounded(response, deadline, f)
+                filename = self._write_cache(url, tmp_data_filename, response)
+            finally:
+                if os.path.exists(tmp_data_filename):
+                    os.remove(tmp_data_filename)
+
+        logging.info(f"downloaded {size} bytes from {url}")
+        return filename, False
+
+    def _read_bounded(self, response, deadline, f):
+        """
+        Writes the response body incrementally to the given file and returns its size. The chunks are fed into Pillow's incremental parser
+        until the image header is known, s.t., too large images are rejected before they are downloaded completely.
+        A server sending the body too slowly (each read within the read timeout) is cut off at the deadline.
+        """
+        import requests
+
+        # the read timeout bounds each read only, the connection is shut down when the deadline passes
+        watchdog = threading.Timer(max(0.0, deadline - time.monotonic()), self._abort, args=(response,))
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            return self._read_chunks(response, deadline, f)
+        except requests.RequestException:
+            if time.monotonic() >= deadline:
+                raise requests.Timeout(f"the download took longer than {self.total_timeout} seconds")
+            raise
+        finally:
+            watchdog.cancel()
+
+    @staticmethod
+    def _abort(response):
+        """
+        Shuts down the socket of the response, s.t., a blocked read returns immediately.
+        """
+        sockets = [getattr(getattr(response.raw, "connection", None), "sock", None)]
+        # the connection releases its socket for responses delimited by closing the connection (HTTP/1.0),
+        # it is still referenced by the file object the response body is read from
+        body_file = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sockets.append(getattr(getattr(body_file, "raw", None), "_sock", None))
+        for sock in sockets:
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _read_chunks(self, response, deadline, f):
+        import requests
+
+        size = 0
+        parser = ImageFile.Parser()
+        header_checked = False
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if time.monotonic() >= deadline:
+                raise requests.Timeout(f"the download took longer than {self.total_timeout} seconds")
+            f.write(chunk)
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ImageBudgetExceededError(f"the image file is too large (more than {self.max_bytes} bytes)")
+            if not header_checked:
+                try:
+                    parser.feed(chunk)
+                except Exception:
+                    # not an image format supported by the incremental parser, the ingestion will check it
+                    header_checked = True
+                    continue
+                if parser.image is not None:
+                    width, height = parser.image.size
+                    if width * height > self.max_pixels:
+                        raise ImageBudgetExceededError(f"the image is too large ({width}x{height} pixels, allowed: {self.max_pixels} pixels)")
+                    header_checked = True
+        if time.monotonic() >= deadline:
+            # the body ended because the connection was shut down
+            raise requests.Timeout(f"the download took longer than {self.total_timeout} seconds")
+        return size
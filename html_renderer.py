@@ -0,0 +1,43 @@
+from metrics import METRICS
+
+HTML_STYLE = """
+    <style>
+    body {
+        margin: 0 !important;
+        background-color: #FF0 !important;
+        line-height: 1.1 !important;
+        font-size: 20px !important;
+    }
+    .ansi2html-content {
+        background-color: #000000 !important;
+    }
+
+    pre {
+        white-space: pre !important;
+        font-family: "Courier New" !important;
+    }
+    </style>
+    """
+
+
+@METRICS.stage("html")
+def write_html(ascii_art, html_filename):
+    """
+    Writes the ANSI colored ASCII art as HTML page.
+    """
+    # imported on first use, as the HTML format is just produced on request
+    from ansi2html import Ansi2HTMLConverter
+
+    # a new converter per call, as conversions might run concurrently
+    html_output = Ansi2HTMLConverter().convert(
+        ascii_art, full=True, ensure_trailing_newline=False).strip()
+    html_output = html_output.replace("<body", HTML_STYLE + "<body")
+    html_output = html_output.replace("""</span>
+
+</pre>""", """</span></pre>""")  # HACK to fix the last line problem
+    html_output = html_output.replace("""
+
+</pre>""", """</pre>""")  # HACK to fix the last line problem
+    with open(html_filename, "w") as file:
+        file.write(html_output)
+    return html_filename
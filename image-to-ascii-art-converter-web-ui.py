@@ -1,25 +1,36 @@
 import streamlit as st
 from streamlit.components.v1 import html
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit import runtime
 
-from PIL import Image
 import base64
 import logging
-import codecs
 import subprocess
 from datetime import datetime
 import time
-import lxml.etree
 import os
+import uuid
 from decouple import config
-from ansi2html import Ansi2HTMLConverter
-from ascii_magic import AsciiArt
-from ansitoimg.render import ansiToSVG
-from util import include_css, download_image, save_uploaded_file, replace_values_in_index_html
+from util import include_css, read_static_file, create_thumbnail_png, get_image_as_png, get_image_as_data_url, download_image, save_uploaded_file, map_uploaded_file, replace_values_in_index_html
+from conversion_cache import ConversionCache, hash_bytes
+from conversion_pool import ConversionPool
+from ascii_engine import ENGINE_BUILTIN
+from image_context import ImageContext
+from approaches import APPROACHES, convert_approach as convert_approach_to_grid
+from cell_grid import CellGrid
+from html_renderer import write_html
+from ansi_writer import COLORS_TRUECOLOR
+from svg_renderer import write_svg
+from png_renderer import render_png, DEFAULT_FONT_FILENAME
+from inkscape_pool import InkscapePool
+from downloader import Downloader
+from artifacts import Artifacts, write_text, FORMAT_TEXT, FORMAT_HTML, FORMAT_SVG, FORMAT_PNG
+from metrics import METRICS, start_metrics_server
+from animation import convert_animation, FORMAT_ANSI_SCRIPT
 import json
 import signal
 
 UPLOAD_DIRECTORY = config('UPLOAD_DIRECTORY')
-EXPORT_IMAGE_ENDING = "-ascii-art.png"
 PAGE_ICON = config('PAGE_ICON')
 PAGE_IMAGE = config('PAGE_IMAGE')
 GITHUB_REPO = config('GITHUB_REPO')
@@ -30,6 +41,31 @@ META_DESCRIPTION = config('META_DESCRIPTION', default=None)
 REPLACE_INDEX_HTML_CONTENT = config('REPLACE_INDEX_HTML_CONTENT', default=False, cast=bool)
 CANONICAL_URL = config('CANONICAL_URL', default=None)
 ADDITIONAL_HTML_HEAD_CONTENT = config('ADDITIONAL_HTML_HEAD_CONTENT', default=None)
+CACHE_DIRECTORY = config('CACHE_DIRECTORY', default=UPLOAD_DIRECTORY + "/cache")
+CACHE_MAX_SIZE_MB = config('CACHE_MAX_SIZE_MB', default=512, cast=int)
+ASCII_ENGINE = config('ASCII_ENGINE', default=ENGINE_BUILTIN) # "builtin" or "ascii-image-converter"
+PNG_RENDERER = config('PNG_RENDERER', default="pillow") # "pillow" or "inkscape"
+PNG_FONT = config('PNG_FONT', default=DEFAULT_FONT_FILENAME)
+ANSI_DOWNLOAD_COLORS = config('ANSI_DOWNLOAD_COLORS', default=COLORS_TRUECOLOR) # colors of the downloadable data file: truecolor, 256 or 16
+SVG_PREVIEW_BY_URL = config('SVG_PREVIEW_BY_URL', default=False, cast=bool) # serve the SVG previews as media files instead of inline base64
+INKSCAPE_SHELL_WORKERS = config('INKSCAPE_SHELL_WORKERS', default=2, cast=int) # 0: one Inkscape process per PNG image
+INKSCAPE_TIMEOUT = config('INKSCAPE_TIMEOUT', default=60, cast=int) # seconds per PNG image
+MAX_INPUT_PIXELS = config('MAX_INPUT_PIXELS', default=100_000_000, cast=int) # protection against decompression bombs
+MAX_INPUT_SIZE_MB = config('MAX_INPUT_SIZE_MB', default=50, cast=int)
+DOWNLOAD_CACHE_DIRECTORY = config('DOWNLOAD_CACHE_DIRECTORY', default=UPLOAD_DIRECTORY + "/downloads")
+DOWNLOAD_CACHE_MAX_AGE = config('DOWNLOAD_CACHE_MAX_AGE', default=300, cast=int) # seconds until a downloaded image is revalidated
+DOWNLOAD_TIMEOUT = config('DOWNLOAD_TIMEOUT', default=30, cast=int) # seconds
+DOWNLOAD_TOTAL_TIMEOUT = config('DOWNLOAD_TOTAL_TIMEOUT', default=60, cast=int) # seconds
+DOWNLOAD_CACHE_MAX_SIZE_MB = config('DOWNLOAD_CACHE_MAX_SIZE_MB', default=256, cast=int)
+CELL_STATISTICS_CACHE_ENTRIES = config('CELL_STATISTICS_CACHE_ENTRIES', default=16, cast=int) # number of decoded images (pixels, cell statistics) kept in memory for fast width changes
+GRID_CACHE_ENTRIES = config('GRID_CACHE_ENTRIES', default=64, cast=int) # number of converted ASCII arts kept in memory
+PROGRESSIVE_PREVIEW = config('PROGRESSIVE_PREVIEW', default=True, cast=bool) # show a low-resolution preview until the full output is ready
+PREVIEW_WIDTH = config('PREVIEW_WIDTH', default=40, cast=int) # characters per line of the low-resolution preview
+MAX_PARALLEL_CONVERSIONS = config('MAX_PARALLEL_CONVERSIONS', default=0, cast=int) # 0: number of CPU cores
+METRICS_PORT = config('METRICS_PORT', default=8503, cast=int) # port of the Prometheus metrics endpoint, 0: disabled
+METRICS_ADDRESS = config('METRICS_ADDRESS', default="127.0.0.1") # use 0.0.0.0 to expose the metrics endpoint outside of a container
+METRICS_IN_CONFIGURATION = config('METRICS_IN_CONFIGURATION', default=False, cast=bool) # add the metrics to the saved configuration of each run
+ANIMATION_MAX_FRAMES = config('ANIMATION_MAX_FRAMES', default=500, cast=int) # maximum number of frames of animated images (GIF, TIFF) that are converted
 
 SOURCE_UPLOAD = "Upload"
 SOURCE_DOWNLOAD = "Download"
@@ -37,7 +73,15 @@ PAGE_TITLE = "ASCII to image converter"
 MIN_WIDTH = 10
 MAX_WIDTH = 300
 RENDER_SCALE_PIXELS = 8
+# the static images are downscaled once per process (the logo is shown with at most a few hundred pixels)
+PAGE_ICON_SIZE = 128
+PAGE_IMAGE_SIZE = 512
+ORIGINAL_IMAGE_PREVIEW_SIZE = 640
 DEFAULT_OUTPUT_WIDTH = 1024
+# images are decoded with a few pixels per character of the widest ASCII art, larger images are downscaled while decoding
+INGESTION_PIXELS_PER_CHARACTER = 4
+# the converted grids are kept in the conversion cache (lossless) next to the download formats
+GRID_CACHE_FORMAT = "grid"
 
 width = 60
 agree_on_showing_additional_information = True
@@ -46,78 +90,35 @@ render_scale_pixels = RENDER_SCALE_PIXELS
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
 
-conv = Ansi2HTMLConverter()
-
 # if the dry run is enabled, we will stop the script
 if config('DRY_RUN', default=False, cast=bool):
     logging.info("dry run enabled, will stop script, now")
     os.kill(os.getpid(), signal.SIGTERM)
 
-ascii_image_converter_with_colors = "With colors (I)"
-ascii_image_converter_with_colors_complex = "With colors (II)"
-ascii_magic_with_colors = "With colors (III)"
-
-ascii_image_converter_with_background_colors = "With background (I)"
-ascii_image_converter_with_background_colors_complex = "With background (II)"
-ascii_image_converter_only_background_color = "Only background"
-
-ascii_image_converter_neutral = "No colors (I)"
-ascii_image_converter_neutral_complex = "No colors (II)"
-ascii_magic_neutral = "No colors (III)"
-
-approaches = {
-    ascii_image_converter_with_colors: {
-        "color": True,
-        "description": "ascii-image-converter: with simple, colored ASCII characters"
-    },
-    ascii_image_converter_with_colors_complex: {
-        "color": True,
-        "description": "ascii-image-converter: with complex, colored ASCII characters"
-    },
-    ascii_magic_with_colors: {
-        "color": True,
-        "description": "ascii_magic: with simple, colored ASCII characters"
-    },
-    
-    ascii_image_converter_with_background_colors: {
-        "color": True,
-        "description": "ascii-image-converter: with simple, one-colored ASCII characters and background colors"
-    },
-    ascii_image_converter_with_background_colors_complex: {
-        "color": True,
-        "description": "ascii-image-converter: with complex, one-colored ASCII characters and background colors"
-    },
-    ascii_image_converter_only_background_color: {
-        "color": True,
-        "description": "ascii-image-converter: with background colors only (each character is a whitespace)"
-    },
-
-    ascii_image_converter_neutral: {
-        "color": False,
-        "description": "ascii-image-converter: with simple, one-color ASCII characters"
-    },
-    ascii_image_converter_neutral_complex: {
-        "color": False,
-        "description": "ascii-image-converter: with complex, one-color ASCII characters"
-    },
-    ascii_magic_neutral: {
-        "color": False,
-        "description": "ascii_magic: with simple, one-color ASCII characters"
-    }
-}
+# a copy per session, as the "active" state of each approach is set by the session
+approaches = {approach: dict(settings) for approach, settings in APPROACHES.items()}
+
+@st.cache_resource(show_spinner=False)
+def prepare_index_html():
+    """
+    The index.html file of Streamlit is adapted once per process, not on every rerun
+    (without spinner, as set_page_config has to be the first Streamlit command).
+    """
+    replace_values_in_index_html(st, REPLACE_INDEX_HTML_CONTENT, 
+                                 new_title=PAGE_TITLE, 
+                                 new_meta_description=META_DESCRIPTION, 
+                                 new_noscript_content=DESCRIPTION, 
+                                 canonical_url=CANONICAL_URL, 
+                                 page_icon_with_path=PAGE_ICON,
+                                 additional_html_head_content=ADDITIONAL_HTML_HEAD_CONTENT
+                                )
 
-replace_values_in_index_html(st, REPLACE_INDEX_HTML_CONTENT, 
-                             new_title=PAGE_TITLE, 
-                             new_meta_description=META_DESCRIPTION, 
-                             new_noscript_content=DESCRIPTION, 
-                             canonical_url=CANONICAL_URL, 
-                             page_icon_with_path=PAGE_ICON,
-                             additional_html_head_content=ADDITIONAL_HTML_HEAD_CONTENT
-                            )
+
+prepare_index_html()
 
 st.set_page_config(layout="wide", initial_sidebar_state="expanded",
                    page_title=PAGE_TITLE,
-                   page_icon=Image.open(PAGE_ICON)
+                   page_icon=get_image_as_png(PAGE_ICON, PAGE_ICON_SIZE)
                    )
 include_css(st, ["css/stFileUploadDropzone.css", "css/style_github_ribbon.css",
             "css/style_menu_logo.css", "css/style_logo.css", "css/style_ascii_images.css", "css/style_tabs.css"])  
@@ -129,16 +130,14 @@ def update_width_input():
     st.session_state.width_input = st.session_state.width_slider
 
 with st.sidebar:
-    with open(PAGE_IMAGE, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode("utf-8")
-        st.sidebar.markdown(
-            f"""
-            <div style="display:table;margin-top:-10%;margin-bottom:15%;text-align:center">
-                <a href="{GITHUB_REPO}" title="go to GitHub repository"><img src="data:image/png;base64,{image_data}" class="app_logo"></a>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+    st.sidebar.markdown(
+        f"""
+        <div style="display:table;margin-top:-10%;margin-bottom:15%;text-align:center">
+            <a href="{GITHUB_REPO}" title="go to GitHub repository"><img src="{get_image_as_data_url(PAGE_IMAGE, PAGE_IMAGE_SIZE)}" class="app_logo"></a>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
 
     label = "Select the source of the image"
     help = "Upload: Upload an image from your local computer.\n\nDownload: Download an image from the internet."
@@ -160,7 +159,7 @@ with st.sidebar:
     png_download_activated = st.sidebar.checkbox("Enable download as PNG", value=False, help="PNG is a raster format and can not be scaled without loss of quality.")
 
     if png_download_activated:
-        help = "The PNG image will be generated from the SVG image. Hence, it will be of good quality in any case."
+        help = "The PNG image will be rendered with exactly the given width. Hence, it will be of good quality in any case."
         label = "Define the generated PNG image width"
         output_width = st.sidebar.number_input(label, label_visibility="visible", min_value=1, max_value=4096, value=DEFAULT_OUTPUT_WIDTH, help=help)  
 
@@ -187,12 +186,47 @@ If you want to change the actual background of your ASCII art image, then you sh
         'minimize layout', value=(not agree_on_showing_additional_information), help=help)
 
 
-@st.cache_data
-def get_new_working_dir(upload_filename):
-    new_working_directory = UPLOAD_DIRECTORY + "/" + \
-        datetime.now().strftime("%Y%m%d-%H%M%S")
-    logging.warning(f"new working directory: {new_working_directory}")
-    return new_working_directory
+@st.cache_resource
+def get_conversion_cache():
+    return ConversionCache(CACHE_DIRECTORY, CACHE_MAX_SIZE_MB * 1024 * 1024)
+
+
+@st.cache_resource
+def get_conversion_pool():
+    return ConversionPool(MAX_PARALLEL_CONVERSIONS)
+
+
+@st.cache_resource
+def get_downloader():
+    return Downloader(DOWNLOAD_CACHE_DIRECTORY, read_timeout=DOWNLOAD_TIMEOUT, total_timeout=DOWNLOAD_TOTAL_TIMEOUT, max_bytes=MAX_INPUT_SIZE_MB * 1024 * 1024,
+                      max_pixels=MAX_INPUT_PIXELS, max_age=DOWNLOAD_CACHE_MAX_AGE, max_cache_bytes=DOWNLOAD_CACHE_MAX_SIZE_MB * 1024 * 1024)
+
+
+@st.cache_resource
+def get_inkscape_pool(inkscape_path):
+    return InkscapePool(inkscape_path, workers=INKSCAPE_SHELL_WORKERS, job_timeout=INKSCAPE_TIMEOUT)
+
+
+@st.cache_resource
+def get_metrics_server():
+    if METRICS_PORT <= 0:
+        return None
+    return start_metrics_server(METRICS_PORT, METRICS_ADDRESS)
+
+
+get_metrics_server()
+
+
+def get_session_working_dir():
+    """
+    Returns the working directory of the current session, it is created once per session (not per rerun).
+    """
+    if "working_directory" not in st.session_state:
+        new_working_directory = UPLOAD_DIRECTORY + "/" + \
+            datetime.now().strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        logging.warning(f"new working directory: {new_working_directory}")
+        st.session_state["working_directory"] = new_working_directory
+    return st.session_state["working_directory"]
 
 
 
@@ -210,7 +244,15 @@ else:
     include_css(st, ["css/remove_space_around_streamlit_body.css"])
 
 
-current_directory = get_new_working_dir(str(time.time()))
+def get_ingestion_limits():
+    return {
+        "max_width": MAX_WIDTH * INGESTION_PIXELS_PER_CHARACTER,
+        "max_pixels": MAX_INPUT_PIXELS,
+        "max_bytes": MAX_INPUT_SIZE_MB * 1024 * 1024
+    }
+
+
+current_directory = get_session_working_dir()
 if not os.path.exists(current_directory):
     os.makedirs(current_directory)
 
@@ -234,7 +276,13 @@ with selection_source:
         if uploaded_image_file_name is not None:
             base_filename = current_directory + "/" + os.path.splitext(uploaded_image_file_name)[0]
             input_filename = base_filename + ".png"
-            image_size = save_uploaded_file(input_filename, uploaded_image_file)
+            try:
+                image_size = save_uploaded_file(input_filename, uploaded_image_file, **get_ingestion_limits())
+            except Exception as e:
+                st.error("Error while reading the uploaded image: " + str(e))
+                base_filename = None
+                input_filename = None
+                image_size = None
 
     if source == SOURCE_DOWNLOAD:
         label = "Download an image from the Web"
@@ -245,7 +293,7 @@ with selection_source:
             base_filename = current_directory + "/downloaded_image"
             input_filename = base_filename + base64.b64encode(download_url.encode("utf-8")).decode("utf-8") + ".png"
             try:
-                image_size = download_image(download_filename=input_filename, url=download_url)
+                image_size = download_image(download_filename=input_filename, url=download_url, downloader=get_downloader(), **get_ingestion_limits())
                 st.info("Downloaded image from %s (size %sx%s)." % (download_url, image_size["width"], image_size["height"]))
             except Exception as e:
                 st.error(f"Error while downloading the image from {download_url}: " + str(e))
@@ -254,211 +302,80 @@ with selection_source:
                 input_filename = None
                 image_size = None
                 
+@st.cache_data(max_entries=CELL_STATISTICS_CACHE_ENTRIES, show_spinner=False)
+def get_original_image_preview(image_hash, _image_filename):
+    """
+    The small preview of the original image is created once per image (identified by its hash), not per rerun.
+    """
+    return create_thumbnail_png(_image_filename, ORIGINAL_IMAGE_PREVIEW_SIZE)
+
+
 with preview_original_image:
     if image_size is not None:
         label = "Original image (%sx%s)" % (image_size["width"], image_size["height"])
         help = "This is just a preview of the original image."
-        st.image(input_filename, label, use_column_width=True)
-
-# @st.cache_resource
-def convert_image_to_ascii_art_execute(image_filename, parameters):
-    command = ["ascii-image-converter"] + parameters + [image_filename]
-    logging.info("execute: " + " ".join(command))
-    return subprocess.run(command, capture_output=True)
-
-
-# @st.cache_data
-def render_ascii_art_as_html_image(ascii_art, image_base_filename, width, original_image_size, svg_download_activated, png_download_activated, output_width):
-    image_filename = image_base_filename + "--rendered-html.png"
-    html_output = conv.convert(
-        ascii_art, full=True, ensure_trailing_newline=False).strip()
-    new_style = """
-    <style>
-    body {
-        margin: 0 !important;
-        background-color: #FF0 !important;
-        line-height: 1.1 !important;
-        font-size: 20px !important;
-    }
-    .ansi2html-content {
-        background-color: #000000 !important;
-    }
-    
-    pre {
-        white-space: pre !important;
-        font-family: "Courier New" !important;
-    }
-    </style>
+        st.image(get_original_image_preview(image_size["hash"], input_filename), label, use_column_width=True)
+
+@st.cache_resource(max_entries=CELL_STATISTICS_CACHE_ENTRIES)
+def get_cached_image_context(image_hash, _image_filename):
     """
-    html_output = html_output.replace("<body", new_style + "<body")
-    html_output = html_output.replace("""</span>
+    The image is decoded once (identified by its hash), its pixels and cell statistics are reused for all widths and approaches.
+    Evicted contexts release their temporary files as soon as no conversion uses them anymore.
+    """
+    return ImageContext(_image_filename)
 
-</pre>""", """</span></pre>""")  # HACK to fix the last line problem
-    html_output = html_output.replace("""
 
-</pre>""", """</pre>""")  # HACK to fix the last line problem
-    html_filename = image_filename + ".html"
-    with open(html_filename, "w") as file:
-        file.write(html_output)
+def render_ascii_art_as_html(artifacts, html_filename):
+    return write_html(artifacts.ascii_art, html_filename)
 
-    svg_image_filename = image_filename + ".svg"
-    height = len(ascii_art.strip().split("\n"))
-    ansiToSVG(ascii_art, svg_image_filename, width=width, title=f"Preview of {width}x{height} ASCII art as SVG")
-    
-    svg_image_filename_optimized = optimize_svg_console_output(svg_image_filename)
-    logging.info("svg_image_filename: " + str(svg_image_filename))
-    logging.info("svg_image_filename_optimized: " + str(svg_image_filename_optimized))
-
-    png_image_filename = None
-    if png_download_activated:
-        png_image_filename = create_png_image(svg_image_filename_optimized, output_width)
-        logging.info("png_image_filename: " + str(png_image_filename))
-    
-    return svg_image_filename_optimized, png_image_filename
-
-
-def optimize_svg_console_output(svg_filename):
-    """
-    This function optimizes the SVG file generated by ansiToSVG.
-    It is a hacky workaround to remove the console frame around the console content.
-    """
-    
-    # optimize viewbox
-    root = lxml.etree.parse(svg_filename)
-    viewbox = root.getroot().attrib['viewBox']
-    viewbox = viewbox.split(" ")
-    viewbox = [float(i) for i in viewbox]
-
-    viewbox[1] = viewbox[1] + 2
-    viewbox[2] = viewbox[2] - 19
-    viewbox[3] = viewbox[3] - 53
-    root.getroot().attrib['viewBox'] = " ".join([str(i) for i in viewbox])
-
-    # move the content to the top left
-    all_first_level_children = root.getroot().getchildren()
-    all_g_elements = [i for i in all_first_level_children if i.tag == "{http://www.w3.org/2000/svg}g"]
-    g0 = all_g_elements[-1]
-    g0.attrib['transform'] = "translate(0,0)"
-
-    # remove round buttons (remove all children of g1)
-    g1 = all_g_elements[-2]
-    for i in g1.getchildren():
-        g1.remove(i)    
-
-    # hide the background rectangle
-    all_rect_elements = [i for i in all_first_level_children if i.tag == "{http://www.w3.org/2000/svg}rect"]
-    rect0 = all_rect_elements[0]
-    rect0.attrib['fill-opacity'] = "0.0"
-
-    # hide the text
-    all_text_elements = [i for i in all_first_level_children if i.tag == "{http://www.w3.org/2000/svg}text"]
-    all_text_elements[0].attrib['fill-opacity'] = "0.0"
-
-    # write the new SVG file
-    outfile = svg_filename + "_optimized.svg"
-    with codecs.open(outfile, "wb") as out:
-        root.write(out)
-
-    return outfile
-
-
-@st.cache_data
-def convert_image_to_ascii_art(input_filename, image_filename, parameters, width, original_image_size, svg_download_activated, png_download_activated, output_width):
-    # convert to ascii text
-    parameters = parameters + ["--width", str(width)]
-    ascii_art = convert_image_to_ascii_art_execute(input_filename, parameters)
-
-    # convert to ascii image
-    export_filename = image_filename + "_width_" + \
-        str(width) + EXPORT_IMAGE_ENDING
-
-    svg_export_filename, png_export_filename = render_ascii_art_as_html_image(
-        ascii_art.stdout.decode("utf-8"), 
-        export_filename, 
-        width, 
-        original_image_size, 
-        svg_download_activated, 
-        png_download_activated,
-        output_width=output_width
-    )
-    
-    logging.info("svg_export_filename: " + str(svg_export_filename))
-    
-    if svg_download_activated and not os.path.isfile(svg_export_filename):
-        st.error("SVG file not found: " + str(svg_export_filename))
-        logging.error("SVG file not found: " + str(svg_export_filename))
-        
-    if png_download_activated and not os.path.isfile(png_export_filename):
-        st.error("PNG file not found: " + str(png_export_filename))
-        logging.error("PNG file not found: " + str(png_export_filename))
-
-    return ascii_art.stdout.decode("utf-8"), svg_export_filename, png_export_filename
-
-
-def convert_image_to_ascii_art_asciiartlib(input_filename, image_filename, width, original_image_size, monochrome, svg_download_activated, png_download_activated, output_width):
-    art = AsciiArt.from_image(input_filename)
-    ascii_art = art.to_ascii(columns=width, monochrome=monochrome)
-
-    export_filename = image_filename + "_width_" + \
-        str(width) + EXPORT_IMAGE_ENDING
-    svg_export_filename, png_export_filename = render_ascii_art_as_html_image(
-        ascii_art, 
-        export_filename, 
-        width, 
-        original_image_size, 
-        svg_download_activated, 
-        png_download_activated, 
-        output_width=output_width
-    )
 
-    return ascii_art, svg_export_filename, png_export_filename
-
-@st.cache_data
-def remove_all_characters_from_ascii_art(ascii_art, filename, width, original_image_size, svg_download_activated, png_download_activated, output_width):
-    ascii_art = ascii_art.replace("*", " ")
-    ascii_art = ascii_art.replace("#", " ")
-    ascii_art = ascii_art.replace("+", " ")
-    ascii_art = ascii_art.replace("=", " ")
-    ascii_art = ascii_art.replace("%", " ")
-    ascii_art = ascii_art.replace("@", " ")
-    ascii_art = ascii_art.replace(".", " ")
-    ascii_art = ascii_art.replace("-", " ")
-    ascii_art = ascii_art.replace(":", " ")
-    filename = filename + "--only-background-color"
-    svg_export_filename, png_export_filename = render_ascii_art_as_html_image(
-        ascii_art, 
-        filename, 
-        width=width, 
-        original_image_size=original_image_size, 
-        svg_download_activated=svg_download_activated, 
-        png_download_activated=png_download_activated, 
-        output_width=output_width
-    )
-    return ascii_art, svg_export_filename, png_export_filename
+def render_ascii_art_as_svg(artifacts, svg_filename):
+    grid = artifacts.grid
+    return write_svg(grid, svg_filename, title=f"{grid.columns}x{grid.rows} ASCII art")
 
 
-def render_svg(svg_filename, width, render_scale_pixels):
-    """Renders the given SVG string."""
-    svg = open(svg_filename, 'r').read()
-    b64 = base64.b64encode(svg.encode('utf-8')).decode("utf-8")
-    html = r'<img title="SVG image" class="svg_ascii_art" src="data:image/svg+xml;base64,%s" width="%spx" /><br><div data-testid="caption">%s with %s characters per line</div>' % (b64, width * render_scale_pixels, "SVG image", width)
+def render_svg(svg_image, width, render_scale_pixels, caption=None):
+    """Renders the given SVG image (bytes), either inline or (if SVG_PREVIEW_BY_URL is set) by the URL of a media file."""
+    if caption is None:
+        caption = "SVG image with %s characters per line" % width
+    if SVG_PREVIEW_BY_URL and runtime.exists():
+        src = runtime.get_instance().media_file_mgr.add(svg_image, "image/svg+xml", f"svg_preview_{hash_bytes(svg_image)}")
+    else:
+        src = "data:image/svg+xml;base64," + base64.b64encode(svg_image).decode("utf-8")
+    html = r'<img title="SVG image" class="svg_ascii_art" src="%s" width="%spx" /><br><div data-testid="caption">%s</div>' % (src, width * render_scale_pixels, caption)
     st.write(html, unsafe_allow_html=True)
 
 
-@st.cache_data
-def create_png_image(svg_filename, output_width):
-    return convert_with_inkscape(svg_filename, output_width)
+def create_png_image(artifacts, png_filename, output_width):
+    """
+    Creates the PNG image, either directly from the ASCII art using Pillow or from the SVG image using Inkscape.
+    """
+    if PNG_RENDERER == "inkscape":
+        svg_filename = artifacts.get(FORMAT_SVG)
+        if svg_filename is None:
+            return None
+        return convert_with_inkscape(svg_filename, png_filename, output_width)
+    logging.info("render PNG image " + png_filename)
+    return render_png(artifacts.grid, png_filename, output_width, font_filename=PNG_FONT)
+
 
-def convert_with_inkscape(svg_filename, output_width):
-    png_filename = os.path.splitext(svg_filename)[0] + ".png"
+@METRICS.stage("inkscape", subprocess=True)
+def convert_with_inkscape(svg_filename, png_filename, output_width):
     logging.info("created PNG image " + png_filename)
     try:
         inkscape_path = subprocess.check_output(["which", "inkscape"]).strip()
     except subprocess.CalledProcessError:
-        st.error("ERROR: You need inkscape installed to use this script.")
         logging.error("ERROR: You need inkscape installed to use this script.")
         return None
 
+    if INKSCAPE_SHELL_WORKERS > 0:
+        # reuse the persistent Inkscape shell processes
+        try:
+            return get_inkscape_pool(inkscape_path.decode('utf-8')).export(svg_filename, png_filename, output_width)
+        except Exception as e:
+            logging.error("ERROR: inkscape pool: " + str(e))
+            return None
+
     args = [
         inkscape_path.decode('utf-8'),
         "--export-filename", png_filename,
@@ -467,15 +384,15 @@ def convert_with_inkscape(svg_filename, output_width):
     ]
     
     try:
-        result = subprocess.check_call(args, stderr=subprocess.STDOUT)
+        result = subprocess.check_call(args, stderr=subprocess.STDOUT, timeout=INKSCAPE_TIMEOUT)
         return png_filename
-    except subprocess.CalledProcessError as e:
-        st.error("ERROR: " + "\n".join(args))
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logging.error("ERROR: " + "\n".join(args))
         logging.error("ERROR: " + str(e))
         return None
 
 
-def show_download_buttons(ascii_data, svg_filename, svg_download_activated, png_filename, png_download_activated, output_basename):
+def show_download_buttons(ascii_data, svg_image, svg_download_activated, png_image, png_download_activated, output_basename):
     
     # create a columns layout depending on the number of download buttons
     if svg_download_activated and png_download_activated:
@@ -487,11 +404,11 @@ def show_download_buttons(ascii_data, svg_filename, svg_download_activated, png_
     else:
         rest0,download_data,rest1 = st.columns([1,10,1])
         
-    if svg_download_activated and svg_filename is not None:
+    if svg_download_activated and svg_image is not None:
         with download_svg_image:
             st.download_button(
                 label=":frame_with_picture: Download ASCII **SVG image** file",
-                data=open(svg_filename, 'rb').read(),
+                data=svg_image,
                 file_name=output_basename + ".svg",
                 mime="image/svg+xml"
             )
@@ -505,11 +422,11 @@ def show_download_buttons(ascii_data, svg_filename, svg_download_activated, png_
             key=output_basename + "_plain_ascii_data"
         )
 
-    if png_download_activated and png_filename is not None:        
+    if png_download_activated and png_image is not None:        
         with download_png_image:
             st.download_button(
                 label=":frame_with_picture: Download ASCII **PNG image** file",
-                data=open(png_filename, 'rb').read(),
+                data=png_image,
                 file_name=output_basename + ".png",
                 mime="image/png",
             )
@@ -522,6 +439,96 @@ def save_current_configuration(data, absolute_filename):
     with open(absolute_filename, "w") as f:
         f.write(json.dumps(data, indent=4))
 
+
+def convert_approach(approach, image_hash, input_filename, width):
+    """
+    Converts the input image to ASCII art using the given approach, the decoded image and
+    the ASCII art of other approaches (for derived approaches) are taken from the in-memory caches.
+    Returns the ASCII art as CellGrid (or None if the approach is not implemented).
+    """
+    image = get_cached_image_context(image_hash, input_filename) if image_hash is not None else input_filename
+    return convert_approach_to_grid(
+        approach, image, width,
+        engine=ASCII_ENGINE,
+        get_grid=lambda other_approach: get_cached_grid(other_approach, image_hash, width, input_filename)
+    )
+
+
+def convert_approach_cached(approach, image_hash, input_filename, width):
+    """
+    Returns the result of convert_approach from the conversion cache if available, otherwise the conversion is done and cached.
+    """
+    cache = get_conversion_cache()
+    # the lossless grid, not the download file (whose colors might be downsampled)
+    grid_key = cache.key(image_hash, approach, width, GRID_CACHE_FORMAT)
+    ascii_art = cache.get_text(grid_key)
+    if ascii_art is not None:
+        logging.info(f"conversion cache hit: {approach} with width {width}")
+        return CellGrid.from_ansi(ascii_art, columns=width)
+
+    grid = convert_approach(approach, image_hash, input_filename, width)
+    if grid is not None:
+        cache.put_text(grid_key, grid.to_ansi())
+    return grid
+
+
+@st.cache_resource(max_entries=GRID_CACHE_ENTRIES)
+def get_cached_grid(approach, image_hash, width, _input_filename):
+    """
+    The ASCII art of each approach is kept in memory, s.t., derived approaches (e.g., "Only background") reuse it.
+    Concurrent requests of the same ASCII art wait for one conversion.
+    """
+    return convert_approach_cached(approach, image_hash, _input_filename, width)
+
+
+def create_artifacts(grid, approach, image_hash, base_filename, width):
+    """
+    Returns the lazily produced download formats of the ASCII art of the given approach.
+    """
+    cache = get_conversion_cache()
+    return Artifacts(
+        grid,
+        f"{base_filename}_{approaches[approach]['download_filename']}_width_{width}",
+        producers={
+            FORMAT_TEXT: lambda artifacts, filename: write_text(artifacts, filename, ANSI_DOWNLOAD_COLORS),
+            FORMAT_HTML: render_ascii_art_as_html,
+            FORMAT_SVG: render_ascii_art_as_svg,
+            FORMAT_PNG: create_png_image
+        },
+        cache=cache,
+        cache_key=lambda output_format, output_width=None: cache.key(
+            # the text file depends on the configured colors
+            image_hash, approach, width, f"{output_format}-{ANSI_DOWNLOAD_COLORS}" if output_format == FORMAT_TEXT else output_format, output_width
+        )
+    )
+
+
+def convert_approach_for_preview(approach, image_hash, input_filename, base_filename, width, svg_download_activated, png_download_activated, output_width):
+    """
+    Converts the image and produces just the formats that are shown in the tab of the approach.
+    Returns the ASCII art data file, the artifacts, the SVG image and the PNG image (bytes) (or None if the approach is not implemented).
+    """
+    grid = get_cached_grid(approach, image_hash, width, input_filename)
+    if grid is None:
+        return None
+    artifacts = create_artifacts(grid, approach, image_hash, base_filename, width)
+    # read here, the cached files might be evicted before the tab is rendered
+    svg_image = artifacts.read(FORMAT_SVG) if svg_download_activated else None
+    png_image = artifacts.read(FORMAT_PNG, output_width=output_width) if png_download_activated else None
+    return artifacts.read(FORMAT_TEXT), artifacts, svg_image, png_image
+
+
+def create_low_resolution_preview(approach, image_hash, input_filename, base_filename, width):
+    """
+    Returns the SVG image of the ASCII art with PREVIEW_WIDTH characters per line (or None if the approach is not implemented).
+    It is cheap to create and shown until the full output is ready (only for ASCII art wider than the preview).
+    """
+    grid = get_cached_grid(approach, image_hash, PREVIEW_WIDTH, input_filename)
+    if grid is None:
+        return None
+    return create_artifacts(grid, approach, image_hash, base_filename, PREVIEW_WIDTH).read(FORMAT_SVG)
+
+
 if base_filename is not None and (uploaded_image_file is not None or (download_url is not None and download_url.strip() != "")): # for safety reasons
     
     st.markdown("""<style>
@@ -535,101 +542,126 @@ if base_filename is not None and (uploaded_image_file is not None or (download_u
     if "output_width" not in locals():
         output_width=DEFAULT_OUTPUT_WIDTH
 
-    input_filename_with_colors = base_filename + "_with-colors.png" # TODO: normalize filename
-
-    input_filename_no_colors = base_filename + "_no-colors.png"
-    # --complex
-    input_filename_with_colors_complex = base_filename + "_with-colors-complex.png"
-    input_filename_no_colors_complex = base_filename + "_no-colors-complex.png"
-    # --color-bg
-    input_filename_with_colors_colorbg = base_filename + "_with-colors-colorbg.png"
-    input_filename_with_colors_colorbg_complex = base_filename + "_with-colors-colorbg-complex.png"
-
-    asciiartlib_with_colors_input_filename = base_filename + "_with-colors-asciiartlib.png"
-
-    asciiartlib_no_colors_input_filename = base_filename + "_no-colors-asciiartlib.png"
+    # the hash of the original bytes identifies the image independently of the (per rerun) working directory
+    image_hash = image_size["hash"]
 
     active_ascii_generators = []
     for approach in approaches:
         if approaches[approach]["active"]:
             active_ascii_generators.append(approach)
 
-    save_current_configuration({
+    configuration = {
         "base_filename": base_filename,
-        "original_image_dimensions": image_size,
+        "original_image_dimensions": {"width": image_size["width"], "height": image_size["height"]},
         "original_image_size": os.path.getsize(input_filename),
+        "image_hash": image_hash,
         "active_ascii_generators": active_ascii_generators,
         "svg_download_activated": svg_download_activated,
         "png_download_activated": png_download_activated,
         "characters": width,
         "output_width": output_width,
+        "conversion_cache": get_conversion_cache().stats(),
+        "conversion_pool": get_conversion_pool().stats(),
         "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "timestamp": datetime.now().timestamp()
-    }, base_filename + "_" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    }
+    configuration_filename = base_filename + "_" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    save_current_configuration(configuration, configuration_filename)
     
             
     # dynamically generate the tabs for the selected approaches
     tabs = st.tabs(active_ascii_generators)
-    
-    for i,tab in enumerate(tabs):
-        current_approach = active_ascii_generators[i]
+    tab_placeholders = {}
+    for current_approach, tab in zip(active_ascii_generators, tabs):
         with tab:
-            if current_approach == ascii_image_converter_with_colors:
-                # convert the image to ascii text and ascii image WITH COLORS
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art(
-                    input_filename, input_filename_with_colors, ["--color"], width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-with-colors-{width}.png"
-            elif current_approach == ascii_image_converter_neutral:
-                # convert the image to ascii text and ascii image NO COLORS
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art(
-                    input_filename, input_filename_no_colors, [], width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-no-colors-{width}.png"        
-            elif current_approach == ascii_image_converter_with_colors_complex:
-                # convert the image to ascii text and ascii image WITH COLORS and COMPLEX characters
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art(
-                    input_filename, input_filename_with_colors_complex, ["--color", "--complex"], width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-with-colors-complex-{width}.png"
-            elif current_approach == ascii_image_converter_neutral_complex:
-                # convert the image to ascii text and ascii image NO COLORS and COMPLEX characters
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art(
-                    input_filename, input_filename_no_colors_complex, ["--complex"], width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-no-colors-complex-{width}.png"
-            elif current_approach == ascii_image_converter_with_background_colors:
-                # convert the image to ascii text and ascii image WITH COLORS and COLOR BG
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art(
-                    input_filename, input_filename_with_colors_colorbg, ["--color", "--color-bg"], width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-with-colors-color-bg-{width}.png"
-            elif current_approach == ascii_image_converter_with_background_colors_complex:
-                # convert the image to ascii text and ascii image WITH COLORS and COLOR BG
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art(
-                    input_filename, input_filename_with_colors_colorbg_complex, ["--color", "--color-bg", "--complex"], width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-with-colors-colorbg-complex-{width}.png"
-            elif current_approach == ascii_image_converter_only_background_color:
-                # convert the image to ascii text and ascii image with COLOR BG but remove all characters
-                ascii_art_original, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art(
-                    input_filename, input_filename_with_colors_colorbg, ["--color", "--color-bg"], width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = remove_all_characters_from_ascii_art(
-                    ascii_art_original, svg_filename_ascii_art, width=width, original_image_size=image_size, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-with-colors-colorbg-only-background-{width}.png"
-            elif current_approach == ascii_magic_with_colors:
-                # convert the image to ascii text and ascii image WITH COLORS
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art_asciiartlib(
-                    input_filename, asciiartlib_with_colors_input_filename, width=width, original_image_size=image_size, monochrome=False, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)                
-                filename_download = f"ascii-image-with-colors-ascii-magic-{width}.png"
-            elif current_approach == ascii_magic_neutral:
-                # convert the image to ascii text and ascii image NO COLORS
-                ascii_art, svg_filename_ascii_art, png_filename_ascii_art = convert_image_to_ascii_art_asciiartlib(
-                    input_filename, asciiartlib_no_colors_input_filename, width=width, original_image_size=image_size, monochrome=True, svg_download_activated=svg_download_activated, png_download_activated=png_download_activated, output_width=output_width)
-                filename_download = f"ascii-image-no-colors-ascii-magic-{width}.png"
-            else:
+            tab_placeholders[current_approach] = st.empty()
+            tab_placeholders[current_approach].info(f"Converting the image using the approach '{current_approach}' ...")
+
+    # all active approaches are converted concurrently, each tab is filled as soon as its result arrives;
+    # the cheap previews are queued first, then the full outputs in the order of the tabs (i.e., the visible first tab first)
+    PREVIEW = "preview"
+    FULL = "full"
+    conversion_jobs = {}
+    # narrow ASCII art is as cheap as its preview, it is shown directly
+    if PROGRESSIVE_PREVIEW and width > PREVIEW_WIDTH:
+        for current_approach in active_ascii_generators:
+            conversion_jobs[(current_approach, PREVIEW)] = (
+                create_low_resolution_preview,
+                (current_approach, image_hash, input_filename, base_filename, width),
+                {}
+            )
+    for current_approach in active_ascii_generators:
+        conversion_jobs[(current_approach, FULL)] = (
+            convert_approach_for_preview, 
+            (current_approach, image_hash, input_filename, base_filename), 
+            {
+                "width": width, 
+                "svg_download_activated": svg_download_activated, 
+                "png_download_activated": png_download_activated, 
+                "output_width": output_width
+            }
+        )
+
+    # approaches whose tab shows a preview or the full output
+    previewed_approaches = set()
+    finished_approaches = set()
+
+    # the queue positions are shown while the jobs of a tab without content wait for a free worker of the shared pool
+    queue_positions = {}
+    def show_queue_positions(positions):
+        for (current_approach, kind), position in positions.items():
+            if current_approach in previewed_approaches or current_approach in finished_approaches:
+                continue
+            if kind == FULL and (current_approach, PREVIEW) in positions:
+                continue
+            if queue_positions.get(current_approach, "unknown") != position:
+                queue_positions[current_approach] = position
+                if position is None:
+                    tab_placeholders[current_approach].info(f"Converting the image using the approach '{current_approach}' ...")
+                else:
+                    tab_placeholders[current_approach].info(f"Waiting for a free converter (position {position} in the queue) ...")
+
+    script_run_ctx = get_script_run_ctx()
+    conversion_results = get_conversion_pool().results_as_completed(
+        conversion_jobs, 
+        thread_initializer=lambda thread: add_script_run_ctx(thread, script_run_ctx),
+        session_id=script_run_ctx.session_id if script_run_ctx is not None else None,
+        on_waiting=show_queue_positions
+    )
+
+    for (current_approach, kind), result, exception in conversion_results:
+        if kind == PREVIEW:
+            if exception is not None or result is None or current_approach in finished_approaches:
+                continue
+            previewed_approaches.add(current_approach)
+            with tab_placeholders[current_approach].container():
+                st.info("The full output is still being created, this is a preview with fewer characters per line ...")
+                render_svg(result, width=width, render_scale_pixels=render_scale_pixels, 
+                           caption="Preview with %s characters per line" % PREVIEW_WIDTH)
+            continue
+
+        finished_approaches.add(current_approach)
+        with tab_placeholders[current_approach].container():
+            if exception is not None:
+                st.error(f"Error while converting the image using the approach '{current_approach}': " + str(exception))
+                continue
+            if result is None:
                 st.text("not implemented yet")
+                continue
+            ascii_art, artifacts, svg_image_ascii_art, png_image_ascii_art = result
+            filename_download = f"{approaches[current_approach]['download_filename']}-{width}.png"
+
+            if svg_download_activated and svg_image_ascii_art is None:
+                st.error("SVG image could not be created.")
+            if png_download_activated and png_image_ascii_art is None:
+                st.error("PNG image could not be created." + (" You need inkscape installed to create PNG images." if PNG_RENDERER == "inkscape" else ""))
 
             # show the ascii art and download buttons in all tabs
             show_download_buttons(
                 ascii_art, 
-                svg_filename=svg_filename_ascii_art, 
+                svg_image=svg_image_ascii_art, 
                 svg_download_activated=svg_download_activated,
-                png_filename=png_filename_ascii_art, 
+                png_image=png_image_ascii_art, 
                 png_download_activated=png_download_activated,
                 output_basename=filename_download
             )
@@ -646,14 +678,78 @@ if base_filename is not None and (uploaded_image_file is not None or (download_u
             else:
                 svg_image_col, png_image_col = st.columns([1,1])
 
-            if svg_download_activated and svg_filename_ascii_art is not None:
+            if svg_download_activated and svg_image_ascii_art is not None:
                 with svg_image_col:
-                    render_svg(svg_filename_ascii_art, width=width, render_scale_pixels=render_scale_pixels)
+                    render_svg(svg_image_ascii_art, width=width, render_scale_pixels=render_scale_pixels)
 
-            if png_download_activated and png_filename_ascii_art is not None:
+            if png_download_activated and png_image_ascii_art is not None:
                 with png_image_col:
-                    st.image(png_filename_ascii_art, use_column_width="auto", width=width, caption=f"PNG image with width {output_width}px")
-
+                    st.image(png_image_ascii_art, use_column_width="auto", width=width, caption=f"PNG image with width {output_width}px")
+
+    if METRICS_IN_CONFIGURATION:
+        # saved again after all approaches finished, s.t., the metrics include the stages of this run
+        configuration["metrics"] = METRICS.snapshot()
+        save_current_configuration(configuration, configuration_filename)
+
+    # animated images (GIF, multi-frame TIFF): all frames are converted on request with the approach selected here
+    if image_size.get("frames", 1) > 1 and len(active_ascii_generators) > 0:
+        st.markdown("#### Animation")
+        frame_count = min(image_size["frames"], ANIMATION_MAX_FRAMES)
+        help = f"The image has {image_size['frames']} frames" + (f", the first {ANIMATION_MAX_FRAMES} frames are converted." if image_size["frames"] > ANIMATION_MAX_FRAMES else ".")
+        animation_approach = st.selectbox("Approach used for all frames of the animated image", active_ascii_generators, help=help, key="animation_approach")
+        animation_outputs = {FORMAT_ANSI_SCRIPT: ".sh"}
+        if svg_download_activated:
+            animation_outputs[FORMAT_SVG] = ".svg"
+        if png_download_activated:
+            animation_outputs[FORMAT_PNG] = ".png"
+        # the results are kept in the session, s.t., they survive the reruns caused by the download buttons
+        animation_key = (image_hash, animation_approach, width, output_width, tuple(animation_outputs))
+        animations = st.session_state.setdefault("animations", {})
+        if st.button(f":film_frames: Convert all {frame_count} frames", key="convert_animation"):
+            animation_basename = f"{base_filename}_animation_{image_hash[:12]}_{approaches[animation_approach]['download_filename']}-{width}-{output_width}"
+            animation_outputs = {output_format: animation_basename + extension for output_format, extension in animation_outputs.items()}
+            progress_bar = st.progress(0.0, text=f"Converting {frame_count} frames ...")
+            try:
+                if uploaded_image_file is not None:
+                    mapped_image = map_uploaded_file(uploaded_image_file, get_session_working_dir())
+                else:
+                    mapped_image = get_downloader().fetch_mapped(download_url)
+                with mapped_image as image_data:
+                    animation = convert_animation(
+                        image_data, animation_approach, width, animation_outputs,
+                        executor=get_conversion_pool(), engine=ASCII_ENGINE, ansi_colors=ANSI_DOWNLOAD_COLORS,
+                        output_width=output_width, font_filename=PNG_FONT, max_frames=ANIMATION_MAX_FRAMES, **get_ingestion_limits(),
+                        on_progress=lambda written, total: progress_bar.progress(min(1.0, written / total), text=f"Converted {written} frames ...")
+                    )
+                animations[animation_key] = {
+                    "outputs": animation_outputs,
+                    "summary": f"Converted {animation['frames']} frames ({animation['merged']} identical frames merged)."
+                }
+                progress_bar.empty()
+            except Exception as e:
+                logging.error(f"ERROR: animation could not be converted: {e}")
+                st.error("Error while converting the animated image: " + str(e))
+
+        if animation_key in animations:
+            animation_outputs = animations[animation_key]["outputs"]
+            st.success(animations[animation_key]["summary"])
+            download_filename = f"{approaches[animation_approach]['download_filename']}-{width}-animated"
+            if FORMAT_SVG in animation_outputs:
+                with open(animation_outputs[FORMAT_SVG], "rb") as f:
+                    animation_svg_image = f.read()
+                render_svg(animation_svg_image, width=width, render_scale_pixels=render_scale_pixels,
+                           caption="Animated SVG image with %s characters per line" % width)
+            download_columns = st.columns(len(animation_outputs))
+            labels = {
+                FORMAT_ANSI_SCRIPT: (":ab: Download **terminal animation** (shell script)", "text/x-shellscript"),
+                FORMAT_SVG: (":frame_with_picture: Download **animated SVG image** file", "image/svg+xml"),
+                FORMAT_PNG: (":frame_with_picture: Download **animated PNG image** file", "image/png")
+            }
+            for column, (output_format, filename) in zip(download_columns, animation_outputs.items()):
+                with column:
+                    label, mime = labels[output_format]
+                    st.download_button(label=label, data=open(filename, 'rb').read(), file_name=f"{download_filename}.{output_format}", mime=mime,
+                                       key=f"animation_download_{output_format}")
 
 st.markdown("""
 ---
@@ -662,9 +758,7 @@ Brought to you by the [<img style="height:3ex;border:0" src="https://avatars.git
 See our [GitHub team page](http://wse.technology/) for more projects and tools.
 """, unsafe_allow_html=True)
 
-with open("js/change_menu.js", "r") as f:
-    javascript = f.read()
-    html(f"<script style='display:none'>{javascript}</script>")
+html(f"<script style='display:none'>{read_static_file('js/change_menu.js')}</script>")
 
 html("""
 <script>
@@ -0,0 +1,107 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+from PIL import Image
+
+from ascii_engine import load_rgb_array, get_cell_statistics
+from metrics import METRICS
+
+# the working copies for the external ascii-image-converter binary keep this many pixels per character
+EXTERNAL_PIXELS_PER_CHARACTER = 8
+
+
+class ImageContext:
+    """
+    The decoded input image, shared by all approaches and widths of one image.
+
+    The image file is decoded once; the normalized RGB array, the cell statistics and the downscaled
+    working copies for the external binary (small temporary PNG files, one per width) are created on
+    first use. close() (or leaving the with block) releases the temporary files; a context that is just
+    dropped (e.g., evicted from a cache) releases them as soon as it is garbage collected.
+    An already decoded Pillow image (e.g., a frame of an animation) can be given instead of the filename.
+    """
+
+    def __init__(self, image_filename=None, image=None):
+        self.image_filename = image_filename
+        if image is not None:
+            self.image = image
+        else:
+            with METRICS.span("decode"):
+                with Image.open(image_filename) as opened_image:
+                    opened_image.load()
+                    self.image = opened_image.copy()
+        self._rgb = None
+        self._statistics = None
+        self._working_filenames = {}
+        self._directory = None
+        self._finalizer = None
+        self._lock = threading.Lock()
+
+    @property
+    def width(self):
+        return self.image.width
+
+    @property
+    def height(self):
+        return self.image.height
+
+    @property
+    def rgb(self):
+        """
+        The image as RGB uint8 array (transparent pixels composed onto black).
+        """
+        with self._lock:
+            if self._rgb is None:
+                self._rgb = load_rgb_array(self.image)
+            return self._rgb
+
+    @property
+    def statistics(self):
+        """
+        The cell statistics of the image, used by the built-in engine for all widths.
+        """
+        rgb = self.rgb
+        with self._lock:
+            if self._statistics is None:
+                self._statistics = get_cell_statistics(rgb)
+            return self._statistics
+
+    def get_working_filename(self, width):
+        """
+        Returns the filename of a copy of the image with EXTERNAL_PIXELS_PER_CHARACTER pixels per character
+        of the given width (or the original file if it is not larger), e.g., for the external binary.
+        """
+        max_width = width * EXTERNAL_PIXELS_PER_CHARACTER
+        if self.image.width <= max_width and self.image_filename is not None:
+            return self.image_filename
+        with self._lock:
+            if width not in self._working_filenames:
+                if self._directory is None:
+                    self._directory = tempfile.mkdtemp(prefix="ascii-art-image-")
+                    self._finalizer = weakref.finalize(self, shutil.rmtree, self._directory, ignore_errors=True)
+                filename = os.path.join(self._directory, f"width_{width}.png")
+                max_width = min(max_width, self.image.width)
+                height = max(1, round(self.image.height * max_width / self.image.width))
+                self.image.resize((max_width, height), Image.Resampling.BOX).save(filename, compress_level=1)
+                logging.info(f"image context: created working copy {filename} ({max_width}x{height} pixels)")
+                self._working_filenames[width] = filename
+            return self._working_filenames[width]
+
+    def close(self):
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._working_filenames = {}
+            self._directory = None
+            self._finalizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+from contextlib import nullcontext
+from io import BytesIO
+
+from PIL import Image
+
+from metrics import METRICS
+
+DEFAULT_MAX_PIXELS = 100_000_000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_WIDTH = 1200
+# the working copy has at most as many pixels as max_width x (WORKING_PIXELS_FACTOR * max_width), s.t., very tall images
+# are downscaled as well (the cell statistics of the decoded image need several bytes per pixel)
+WORKING_PIXELS_FACTOR = 4
+# uncompressed images are read in strips of about this size (instead of decoding the whole image at once)
+STRIP_BYTES = 4 * 1024 * 1024
+
+
+class ImageBudgetExceededError(ValueError):
+    """
+    Raised if an image exceeds the byte or pixel budget of the ingestion (e.g., decompression bombs).
+    """
+
+
+def map_file(filename):
+    """
+    Returns the content of the file as read-only memory map (to be used in a with statement), s.t., uncompressed images
+    are read strip by strip by the ingestion instead of loading the whole file. Empty files are returned as empty bytes.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return nullcontext(b"")
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def check_byte_budget(data, max_bytes):
+    if len(data) > max_bytes:
+        raise ImageBudgetExceededError(f"the image file is too large ({len(data)} bytes, allowed: {max_bytes} bytes)")
+
+
+def open_image(data, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Opens the image without decoding it and checks the pixel budget using the header information.
+    """
+    # a memory-mapped file is read directly, bytes are wrapped without copying them
+    image = Image.open(data if hasattr(data, "read") else BytesIO(data))
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageBudgetExceededError(f"the image is too large ({width}x{height} pixels, allowed: {max_pixels} pixels)")
+    return image
+
+
+def get_raw_strips(image):
+    """
+    Returns the layout of uncompressed pixel data stored in strips of the full width as list of
+    (first row, end row, file offset, raw mode, bytes per row, orientation) or None if the image is stored differently.
+    """
+    # images created in memory (e.g., copies of animation frames) have no tiles
+    tiles = getattr(image, "tile", None)
+    if not tiles or image.mode not in ("1", "L", "LA", "I;16", "RGB", "RGBA", "RGBX", "CMYK"):
+        return None
+    strips = []
+    for tile in sorted(tiles, key=lambda tile: tile[1][1]):
+        decoder, extents, offset, args = tile[:4]
+        if decoder != "raw" or extents[0] != 0 or extents[2] != image.width:
+            return None
+        if not isinstance(args, tuple):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if stride == 0:
+            # tightly packed rows, only known for raw modes that are image modes as well
+            try:
+                stride = len(Image.new(rawmode, (image.width, 1)).tobytes())
+            except ValueError:
+                return None
+        if orientation not in (1, -1):
+            return None
+        strips.append((extents[1], extents[3], offset, rawmode, stride, orientation))
+    return strips or None
+
+
+def reduce_strips(image, strips, factor):
+    """
+    Reduces the image by the given integer factor (like Image.reduce) while reading just a band of a few rows
+    of the uncompressed pixel data at a time from the (memory-mapped) file. Each band is a multiple of factor
+    rows high, s.t., it is reduced independently of the other bands.
+    """
+    width, height = image.size
+    mode = "RGBA" if image.mode in ("LA", "RGBA") else "RGB"
+    reduced = Image.new(mode, (-(-width // factor), -(-height // factor)))
+    band_height = max(1, STRIP_BYTES // max(stride for _, _, _, _, stride, _ in strips) // factor) * factor
+
+    for band_start in range(0, height, band_height):
+        band_end = min(height, band_start + band_height)
+        band = Image.new(mode, (width, band_end - band_start))
+        for first_row, end_row, offset, rawmode, stride, orientation in strips:
+            start, end = max(first_row, band_start), min(end_row, band_end)
+            if start >= end:
+                continue
+            # rows stored bottom-up (orientation -1) start at the end of the strip
+            image.fp.seek(offset + ((start - first_row) if orientation == 1 else (end_row - end)) * stride)
+            rows = Image.frombytes(image.mode, (width, end - start), image.fp.read((end - start) * stride), "raw", rawmode, stride, orientation)
+            band.paste(convert_to_rgb(rows), (0, start - band_start))
+        reduced.paste(band.reduce(factor), (0, band_start // factor))
+
+    logging.info(f"reduced {width}x{height} pixels in bands of {band_height} rows to {reduced.width}x{reduced.height} pixels")
+    return reduced
+
+def get_reduction_factor(width, height, max_width):
+    """
+    Returns the integer factor the image is reduced by: it keeps a width of at least max_width pixels (if the image is wider)
+    and at most WORKING_PIXELS_FACTOR * max_width^2 pixels in total (for very tall images).
+    """
+    max_working_pixels = WORKING_PIXELS_FACTOR * max_width * max_width
+    return max(1, width // max_width, math.ceil(math.sqrt(width * height / max_working_pixels)))
+
+
+def decode_downscaled(image, max_width):
+    """
+    Decodes the image at a resolution of at least max_width pixels (if it is wider) and with a bounded number of pixels.
+    JPEG images are decoded directly at a reduced scale (draft mode), other formats are reduced by an integer factor.
+    Uncompressed images (e.g., TIFF, BMP, PPM) are read and reduced strip by strip, s.t., the memory
+    depends on the reduced size instead of the size of the original image.
+    """
+    width, height = image.size
+    factor = get_reduction_factor(width, height, max_width)
+    if factor >= 2:
+        strips = get_raw_strips(image)
+        if strips is not None:
+            return reduce_strips(image, strips, factor)
+        # draft keeps a scale with at least the requested size, only supported by JPEG (no-op otherwise)
+        image.draft("RGB", (max(1, width // factor), max(1, height // factor)))
+    image.load()
+    # converted before reducing: Image.reduce does not support palette, 1-bit and 16-bit images (and would average palette indices)
+    image = convert_to_rgb(image)
+    factor = get_reduction_factor(image.width, image.height, max_width)
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def convert_to_rgb(image):
+    """
+    Returns the image in the RGB mode (or RGBA if it has transparency).
+    """
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    has_transparency = image.mode in ("LA", "PA", "La") or "transparency" in image.info
+    if image.mode == "La":
+        # premultiplied alpha cannot be converted to RGBA directly
+        image = image.convert("LA")
+    elif image.mode.startswith("I;16"):
+        # 16-bit values are scaled to 8 bits (instead of clipping them)
+        image = image.convert("I").point(lambda value: value / 256).convert("L")
+    return image.convert("RGBA" if has_transparency else "RGB")
+
+
+def ingest_image(data, output_filename, max_width=DEFAULT_MAX_WIDTH, max_pixels=DEFAULT_MAX_PIXELS, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Decodes the image bytes with bounded memory and stores a downscaled PNG version as working copy.
+    The original bytes are just used for hashing.
+    Returns the original dimensions, the number of frames (of animated images, just the first one is stored)
+    and the SHA-256 hash of the original bytes.
+    """
+    with METRICS.span("ingest") as span:
+        check_byte_budget(data, max_bytes)
+        image = open_image(data, max_pixels)
+        original_width, original_height = image.size
+        frames = getattr(image, "n_frames", 1)
+        image = decode_downscaled(image, max_width)
+        image.save(output_filename, compress_level=1)
+        span.set_output_file(output_filename)
+    logging.info(f"ingested image of {original_width}x{original_height} pixels as {image.width}x{image.height} pixels to {output_filename}")
+    return {
+        "width": original_width,
+        "height": original_height,
+        "frames": frames,
+        "hash": hashlib.sha256(data).hexdigest()
+    }
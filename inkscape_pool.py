@@ -0,0 +1,179 @@
+import logging
+import os
+import queue
+import select
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+
+SHELL_PROMPT = b"> "
+# the characters that would break the action list of the Inkscape shell
+UNSUPPORTED_FILENAME_CHARACTERS = (";", "\n", "\r")
+
+
+class InkscapeShell:
+    """
+    One long-lived "inkscape --shell" process that receives export actions over stdin.
+    """
+
+    def __init__(self, inkscape_path, startup_timeout):
+        self.inkscape_path = inkscape_path
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [self.inkscape_path, "--shell"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self._read_until_prompt(self.startup_timeout)
+        logging.info(f"inkscape pool: started shell process {self.process.pid}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _read_until_prompt(self, timeout):
+        deadline = time.monotonic() + timeout
+        output = b""
+        while not output.endswith(SHELL_PROMPT):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"inkscape shell did not respond within {timeout} seconds")
+            readable, _, _ = select.select([self.process.stdout], [], [], remaining)
+            if not readable:
+                continue
+            chunk = os.read(self.process.stdout.fileno(), 4096)
+            if not chunk:
+                raise RuntimeError("inkscape shell terminated unexpectedly")
+            output += chunk
+        return output
+
+    def execute(self, actions, timeout):
+        """
+        Sends one line of actions and waits until the shell is ready again.
+        """
+        self.process.stdin.write(actions.encode("utf-8") + b"\n")
+        self.process.stdin.flush()
+        return self._read_until_prompt(timeout)
+
+    def health_check(self, timeout):
+        try:
+            self.execute("", timeout)
+            return True
+        except (OSError, RuntimeError, TimeoutError):
+            return False
+
+
+class InkscapePool:
+    """
+    A small pool of persistent Inkscape shell processes for exporting SVG images as PNG images.
+
+    Each worker thread owns one shell process. Export jobs that arrive within batch_window
+    seconds are sent to the process in one round trip (e.g., the PNG images of all approaches
+    of one upload). Crashed or unresponsive processes are restarted, and idle processes are
+    health checked every health_check_interval seconds.
+    """
+
+    def __init__(self, inkscape_path, workers=2, job_timeout=60, batch_size=9, batch_window=0.05, health_check_interval=60, startup_timeout=60):
+        self.inkscape_path = inkscape_path
+        self.job_timeout = job_timeout
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.health_check_interval = health_check_interval
+        self.startup_timeout = startup_timeout
+        self._jobs = queue.Queue()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"inkscape-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, svg_filename, png_filename, output_width):
+        """
+        Schedules the export and returns a future of the PNG filename.
+        """
+        future = Future()
+        if any(c in svg_filename + png_filename for c in UNSUPPORTED_FILENAME_CHARACTERS):
+            future.set_exception(ValueError(f"filename not supported by the inkscape shell: {svg_filename}"))
+            return future
+        self._jobs.put((svg_filename, png_filename, output_width, future))
+        return future
+
+    def export(self, svg_filename, png_filename, output_width):
+        return self.submit(svg_filename, png_filename, output_width).result()
+
+    def _next_batch(self):
+        batch = [self._jobs.get(timeout=self.health_check_interval)]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        shell = None
+        while True:
+            try:
+                batch = self._next_batch()
+            except queue.Empty:
+                if shell is not None and not shell.health_check(self.startup_timeout):
+                    logging.warning("inkscape pool: health check failed, restarting shell process")
+                    shell.stop()
+                    shell = None
+                continue
+
+            try:
+                if shell is None:
+                    shell = InkscapeShell(self.inkscape_path, self.startup_timeout)
+                elif not shell.is_alive():
+                    logging.warning("inkscape pool: shell process crashed, restarting")
+                    shell.restart()
+                self._export_batch(shell, batch)
+            except Exception as e:
+                logging.error(f"inkscape pool: export of {len(batch)} images failed: {e}")
+                if shell is not None:
+                    shell.stop()
+                    shell = None
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _export_batch(self, shell, batch):
+        actions = []
+        for svg_filename, png_filename, output_width, _ in batch:
+            # remove outdated images, s.t., a failed export is detected
+            if os.path.isfile(png_filename):
+                os.remove(png_filename)
+            actions += [
+                f"file-open:{svg_filename}",
+                f"export-filename:{png_filename}",
+                f"export-width:{output_width}",
+                "export-do",
+                "file-close"
+            ]
+        started = time.monotonic()
+        shell.execute(";".join(actions), self.job_timeout * len(batch))
+        logging.info(f"inkscape pool: exported {len(batch)} images in {time.monotonic() - started:.2f}s")
+
+        for _, png_filename, _, future in batch:
+            if os.path.isfile(png_filename):
+                future.set_result(png_filename)
+            else:
+                future.set_exception(RuntimeError(f"inkscape did not create {png_filename}"))
@@ -0,0 +1,245 @@
+import functools
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds (seconds) of the duration histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRIC_PREFIX = "ascii_art"
+
+
+def get_peak_rss_bytes():
+    # the high-water mark of the resident set size of this process (ru_maxrss is in kilobytes on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Span:
+    """
+    The measurement of one execution of a pipeline stage, the stage may add its output size and cache result.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.output_bytes = None
+        self.cache_hit = None
+
+    def set_output_file(self, filename):
+        if filename is not None and os.path.isfile(filename):
+            self.output_bytes = os.path.getsize(filename)
+
+
+class StageMetrics:
+    def __init__(self, buckets):
+        self.count = 0
+        self.errors = 0
+        self.bucket_counts = [0] * len(buckets)
+        self.wall_seconds = 0.0
+        self.max_wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.output_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class Metrics:
+    """
+    Process-wide timing and resource metrics of the pipeline stages (ingestion, conversion, rendering).
+
+    Each execution of a stage is measured by a span: wall time, CPU time of the executing thread
+    (plus the CPU time of finished child processes for stages running subprocesses), its output bytes
+    and whether it was a cache hit. The peak RSS is reported for the whole process only, as the stages run
+    concurrently in its threads (the benchmarks measure the peak RSS of each stage in a process of its own).
+    The metrics are exported in the Prometheus text format (counters and a duration histogram) or as a snapshot dictionary.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _get_stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = StageMetrics(self.buckets)
+        return self._stages[stage]
+
+    @contextmanager
+    def span(self, stage, subprocess=False):
+        """
+        Measures the enclosed code as one execution of the given stage, e.g.:
+
+            with METRICS.span("svg") as span:
+                ...
+                span.set_output_file(svg_filename)
+        """
+        span = Span(stage)
+        failed = False
+        started = time.perf_counter()
+        started_cpu = time.thread_time()
+        # the children's CPU time is process-wide, concurrent subprocess stages share it (approximation)
+        started_children_cpu = get_children_cpu_seconds() if subprocess else 0.0
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            wall_seconds = time.perf_counter() - started
+            cpu_seconds = time.thread_time() - started_cpu
+            if subprocess:
+                cpu_seconds += get_children_cpu_seconds() - started_children_cpu
+            self._record(span, wall_seconds, cpu_seconds, failed)
+
+    def stage(self, stage, subprocess=False):
+        """
+        Decorator measuring each call of the function as span of the given stage; a returned filename is counted as output.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage, subprocess=subprocess) as span:
+                    result = function(*args, **kwargs)
+                    if isinstance(result, str):
+                        span.set_output_file(result)
+                    return result
+            return wrapper
+        return decorator
+
+    def _record(self, span, wall_seconds, cpu_seconds, failed):
+        with self._lock:
+            metrics = self._get_stage(span.stage)
+            metrics.count += 1
+            if failed:
+                metrics.errors += 1
+            for i, bound in enumerate(self.buckets):
+                if wall_seconds <= bound:
+                    metrics.bucket_counts[i] += 1
+            metrics.wall_seconds += wall_seconds
+            metrics.max_wall_seconds = max(metrics.max_wall_seconds, wall_seconds)
+            metrics.cpu_seconds += cpu_seconds
+            metrics.output_bytes += span.output_bytes or 0
+            if span.cache_hit is not None:
+                self._count_cache(metrics, span.cache_hit)
+
+    @staticmethod
+    def _count_cache(metrics, hit):
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+    def record_cache(self, stage, hit):
+        """
+        Counts a cache lookup that is not measured by a span (e.g., of the conversion cache).
+        """
+        with self._lock:
+            self._count_cache(self._get_stage(stage), hit)
+
+    def snapshot(self):
+        """
+        Returns the current metrics per stage as dictionary (e.g., for the configuration JSON file).
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": metrics.count,
+                    "errors": metrics.errors,
+                    "wall_seconds": round(metrics.wall_seconds, 6),
+                    "max_wall_seconds": round(metrics.max_wall_seconds, 6),
+                    "cpu_seconds": round(metrics.cpu_seconds, 6),
+                    "output_bytes": metrics.output_bytes,
+                    "cache_hits": metrics.cache_hits,
+                    "cache_misses": metrics.cache_misses
+                }
+                for stage, metrics in sorted(self._stages.items())
+            }
+        return {"peak_rss_bytes": get_peak_rss_bytes(), "stages": stages}
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        name = METRIC_PREFIX + "_stage"
+        lines = [
+            f"# HELP {name}_duration_seconds Wall time of the pipeline stages.",
+            f"# TYPE {name}_duration_seconds histogram"
+        ]
+        counters = {
+            "cpu_seconds_total": ("CPU time of the pipeline stages (including finished subprocesses).", "cpu_seconds"),
+            "output_bytes_total": ("Bytes produced by the pipeline stages.", "output_bytes"),
+            "errors_total": ("Failed executions of the pipeline stages.", "errors")
+        }
+        with self._lock:
+            stages = sorted(self._stages.items())
+            # stages just counting cache lookups have no spans
+            measured_stages = [(stage, metrics) for stage, metrics in stages if metrics.count > 0]
+            for stage, metrics in measured_stages:
+                labels = f'stage="{stage}"'
+                for bound, count in zip(self.buckets, metrics.bucket_counts):
+                    lines.append(f'{name}_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}')
+                lines.append(f"{name}_duration_seconds_sum{{{labels}}} {metrics.wall_seconds}")
+                lines.append(f"{name}_duration_seconds_count{{{labels}}} {metrics.count}")
+
+            for suffix, (help_text, attribute) in counters.items():
+                lines.append(f"# HELP {name}_{suffix} {help_text}")
+                lines.append(f"# TYPE {name}_{suffix} counter")
+                for stage, metrics in measured_stages:
+                    lines.append(f'{name}_{suffix}{{stage="{stage}"}} {getattr(metrics, attribute)}')
+
+            lines.append(f"# HELP {METRIC_PREFIX}_cache_requests_total Cache lookups of the pipeline stages.")
+            lines.append(f"# TYPE {METRIC_PREFIX}_cache_requests_total counter")
+            for stage, metrics in stages:
+                if metrics.cache_hits or metrics.cache_misses:
+                    lines.append(f'{METRIC_PREFIX}_cache_requests_total{{stage="{stage}",result="hit"}} {metrics.cache_hits}')
+                    lines.append(f'{METRIC_PREFIX}_cache_requests_total{{stage="{stage}",result="miss"}} {metrics.cache_misses}')
+
+        lines.append(f"# HELP {METRIC_PREFIX}_process_peak_rss_bytes Peak resident set size of the process.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_process_peak_rss_bytes gauge")
+        lines.append(f"{METRIC_PREFIX}_process_peak_rss_bytes {get_peak_rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+# the metrics of this process, shared by all modules of the pipeline
+METRICS = Metrics()
+
+
+def start_metrics_server(port, address="127.0.0.1", metrics=METRICS):
+    """
+    Serves the metrics in the Prometheus text format at http://<address>:<port>/metrics (in a daemon thread).
+    Returns the server or None if it could not be started (e.g., the port is already in use).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((address, port), MetricsHandler)
+    except OSError as e:
+        logging.error(f"ERROR: metrics endpoint could not be started on {address}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"metrics endpoint: http://{address}:{port}/metrics")
+    return server
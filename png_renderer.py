@@ -0,0 +1,119 @@
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from metrics import METRICS
+from svg_renderer import CHARACTER_WIDTH, LINE_HEIGHT, FONT_SIZE, BASELINE_OFFSET, DEFAULT_FOREGROUND
+
+DEFAULT_FONT_FILENAME = "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf"
+
+# the glyph atlas contains the printable ASCII characters, all other characters are rendered as "?"
+FIRST_GLYPH = 32
+LAST_GLYPH = 126
+UNKNOWN_GLYPH = ord("?")
+
+# number of character rows rendered per job
+ROWS_PER_BAND = 8
+
+
+def hex_to_rgb(color):
+    return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+
+
+@lru_cache(maxsize=16)
+def load_font(font_filename, size):
+    try:
+        return ImageFont.truetype(font_filename, size)
+    except OSError:
+        logging.warning(f"font {font_filename} not found, using the default font of Pillow")
+        return ImageFont.load_default(size)
+
+
+@lru_cache(maxsize=16)
+def get_glyph_atlas(font_filename, cell_width, cell_height):
+    """
+    Pre-rasterizes the printable ASCII characters into coverage masks of one character cell.
+    Returns an uint16 array of shape (128, cell_height, cell_width) with values from 0 to 255.
+    """
+    scale = cell_height / LINE_HEIGHT
+    font = load_font(font_filename, max(1, round(FONT_SIZE * scale)))
+    baseline = BASELINE_OFFSET * scale
+    atlas = np.zeros((128, cell_height, cell_width), dtype=np.uint16)
+    for code in range(FIRST_GLYPH + 1, LAST_GLYPH + 1):
+        glyph = Image.new("L", (cell_width, cell_height), 0)
+        ImageDraw.Draw(glyph).text((cell_width / 2, baseline), chr(code), fill=255, font=font, anchor="ms")
+        atlas[code] = np.asarray(glyph, dtype=np.uint16)
+    return atlas
+
+
+def get_cell_arrays(grid):
+    """
+    Returns the character codes of the glyph atlas, the foreground colors and the background colors (RGBA) of the grid.
+    """
+    codes = grid.codes.copy()
+    codes[(codes < FIRST_GLYPH) | (codes > LAST_GLYPH)] = UNKNOWN_GLYPH
+    foreground = np.where(grid.has_foreground[:, :, np.newaxis], grid.foreground, hex_to_rgb(DEFAULT_FOREGROUND)).astype(np.uint16)
+    background = np.zeros(grid.background.shape[:2] + (4,), dtype=np.uint16)
+    background[:, :, :3] = grid.background
+    background[:, :, 3] = np.where(grid.has_background, 255, 0)
+    return codes.astype(np.uint8), foreground, background
+
+
+def compose_band(atlas, codes, foreground, background):
+    """
+    Composes the pixels of some character rows: the glyph coverage blends the foreground over the background.
+    """
+    rows, columns = codes.shape
+    _, cell_height, cell_width = atlas.shape
+    coverage = atlas[codes][..., np.newaxis]  # rows x columns x cell_height x cell_width x 1
+    fg = np.concatenate([foreground, np.full((rows, columns, 1), 255, dtype=np.uint16)], axis=2)[:, :, np.newaxis, np.newaxis, :]
+    # transparent backgrounds take the foreground color, s.t., anti-aliased glyph edges are not darkened
+    background = background.copy()
+    transparent = background[:, :, 3] == 0
+    background[transparent, :3] = foreground[transparent]
+    bg = background[:, :, np.newaxis, np.newaxis, :]
+    pixels = (fg * coverage + bg * (255 - coverage) + 127) // 255
+    return pixels.transpose(0, 2, 1, 3, 4).reshape(rows * cell_height, columns * cell_width, 4).astype(np.uint8)
+
+
+def render_image(grid, output_width, font_filename=DEFAULT_FONT_FILENAME, max_workers=None):
+    """
+    Renders the ASCII art (a CellGrid) as RGBA Pillow image with exactly output_width pixels.
+    The height follows the aspect ratio of the SVG image, the background is transparent.
+    """
+    codes, foreground, background = get_cell_arrays(grid)
+    rows, columns = codes.shape
+    output_height = max(1, round(output_width * (rows * LINE_HEIGHT) / (columns * CHARACTER_WIDTH)))
+
+    # render with integer cell sizes at least as large as the output, then scale to the exact output width
+    cell_width = max(1, math.ceil(output_width / columns))
+    cell_height = max(1, round(cell_width * LINE_HEIGHT / CHARACTER_WIDTH))
+    atlas = get_glyph_atlas(font_filename, cell_width, cell_height)
+
+    bands = range(0, rows, ROWS_PER_BAND)
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        parts = list(executor.map(lambda start: compose_band(
+            atlas,
+            codes[start:start + ROWS_PER_BAND],
+            foreground[start:start + ROWS_PER_BAND],
+            background[start:start + ROWS_PER_BAND]
+        ), bands))
+
+    image = Image.fromarray(np.concatenate(parts, axis=0), "RGBA")
+    if image.size != (output_width, output_height):
+        image = image.resize((output_width, output_height), Image.Resampling.LANCZOS)
+    return image
+
+
+@METRICS.stage("png")
+def render_png(grid, png_filename, output_width, font_filename=DEFAULT_FONT_FILENAME, max_workers=None):
+    """
+    Renders the ASCII art (a CellGrid) as PNG image with exactly output_width pixels (see render_image).
+    """
+    render_image(grid, output_width, font_filename=font_filename, max_workers=max_workers).save(png_filename)
+    return png_filename
@@ -0,0 +1,41 @@
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller executes the function,
+    the other callers wait for it and get the same result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, function, *args, **kwargs):
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                in_flight = {"event": threading.Event(), "result": None, "error": None}
+                self._in_flight[key] = in_flight
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            in_flight["event"].wait()
+            if in_flight["error"] is not None:
+                raise in_flight["error"]
+            return in_flight["result"]
+
+        try:
+            in_flight["result"] = function(*args, **kwargs)
+            return in_flight["result"]
+        except Exception as e:
+            in_flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight["event"].set()
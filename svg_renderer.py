@@ -0,0 +1,103 @@
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from metrics import METRICS
+
+# the dimensions of a character cell, the same as used by rich/ansitoimg before
+CHARACTER_WIDTH = 12.2
+LINE_HEIGHT = 24.4
+FONT_SIZE = 20
+BASELINE_OFFSET = 20
+FONT_FAMILY = "Fira Code, monospace"
+
+# the default foreground color of the "One Dark" terminal theme (previously used by ansitoimg)
+DEFAULT_FOREGROUND = "#abb2bf"
+
+
+def rgb_to_hex(color):
+    return "#%02x%02x%02x" % color
+
+
+def get_svg_dimensions(grid):
+    return grid.columns * CHARACTER_WIDTH, grid.rows * LINE_HEIGHT
+
+
+def get_palette(grid, palette=None):
+    """
+    Assigns a short CSS class name to each distinct color of the grid (in order of appearance).
+    If a palette is given, just the new colors are added to it (e.g., for the frames of an animation).
+    """
+    if palette is None:
+        palette = {}
+    for runs in grid.get_color_runs():
+        for _, _, foreground, background in runs:
+            for color in (foreground, background):
+                if color is not None and color not in palette:
+                    palette[color] = "c" + np.base_repr(len(palette), 36).lower()
+    return palette
+
+
+def write_style(out, palette, colors=None):
+    """
+    Writes the style element defining the font and the CSS classes of the given colors (default: all colors of the palette).
+    """
+    out.write("<style>\n")
+    if colors is None:
+        out.write(f"text {{ font-family: {FONT_FAMILY}; font-size: {FONT_SIZE}px; white-space: pre; fill: {DEFAULT_FOREGROUND} }}\n")
+        out.write("path { shape-rendering: crispEdges }\n")
+        colors = palette.keys()
+    out.write("".join(f".{palette[color]}{{fill:{rgb_to_hex(color)}}}\n" for color in colors))
+    out.write("</style>\n")
+
+
+def write_grid(out, grid, palette):
+    """
+    Writes the background paths and the text elements of the grid, the colors are referenced by their CSS classes.
+    """
+    backgrounds = {}
+    for row, runs in enumerate(grid.get_color_runs()):
+        for start, end, _, background in runs:
+            if background is not None:
+                backgrounds.setdefault(palette[background], []).append(f"M{start} {row}h{end - start}v1h{start - end}z")
+
+    if backgrounds:
+        out.write(f'<g transform="scale({CHARACTER_WIDTH} {LINE_HEIGHT})">\n')
+        for name, subpaths in backgrounds.items():
+            out.write(f'<path class="{name}" d="{"".join(subpaths)}"/>\n')
+        out.write("</g>\n")
+
+    text_width = grid.columns * CHARACTER_WIDTH
+    for row, segments in enumerate(grid.iter_segments()):
+        if all(text.strip() == "" for _, text, _, _ in segments):
+            continue
+        out.write(f'<text y="{row * LINE_HEIGHT + BASELINE_OFFSET:.1f}" textLength="{text_width:.1f}" xml:space="preserve">')
+        for _, text, foreground, _ in segments:
+            if foreground is None or text.strip() == "":
+                out.write(escape(text))
+            else:
+                out.write(f'<tspan class="{palette[foreground]}">{escape(text)}</tspan>')
+        out.write("</text>\n")
+
+
+@METRICS.stage("svg")
+def write_svg(grid, svg_filename, title=None):
+    """
+    Writes the ASCII art (a CellGrid) as frame-free SVG image (transparent background, no console decoration).
+
+    To keep the file small, the colors are defined once as CSS classes, horizontal runs of the same color
+    are merged into one element and all background runs of one color are drawn by one path (in cell units).
+    Each line is one text element whose colored runs are tspans.
+    """
+    svg_width, svg_height = get_svg_dimensions(grid)
+    palette = get_palette(grid)
+
+    with open(svg_filename, "w", encoding="utf-8") as out:
+        out.write(f'<svg viewBox="0 0 {svg_width:.1f} {svg_height:.1f}" xmlns="http://www.w3.org/2000/svg">\n')
+        if title is not None:
+            out.write(f"<title>{escape(title)}</title>\n")
+        write_style(out, palette)
+        write_grid(out, grid, palette)
+        out.write("</svg>\n")
+
+    return svg_filename
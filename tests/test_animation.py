@@ -0,0 +1,147 @@
+"""
+Frame decoding, merging of identical frames and the output files of the animation conversion.
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import xml.etree.ElementTree as ElementTree
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from animation import convert_animation, iter_frames, ANSI_SCRIPT_FRAME_DELIMITER, DEFAULT_FRAME_DURATION, FORMAT_ANSI_SCRIPT  # noqa: E402
+from approaches import ascii_image_converter_with_background_colors  # noqa: E402
+from artifacts import FORMAT_PNG, FORMAT_SVG  # noqa: E402
+
+RED, GREEN, BLUE = (255, 0, 0), (0, 255, 0), (0, 0, 255)
+FRAME_SIZE = (40, 20)
+# the frames are downscaled to this width, s.t., frames differing in single pixels become identical
+MAX_WIDTH = 10
+WIDTH = 10
+SVG_NAMESPACE = "{http://www.w3.org/2000/svg}"
+
+
+def create_frame(color, changed_pixel=None):
+    frame = Image.new("RGB", FRAME_SIZE, color)
+    if changed_pixel is not None:
+        frame.putpixel((0, 0), changed_pixel)
+    return frame
+
+
+def encode_animation(frames, image_format, **params):
+    data = BytesIO()
+    frames[0].save(data, image_format, save_all=True, append_images=frames[1:], **params)
+    return data.getvalue()
+
+
+@pytest.fixture
+def gif_data():
+    # Pillow merges the two identical blue frames when saving, the red frames differ in one pixel (identical after downscaling)
+    frames = [create_frame(RED), create_frame(RED, changed_pixel=(250, 0, 0)), create_frame(GREEN), create_frame(BLUE), create_frame(BLUE)]
+    data = encode_animation(frames, "GIF", duration=[100, 50, 120, 100, 70], loop=0)
+    assert Image.open(BytesIO(data)).n_frames == 4
+    return data
+
+
+def get_colors_and_durations(frames):
+    return [(frame.convert("RGB").getpixel((frame.width // 2, frame.height // 2)), duration) for frame, duration in frames]
+
+
+def test_merges_identical_frames(gif_data):
+    frames = list(iter_frames(gif_data, max_width=MAX_WIDTH))
+
+    assert get_colors_and_durations(frames) == [(RED, 150), (GREEN, 120), (BLUE, 170)]
+    assert all(frame.width == MAX_WIDTH for frame, _ in frames)
+
+
+def test_merges_identical_frames_without_durations():
+    data = encode_animation([create_frame(RED), create_frame(RED), create_frame(GREEN)], "TIFF")
+
+    frames = list(iter_frames(data, max_width=MAX_WIDTH))
+
+    assert get_colors_and_durations(frames) == [(RED, 2 * DEFAULT_FRAME_DURATION), (GREEN, DEFAULT_FRAME_DURATION)]
+
+
+def test_reads_at_most_max_frames(gif_data):
+    frames = list(iter_frames(gif_data, max_width=MAX_WIDTH, max_frames=3))
+
+    assert get_colors_and_durations(frames) == [(RED, 150), (GREEN, 120)]
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    return {
+        FORMAT_ANSI_SCRIPT: str(tmp_path / "animation.sh"),
+        FORMAT_SVG: str(tmp_path / "animation.svg"),
+        FORMAT_PNG: str(tmp_path / "animation.png")
+    }
+
+
+def convert(data, outputs, **kwargs):
+    return convert_animation(data, ascii_image_converter_with_background_colors, WIDTH, outputs, output_width=200, max_width=MAX_WIDTH, **kwargs)
+
+
+def test_writes_all_formats(gif_data, outputs):
+    progress = []
+
+    result = convert(gif_data, outputs, window=2, on_progress=lambda written, total: progress.append((written, total)))
+
+    assert result == {"frames": 3, "merged": 1}
+    assert progress == [(1, 4), (2, 4), (3, 4)]
+    assert_ansi_script(outputs[FORMAT_ANSI_SCRIPT], ["0.150", "0.120", "0.170"])
+    assert_svg_animation(outputs[FORMAT_SVG], ["0.150s", "0.120s", "0.170s"])
+    assert_apng(outputs[FORMAT_PNG], [(RED, 150), (GREEN, 120), (BLUE, 170)])
+
+
+def assert_ansi_script(filename, sleeps):
+    with open(filename, encoding="utf-8") as f:
+        script = f.read()
+    assert script.startswith("#!/bin/sh\n")
+    assert script.count(f"cat <<'{ANSI_SCRIPT_FRAME_DELIMITER}'\n") == len(sleeps)
+    assert re.findall(r"^sleep (\S+)$", script, re.MULTILINE) == sleeps
+    # each frame starts with the background color of the frame
+    frames = [frame.split("\n", 1)[1] for frame in script.split(f"<<'{ANSI_SCRIPT_FRAME_DELIMITER}'")[1:]]
+    assert [frame[:frame.index("m") + 1] for frame in frames] == ["\x1b[48;2;255;0;0m", "\x1b[48;2;0;255;0m", "\x1b[48;2;0;0;255m"]
+    if shutil.which("sh") is not None:
+        assert subprocess.run(["sh", "-n", filename]).returncode == 0
+
+
+def assert_svg_animation(filename, durations):
+    root = ElementTree.parse(filename).getroot()
+    frames = root.findall(f"{SVG_NAMESPACE}g")
+    assert len(frames) == len(durations)
+    animations = [frame.find(f"{SVG_NAMESPACE}set") for frame in frames]
+    assert [animation.get("id") for animation in animations] == [f"f{index}" for index in range(len(durations) - 1)] + ["last"]
+    assert [animation.get("begin") for animation in animations] == ["0s;last.end"] + [f"f{index}.end" for index in range(len(durations) - 1)]
+    assert [animation.get("dur") for animation in animations] == durations
+    assert all(frame.get("display") == "none" for frame in frames)
+
+
+def assert_apng(filename, colors_and_durations):
+    with Image.open(filename) as image:
+        assert image.format == "PNG" and image.n_frames == len(colors_and_durations)
+        frames = []
+        for index in range(image.n_frames):
+            image.seek(index)
+            image.load()
+            frames.append((image.copy(), image.info["duration"]))
+    assert get_colors_and_durations(frames) == colors_and_durations
+
+
+def test_writes_single_frame_without_animation(outputs):
+    data = encode_animation([create_frame(GREEN)], "GIF")
+
+    result = convert(data, outputs)
+
+    assert result == {"frames": 1, "merged": 0}
+    root = ElementTree.parse(outputs[FORMAT_SVG]).getroot()
+    assert len(root.findall(f"{SVG_NAMESPACE}g")) == 1 and root.find(f".//{SVG_NAMESPACE}set") is None
+    assert_apng(outputs[FORMAT_PNG], [(GREEN, 100)])
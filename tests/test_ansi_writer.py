@@ -0,0 +1,188 @@
+"""
+Round trips of the minimal ANSI writer and the SGR parser of the cell grid for all approaches and color modes.
+"""
+import os
+import re
+import sys
+
+import numpy as np
+import pytest
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+IMAGE_FILENAME = os.path.join(REPOSITORY_DIRECTORY, "images", "image-to-ascii-art-logo.png")
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from ansi_writer import get_lookup_table, get_palette, map_colors, write_ansi, COLORS_16, COLORS_256, COLORS_TRUECOLOR, LUT_BITS  # noqa: E402
+from approaches import APPROACHES, convert_approach  # noqa: E402
+from cell_grid import ANSI_ESCAPE_SEQUENCE, ANSI_PALETTE, CellGrid, apply_sgr_parameters, get_256_color  # noqa: E402
+from image_context import ImageContext  # noqa: E402
+
+WIDTH = 60
+COLOR_MODES = [COLORS_TRUECOLOR, COLORS_256, COLORS_16]
+
+
+@pytest.fixture(scope="module")
+def grids():
+    with ImageContext(IMAGE_FILENAME) as image:
+        return {approach: convert_approach(approach, image, WIDTH) for approach in APPROACHES}
+
+
+def get_palette_colors(rgb, colors):
+    """
+    Returns the palette colors the writer maps the given colors to.
+    """
+    palette = np.array(get_palette(colors)[0], dtype=np.uint8)
+    return palette[map_colors(rgb, colors)]
+
+
+def count_color_changes(grid):
+    """
+    Returns the number of escape sequences needed for the colors of the grid: one per color change and one reset per colored line end.
+    """
+    changes = 0
+    for runs in grid.get_color_runs():
+        current = (None, None)
+        for _, _, foreground, background in runs:
+            if (foreground, background) != current:
+                changes += 1
+            current = (foreground, background)
+        if current != (None, None):
+            changes += 1
+    return changes
+
+
+def assert_same_cells(grid, expected_grid, expected_foreground, expected_background):
+    assert grid.get_lines() == expected_grid.get_lines()
+    assert (grid.has_foreground == expected_grid.has_foreground).all()
+    assert (grid.has_background == expected_grid.has_background).all()
+    assert (grid.foreground[grid.has_foreground] == expected_foreground[expected_grid.has_foreground]).all()
+    assert (grid.background[grid.has_background] == expected_background[expected_grid.has_background]).all()
+
+
+def test_converts_all_approaches(grids):
+    assert len(grids) == 9
+    assert all(grid is not None and grid.columns == WIDTH for grid in grids.values())
+
+
+@pytest.mark.parametrize("colors", COLOR_MODES)
+@pytest.mark.parametrize("approach", list(APPROACHES))
+def test_round_trip(grids, approach, colors):
+    grid = grids[approach]
+
+    parsed = CellGrid.from_ansi(write_ansi(grid, colors), columns=WIDTH)
+
+    if colors == COLORS_TRUECOLOR:
+        assert_same_cells(parsed, grid, grid.foreground, grid.background)
+    else:
+        assert_same_cells(parsed, grid, get_palette_colors(grid.foreground, colors), get_palette_colors(grid.background, colors))
+
+
+@pytest.mark.parametrize("colors", COLOR_MODES)
+@pytest.mark.parametrize("approach", list(APPROACHES))
+def test_writes_escape_sequence_per_color_change_only(grids, approach, colors):
+    grid = grids[approach]
+
+    text = write_ansi(grid, colors)
+
+    escape_sequences = len(ANSI_ESCAPE_SEQUENCE.findall(text))
+    assert escape_sequences == count_color_changes(CellGrid.from_ansi(text, columns=WIDTH))
+    assert escape_sequences <= count_color_changes(grid)
+    if not grid.has_foreground.any() and not grid.has_background.any():
+        assert "\x1b" not in text and text.splitlines() == grid.get_lines()
+    elif colors == COLORS_TRUECOLOR:
+        # ascii-image-converter writes a sequence and a reset per character, the writer at most one sequence per character
+        assert escape_sequences <= len(ANSI_ESCAPE_SEQUENCE.findall(grid.to_ansi())) / 2 + grid.rows
+    else:
+        # neighbouring characters mapped to the same palette color share one sequence
+        assert escape_sequences <= len(ANSI_ESCAPE_SEQUENCE.findall(write_ansi(grid)))
+
+
+def test_merges_foreground_and_background_changes():
+    codes = np.frombuffer("ab".encode("utf-32-le"), dtype=np.uint32).reshape(1, 2)
+    colors = np.array([[[1, 2, 3], [4, 5, 6]]], dtype=np.uint8)
+    grid = CellGrid(codes, colors, colors[:, ::-1], np.ones((1, 2), dtype=bool), np.ones((1, 2), dtype=bool))
+
+    assert write_ansi(grid) == "\x1b[38;2;1;2;3;48;2;4;5;6ma\x1b[38;2;4;5;6;48;2;1;2;3mb\x1b[0m\n"
+
+
+def test_writes_default_colors_within_line():
+    codes = np.frombuffer("abc".encode("utf-32-le"), dtype=np.uint32).reshape(1, 3)
+    grid = CellGrid(codes, np.full((1, 3, 3), 255, dtype=np.uint8), has_foreground=np.array([[True, False, True]]))
+
+    assert write_ansi(grid) == "\x1b[38;2;255;255;255ma\x1b[39mb\x1b[38;2;255;255;255mc\x1b[0m\n"
+
+
+@pytest.mark.parametrize("colors", [COLORS_256, COLORS_16])
+def test_lookup_table_maps_to_nearest_palette_color(colors):
+    palette = np.array(get_palette(colors)[0], dtype=np.int32)
+    table = get_lookup_table(colors)
+    step = 256 // (1 << LUT_BITS)
+    rng = np.random.default_rng(0)
+    reduced = rng.integers(0, 1 << LUT_BITS, size=(500, 3))
+
+    centers = reduced * step + step // 2
+    distances = ((centers[:, np.newaxis, :] - palette[np.newaxis, :, :]) ** 2).sum(axis=2)
+    chosen = table[reduced[:, 0], reduced[:, 1], reduced[:, 2]]
+
+    assert (distances[np.arange(len(reduced)), chosen] == distances.min(axis=1)).all()
+
+
+@pytest.mark.parametrize("colors,rgb,parameters", [
+    (COLORS_256, (255, 0, 0), "38;5;196"),
+    (COLORS_256, (0, 0, 0), "38;5;16"),
+    (COLORS_256, (0, 0, 255), "38;5;21"),
+    (COLORS_16, ANSI_PALETTE[1], "31"),
+    (COLORS_16, ANSI_PALETTE[12], "94")
+])
+def test_maps_colors_to_escape_codes(colors, rgb, parameters):
+    _, codes = get_palette(colors)
+    index = map_colors(np.array([rgb], dtype=np.uint8), colors)[0]
+
+    assert codes[index][0] == parameters
+
+
+def test_get_256_color():
+    assert get_256_color(1) == ANSI_PALETTE[1]
+    assert get_256_color(16) == (0, 0, 0)
+    assert get_256_color(196) == (255, 0, 0)
+    assert get_256_color(231) == (255, 255, 255)
+    assert get_256_color(232) == (8, 8, 8)
+    assert get_256_color(255) == (238, 238, 238)
+
+
+@pytest.mark.parametrize("parameters,expected", [
+    ("", (None, None)),
+    ("0", (None, None)),
+    ("38;2;1;2;3", ((1, 2, 3), (9, 9, 9))),
+    ("48;5;196", ((7, 7, 7), (255, 0, 0))),
+    ("38;5;16;48;2;1;2;3", ((0, 0, 0), (1, 2, 3))),
+    ("39", (None, (9, 9, 9))),
+    ("49", ((7, 7, 7), None)),
+    ("1;31", (ANSI_PALETTE[1], (9, 9, 9))),
+    ("97;104", (ANSI_PALETTE[15], ANSI_PALETTE[12])),
+    ("0;42", (None, ANSI_PALETTE[2]))
+])
+def test_applies_sgr_parameters(parameters, expected):
+    assert apply_sgr_parameters(parameters, (7, 7, 7), (9, 9, 9)) == expected
+
+
+def test_parses_colors_continued_across_lines():
+    grid = CellGrid.from_ansi("\x1b[31mab\nc\x1b[0md\n", columns=2)
+
+    assert grid.get_lines() == ["ab", "cd"]
+    assert grid.has_foreground.tolist() == [[True, True], [True, False]]
+    assert grid.foreground[1, 0].tolist() == list(ANSI_PALETTE[1])
+
+
+def test_parses_truecolor_cells_of_ascii_image_converter():
+    text = "\x1b[38;2;1;2;3ma\x1b[0m\x1b[38;2;4;5;6mb\x1b[0m\n"
+
+    grid = CellGrid.from_ansi(text)
+
+    assert grid.get_lines() == ["ab"]
+    assert grid.foreground.tolist() == [[[1, 2, 3], [4, 5, 6]]]
+    assert grid.has_foreground.all() and not grid.has_background.any()
+    assert grid.to_ansi() == text
+    assert len(re.findall("\x1b", write_ansi(grid))) == 3
@@ -0,0 +1,194 @@
+"""
+Status codes and job lifecycle of the HTTP conversion API (served by a local Tornado server).
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+import pytest
+import requests
+import tornado.httpserver
+import tornado.netutil
+from PIL import Image
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+# the API reads its configuration at import time
+os.environ.setdefault("UPLOAD_DIRECTORY", tempfile.mkdtemp(prefix="image-to-ascii-art-api-"))
+
+from api_server import ConversionService, create_application, JOB_DONE, JOB_FAILED  # noqa: E402
+from conversion_cache import ConversionCache  # noqa: E402
+from downloader import Downloader  # noqa: E402
+
+TIMEOUT = 10
+
+
+def encode_png(width=40, height=20):
+    data = BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(data, "PNG")
+    return data.getvalue()
+
+
+class ApiServer:
+    """
+    Serves the API of the given service in a thread of its own.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+        self.url = f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._serve, args=(sockets,), daemon=True)
+        self.thread.start()
+        assert self.started.wait(TIMEOUT)
+
+    def _serve(self, sockets):
+        asyncio.set_event_loop(self.loop)
+        server = tornado.httpserver.HTTPServer(create_application(self.service))
+        server.add_sockets(sockets)
+        self.loop.call_soon(self.started.set)
+        self.loop.run_forever()
+        server.stop()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(TIMEOUT)
+        self.service.pool.shutdown()
+
+    def convert(self, image=None, **params):
+        files = {"image": ("image.png", image)} if image is not None else None
+        return requests.post(self.url + "/api/convert", params=params, files=files, timeout=TIMEOUT)
+
+    def wait_for_job(self, job_id):
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            job = requests.get(f"{self.url}/api/jobs/{job_id}", timeout=TIMEOUT).json()
+            if job["status"] in (JOB_DONE, JOB_FAILED):
+                return job
+            time.sleep(0.05)
+        raise TimeoutError(f"job {job_id} did not finish")
+
+
+def create_server(tmp_path, **kwargs):
+    cache = ConversionCache(str(tmp_path / "cache"), 64 * 1024 * 1024)
+    downloader = Downloader(str(tmp_path / "downloads"))
+    return ApiServer(ConversionService(str(tmp_path / "api"), cache, downloader, **kwargs))
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = create_server(tmp_path, workers=2, queue_size=4)
+    yield server
+    server.stop()
+
+
+def test_converts_synchronously(server):
+    response = server.convert(encode_png(), width=20, format="txt")
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert len(response.text.splitlines()) == 5
+
+
+def test_converts_asynchronously(server):
+    response = server.convert(encode_png(), width=20, format="svg", mode="async")
+
+    assert response.status_code == 202
+    job = response.json()
+    assert response.headers["Location"] == f"/api/jobs/{job['id']}"
+    assert server.wait_for_job(job["id"])["status"] == JOB_DONE
+    result = requests.get(f"{server.url}/api/jobs/{job['id']}/result", timeout=TIMEOUT)
+    assert result.status_code == 200
+    assert result.headers["Content-Type"] == "image/svg+xml"
+    assert result.content.lstrip().startswith(b"<")
+
+
+@pytest.mark.parametrize("params,message", [
+    ({"approach": "unknown"}, "unknown approach"),
+    ({"format": "bmp"}, "unknown format"),
+    ({"width": "wide"}, "width must be an integer"),
+    ({"width": "5"}, "width must be between"),
+    ({"mode": "later"}, "unknown mode")
+])
+def test_rejects_invalid_arguments(server, params, message):
+    response = server.convert(encode_png(), **params)
+
+    assert response.status_code == 400
+    assert message in response.json()["error"]
+
+
+def test_requires_image_or_url(server):
+    response = server.convert()
+
+    assert response.status_code == 400
+    assert "image file or an URL" in response.json()["error"]
+
+
+def test_rejects_invalid_image_synchronously(server):
+    response = server.convert(b"not an image", width=20)
+
+    assert response.status_code == 400
+    assert "could not be read" in response.json()["error"]
+
+
+def test_reports_failed_job(server):
+    response = server.convert(b"not an image", width=20, mode="async")
+
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    job = server.wait_for_job(job_id)
+    assert job["status"] == JOB_FAILED and "could not be read" in job["error"]
+    result = requests.get(f"{server.url}/api/jobs/{job_id}/result", timeout=TIMEOUT)
+    assert result.status_code == 422
+
+
+def test_reports_unknown_job(server):
+    assert requests.get(f"{server.url}/api/jobs/0123abcd", timeout=TIMEOUT).status_code == 404
+    assert requests.get(f"{server.url}/api/jobs/0123abcd/result", timeout=TIMEOUT).status_code == 404
+
+
+def test_rejects_requests_if_saturated(tmp_path):
+    server = create_server(tmp_path, workers=1, queue_size=0)
+    release = threading.Event()
+    convert = server.service.convert
+    server.service.convert = lambda *args: release.wait(TIMEOUT) and convert(*args)
+    try:
+        blocking = server.convert(encode_png(), width=20, mode="async")
+        rejected = server.convert(encode_png(), width=20, mode="async")
+        release.set()
+
+        assert blocking.status_code == 202
+        assert rejected.status_code == 429
+        assert rejected.headers["Retry-After"] == "1"
+        assert server.wait_for_job(blocking.json()["id"])["status"] == JOB_DONE
+        # the upload of the rejected request is removed, only the result of the job is kept
+        assert os.listdir(server.service.working_directory) == ["jobs"]
+    finally:
+        release.set()
+        server.stop()
+
+
+def test_removes_expired_jobs(tmp_path):
+    server = create_server(tmp_path, workers=1, queue_size=4, job_ttl=0)
+    try:
+        job_id = server.convert(encode_png(), width=20, mode="async").json()["id"]
+        assert server.wait_for_job(job_id)["status"] == JOB_DONE
+        assert len(os.listdir(server.service.jobs_directory)) == 1
+        time.sleep(0.01)
+
+        # expired jobs are removed when the next job is submitted
+        next_job_id = server.convert(encode_png(), width=30, mode="async").json()["id"]
+
+        assert requests.get(f"{server.url}/api/jobs/{job_id}", timeout=TIMEOUT).status_code == 404
+        assert server.wait_for_job(next_job_id)["status"] == JOB_DONE
+        assert os.listdir(server.service.jobs_directory) == [f"{next_job_id}.txt"]
+    finally:
+        server.stop()
@@ -0,0 +1,106 @@
+"""
+Character ramps, area averaging and parameter handling of the built-in engine (independent of the external binary).
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+import ascii_engine  # noqa: E402
+from ascii_engine import (ASCII_CHARACTERS_COMPLEX, ASCII_CHARACTERS_SIMPLE, convert_image_to_grid, convert_with_parameters,  # noqa: E402
+                          get_ascii_height, parse_parameters, ENGINE_BUILTIN)
+from cell_grid import CellGrid  # noqa: E402
+
+
+def create_columns(colors, column_width=4, height=8):
+    """
+    Returns an RGB array with one column of column_width pixels per color.
+    """
+    return np.repeat(np.array([colors], dtype=np.uint8), column_width, axis=1).repeat(height, axis=0)
+
+
+@pytest.mark.parametrize("ramp,complex", [(ASCII_CHARACTERS_SIMPLE, False), (ASCII_CHARACTERS_COMPLEX, True)])
+def test_maps_luminance_to_ramp(ramp, complex):
+    # one gray column per character, each at the lowest luminance of its character
+    grays = [-(-i * 255 // (len(ramp) - 1)) for i in range(len(ramp))]
+    rgb = create_columns([(gray, gray, gray) for gray in grays])
+
+    grid = convert_image_to_grid(rgb, len(ramp), complex=complex)
+
+    assert grid.get_lines()[0] == ramp
+    assert not grid.has_foreground.any() and not grid.has_background.any()
+
+
+def test_uses_gray_weights_of_luminance():
+    # pure red, green and blue have a luminance of about 30%, 59% and 11%
+    rgb = create_columns([(255, 0, 0), (0, 255, 0), (0, 0, 255)])
+
+    grid = convert_image_to_grid(rgb, 3)
+
+    assert grid.get_lines()[0] == ASCII_CHARACTERS_SIMPLE[2] + ASCII_CHARACTERS_SIMPLE[5] + ASCII_CHARACTERS_SIMPLE[1]
+
+
+def test_averages_area_of_each_cell():
+    # each cell of 4x8 pixels consists of black and white (or red and blue) pixel columns
+    rgb = create_columns([(0, 0, 0), (255, 255, 255), (255, 0, 0), (0, 0, 255)], column_width=2)
+
+    grid = convert_image_to_grid(rgb, 2, color=True)
+
+    assert (grid.rows, grid.columns) == (1, 2)
+    assert grid.foreground[0].tolist() == [[128, 128, 128], [128, 0, 128]]
+    assert grid.has_foreground.all()
+
+
+def test_averages_cells_not_dividing_image():
+    # 3 cells of 10 pixels: the cells cover 3, 3 and 4 pixels
+    rgb = create_columns([(0, 0, 0)] * 3 + [(90, 90, 90)] * 3 + [(200, 200, 200)] * 3 + [(100, 100, 100)], column_width=1, height=2)
+
+    grid = convert_image_to_grid(rgb, 3, color_bg=True)
+
+    assert grid.background[0, :, 0].tolist() == [0, 90, 175]
+    assert grid.has_background.all() and not grid.has_foreground.any()
+
+
+def test_composes_transparency_onto_black():
+    image = Image.new("RGBA", (8, 16), (255, 255, 255, 128))
+
+    grid = convert_image_to_grid(image, 2, color=True)
+
+    assert grid.foreground[0, 0].tolist() == [128, 128, 128]
+
+
+def test_height_keeps_aspect_ratio_of_characters():
+    assert get_ascii_height(200, 100, 100) == 25
+    assert get_ascii_height(100, 1, 100) == 1
+    assert convert_image_to_grid(np.zeros((100, 200, 3), dtype=np.uint8), 40).rows == 10
+
+
+def test_parses_supported_parameters():
+    assert parse_parameters(["--color", "--color-bg", "--complex", "--width", "60"]) == {"width": 60, "color": True, "color_bg": True, "complex": True}
+    assert parse_parameters([]) == {"width": None, "color": False, "color_bg": False, "complex": False}
+
+
+def test_rejects_unsupported_parameters_without_binary(monkeypatch):
+    monkeypatch.setattr(ascii_engine.shutil, "which", lambda name: None)
+
+    with pytest.raises(ValueError, match="--braille"):
+        convert_with_parameters(np.zeros((8, 8, 3), dtype=np.uint8), "image.png", ["--braille", "--width", "4"], engine=ENGINE_BUILTIN)
+
+
+def test_falls_back_to_binary_for_unsupported_parameters(monkeypatch):
+    calls = []
+    fallback_grid = CellGrid(np.zeros((1, 4), dtype=np.uint32))
+    monkeypatch.setattr(ascii_engine.shutil, "which", lambda name: "/usr/bin/" + name)
+    monkeypatch.setattr(ascii_engine, "convert_with_ascii_image_converter", lambda *args: calls.append(args) or fallback_grid)
+
+    grid = convert_with_parameters(np.zeros((8, 8, 3), dtype=np.uint8), "image.png", ["--braille", "--width", "4"], engine=ENGINE_BUILTIN)
+
+    assert grid is fallback_grid
+    assert calls == [("image.png", ["--braille", "--width", "4"])]
@@ -0,0 +1,86 @@
+"""
+Parity of the built-in engine with the external ascii-image-converter binary.
+
+The reference output of the binary is read from tests/reference (if it was recorded) or created by running
+the binary (if it is installed); otherwise, the tests are skipped. To record the reference output:
+
+    python tests/test_ascii_engine_parity.py --update-references
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+REFERENCE_DIRECTORY = os.path.join(TESTS_DIRECTORY, "reference")
+IMAGE_FILENAME = os.path.join(REPOSITORY_DIRECTORY, "images", "image-to-ascii-art-logo.png")
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from approaches import APPROACHES  # noqa: E402
+from ascii_engine import convert_with_parameters, ENGINE_BUILTIN, ENGINE_EXTERNAL  # noqa: E402
+from cell_grid import CellGrid  # noqa: E402
+
+WIDTHS = [40, 100]
+PARAMETERS = sorted({tuple(settings["parameters"]) for settings in APPROACHES.values() if "parameters" in settings})
+
+# the built-in engine averages the pixels of each cell, the binary samples them (characters at edges may differ)
+MIN_EQUAL_CHARACTERS = 0.9
+MAX_MEAN_COLOR_DIFFERENCE = 8
+
+
+def get_reference_filename(parameters, width):
+    name = "_".join(parameter.lstrip("-") for parameter in parameters) or "plain"
+    return os.path.join(REFERENCE_DIRECTORY, f"{name}_width_{width}.txt")
+
+
+def run_binary(parameters, width):
+    command = [ENGINE_EXTERNAL] + list(parameters) + ["--width", str(width), IMAGE_FILENAME]
+    return subprocess.run(command, capture_output=True, check=True).stdout.decode("utf-8")
+
+
+def get_reference(parameters, width):
+    filename = get_reference_filename(parameters, width)
+    if os.path.isfile(filename):
+        with open(filename, encoding="utf-8") as f:
+            return f.read()
+    if shutil.which(ENGINE_EXTERNAL) is not None:
+        return run_binary(parameters, width)
+    pytest.skip(f"no reference output recorded and {ENGINE_EXTERNAL} is not installed")
+
+
+@pytest.mark.parametrize("width", WIDTHS)
+@pytest.mark.parametrize("parameters", PARAMETERS, ids=lambda parameters: " ".join(parameters) or "plain")
+def test_builtin_engine_matches_binary(parameters, width):
+    reference = CellGrid.from_ansi(get_reference(parameters, width), columns=width)
+    grid = convert_with_parameters(None, IMAGE_FILENAME, list(parameters) + ["--width", str(width)], engine=ENGINE_BUILTIN)
+
+    assert (grid.rows, grid.columns) == (reference.rows, reference.columns)
+    assert np.mean(grid.codes == reference.codes) >= MIN_EQUAL_CHARACTERS
+    for colors, reference_colors, used in [(grid.foreground, reference.foreground, reference.has_foreground),
+                                           (grid.background, reference.background, reference.has_background)]:
+        if used.any():
+            difference = np.abs(colors.astype(np.int16) - reference_colors.astype(np.int16))[used]
+            assert difference.mean() <= MAX_MEAN_COLOR_DIFFERENCE
+
+
+def update_references():
+    os.makedirs(REFERENCE_DIRECTORY, exist_ok=True)
+    for parameters in PARAMETERS:
+        for width in WIDTHS:
+            filename = get_reference_filename(parameters, width)
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(run_binary(parameters, width))
+            print(f"recorded {filename}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Records the reference output of {ENGINE_EXTERNAL} for the parity tests.")
+    parser.add_argument("--update-references", action="store_true", help=f"runs {ENGINE_EXTERNAL} and stores its output in tests/reference")
+    if parser.parse_args().update_references:
+        update_references()
@@ -0,0 +1,170 @@
+"""
+LRU eviction, atomic writes and coalescing of concurrent requests of the conversion cache.
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from conversion_cache import ConversionCache  # noqa: E402
+from single_flight import SingleFlight  # noqa: E402
+
+THREADS = 8
+
+
+def run_threads(target, count=THREADS):
+    """
+    Runs target(index) in count threads starting at the same time, returns the results in the order of the indices.
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        barrier.wait()
+        results[index] = target(index)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def cache_directory(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def test_evicts_least_recently_used_entries(cache_directory):
+    cache = ConversionCache(cache_directory, max_bytes=25)
+    first = cache.put_text("first", "1" * 10)
+    second = cache.put_text("second", "2" * 10)
+    assert cache.get_text("first") == "1" * 10
+
+    cache.put_text("third", "3" * 10)
+
+    assert cache.get_text("second") is None and not os.path.exists(second)
+    assert cache.get_text("first") == "1" * 10 and os.path.exists(first)
+    assert cache.get_text("third") == "3" * 10
+    assert cache.size() == 20
+    assert cache.stats()["evictions"] == 1
+
+
+def test_keeps_newest_entry_exceeding_budget(cache_directory):
+    cache = ConversionCache(cache_directory, max_bytes=5)
+    cache.put_text("small", "1")
+
+    cache.put_text("large", "2" * 10)
+
+    assert cache.get_text("small") is None
+    assert cache.get_text("large") == "2" * 10
+
+
+def test_restores_usage_order_after_restart(cache_directory):
+    cache = ConversionCache(cache_directory, max_bytes=25)
+    cache.put_text("first", "1" * 10)
+    time.sleep(0.01)
+    cache.put_text("second", "2" * 10)
+    time.sleep(0.01)
+    cache.get("first", "txt")
+
+    restarted_cache = ConversionCache(cache_directory, max_bytes=25)
+    assert restarted_cache.size() == 20
+    restarted_cache.put_text("third", "3" * 10)
+
+    assert restarted_cache.get_text("second") is None
+    assert restarted_cache.get_text("first") == "1" * 10
+
+
+def test_treats_vanished_file_as_miss(cache_directory):
+    cache = ConversionCache(cache_directory, max_bytes=100)
+    os.remove(cache.put_text("entry", "text"))
+
+    assert cache.read("entry", "txt") is None
+    assert cache.size() == 0
+
+
+def test_adopts_entries_written_by_other_process(cache_directory):
+    cache = ConversionCache(cache_directory, max_bytes=100)
+    other_process_cache = ConversionCache(cache_directory, max_bytes=100)
+    other_process_cache.put_text("entry", "text")
+
+    assert cache.get_text("entry") == "text"
+    assert cache.size() == 4
+
+
+def test_writes_entries_atomically(cache_directory):
+    cache = ConversionCache(cache_directory, max_bytes=10 * 1024 * 1024)
+    texts = [str(index) * 100_000 for index in range(THREADS)]
+    cache.put_text("entry", texts[0])
+
+    def write_or_read(index):
+        if index % 2 == 0:
+            cache.put_text("entry", texts[index])
+            return None
+        # readers see either the previous or the new content, never a partially written file
+        return [cache.get_text("entry") for _ in range(20)]
+
+    read_texts = [text for results in run_threads(write_or_read) if results is not None for text in results]
+
+    assert read_texts and all(text in texts for text in read_texts)
+    assert cache.get_text("entry") in texts
+    assert cache.size() == 100_000
+    assert not [name for _, _, files in os.walk(cache_directory) for name in files if name.endswith(".tmp")]
+
+
+def test_coalesces_concurrent_creation(cache_directory, tmp_path):
+    cache = ConversionCache(cache_directory, max_bytes=100)
+    calls = []
+
+    def create():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        filename = str(tmp_path / "created.txt")
+        with open(filename, "w") as f:
+            f.write("created")
+        return filename
+
+    paths = run_threads(lambda _: cache.get_or_create("entry", "txt", create))
+
+    assert len(calls) == 1
+    assert len(set(paths)) == 1 and paths[0] is not None
+    assert cache.get_text("entry") == "created"
+    assert cache.stats()["coalesced"] == THREADS - 1
+
+
+def test_does_not_cache_failed_creation(cache_directory):
+    cache = ConversionCache(cache_directory, max_bytes=100)
+
+    def create():
+        time.sleep(0.1)
+        raise RuntimeError("conversion failed")
+
+    def get_or_create(_):
+        try:
+            return cache.get_or_create("entry", "txt", create)
+        except RuntimeError as e:
+            return e
+
+    errors = run_threads(get_or_create)
+
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert cache.get_or_create("entry", "txt", lambda: None) is None
+    assert cache.size() == 0
+
+
+def test_single_flight_runs_function_again_after_completion():
+    single_flight = SingleFlight()
+    calls = []
+
+    assert single_flight.do("key", lambda: calls.append(1) or len(calls)) == 1
+    assert single_flight.do("key", lambda: calls.append(1) or len(calls)) == 2
+    assert single_flight.coalesced == 0
@@ -0,0 +1,117 @@
+"""
+Fair scheduling, cancellation and queue positions of the shared conversion pool.
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from conversion_pool import ConversionPool  # noqa: E402
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def pool():
+    pool = ConversionPool(max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def block(pool):
+    """
+    Occupies the only worker of the pool until the returned event is set.
+    """
+    started, release = threading.Event(), threading.Event()
+    pool.submit(lambda: started.set() or release.wait(TIMEOUT))
+    assert started.wait(TIMEOUT)
+    return release
+
+
+def create_jobs(keys, executed):
+    return {key: (executed.append, (key,), {}) for key in keys}
+
+
+def wait_for(futures):
+    for future in futures:
+        if not future.cancelled():
+            future.result(TIMEOUT)
+
+
+def test_serves_sessions_round_robin(pool):
+    executed = []
+    release = block(pool)
+    futures = list(pool.submit_all(create_jobs(["a1", "a2", "a3"], executed), session_id="a"))
+    futures += list(pool.submit_all(create_jobs(["b1", "b2"], executed), session_id="b"))
+    futures += list(pool.submit_all(create_jobs(["c1"], executed), session_id="c"))
+
+    release.set()
+    wait_for(futures)
+
+    assert executed == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_cancels_queued_jobs_of_rerun_session(pool):
+    executed = []
+    release = block(pool)
+    superseded = pool.submit_all(create_jobs(["old1", "old2"], executed), session_id="a")
+    other = pool.submit_all(create_jobs(["other"], executed), session_id="b")
+    current = pool.submit_all(create_jobs(["new"], executed), session_id="a")
+
+    assert all(future.cancelled() for future in superseded)
+    assert pool.stats()["cancelled"] == 2
+
+    release.set()
+    wait_for(list(other) + list(current))
+
+    assert sorted(executed) == ["new", "other"]
+
+
+def test_queue_positions(pool):
+    release = block(pool)
+    futures_a = list(pool.submit_all(create_jobs(["a1", "a2", "a3"], []), session_id="a"))
+
+    assert [pool.queue_position(future) for future in futures_a] == [1, 2, 3]
+
+    futures_b = list(pool.submit_all(create_jobs(["b1"], []), session_id="b"))
+
+    # b1 runs after a1, a3 after a1, b1 and a2
+    assert pool.queue_position(futures_b[0]) == 2
+    assert pool.queue_position(futures_a[2]) == 4
+
+    release.set()
+    wait_for(futures_a + futures_b)
+
+    assert pool.queue_position(futures_a[0]) is None
+
+
+def test_removes_attributes_of_thread_initializer_after_job(pool):
+    def set_context(thread):
+        thread.context = "session a"
+
+    def get_context():
+        return getattr(threading.current_thread(), "context", None)
+
+    results = {key: result for key, result, _ in pool.results_as_completed({"job": (get_context, (), {})}, thread_initializer=set_context)}
+
+    assert results == {"job": "session a"}
+    assert pool.submit(get_context).result(TIMEOUT) is None
+
+
+def test_yields_results_and_exceptions(pool):
+    release = block(pool)
+    waiting = []
+    jobs = {"result": (lambda: 42, (), {}), "error": (lambda: 1 // 0, (), {})}
+    threading.Timer(0.2, release.set).start()
+
+    results = {key: (result, exception) for key, result, exception in pool.results_as_completed(jobs, on_waiting=waiting.append, poll_interval=0.05)}
+
+    assert results["result"] == (42, None)
+    assert isinstance(results["error"][1], ZeroDivisionError)
+    assert waiting and set(waiting[0]) == {"result", "error"}
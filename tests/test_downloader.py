@@ -0,0 +1,119 @@
+"""
+Bounded downloads of the downloader against a local HTTP server.
+"""
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+import requests
+from PIL import Image
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from downloader import Downloader  # noqa: E402
+from image_ingestion import ImageBudgetExceededError  # noqa: E402
+
+TOTAL_TIMEOUT = 1
+# time for the server to send one byte of a dripping response (each read finishes within the read timeout)
+DRIP_INTERVAL = 0.1
+# a dripping response ends after this many bytes at the latest (if the download is not aborted)
+DRIP_BYTES = 100
+
+
+def encode_png(width, height):
+    data = BytesIO()
+    Image.new("RGB", (width, height)).save(data, "PNG")
+    return data.getvalue()
+
+
+IMAGE = encode_png(20, 10)
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves /image, /large-image and the dripping responses /drip/<kind> (kind: content-length, chunked or close-delimited).
+    """
+    stopped = threading.Event()
+
+    def do_GET(self):
+        if self.path == "/image":
+            self.send_body(IMAGE)
+        elif self.path == "/large-image":
+            self.send_body(encode_png(2000, 1000))
+        elif self.path.startswith("/drip/"):
+            self.drip(self.path[len("/drip/"):])
+        else:
+            self.send_error(404)
+
+    def send_body(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def drip(self, kind):
+        # HTTP/1.0 responses without Content-Length end when the connection is closed
+        self.protocol_version = "HTTP/1.0" if kind == "close-delimited" else "HTTP/1.1"
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        if kind == "content-length":
+            self.send_header("Content-Length", "1000000")
+        elif kind == "chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for _ in range(DRIP_BYTES):
+                if self.stopped.wait(DRIP_INTERVAL):
+                    break
+                self.wfile.write(b"1\r\nx\r\n" if kind == "chunked" else b"x")
+                self.wfile.flush()
+        except OSError:
+            # the client shut the connection down
+            pass
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    ImageRequestHandler.stopped.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    ImageRequestHandler.stopped.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    return Downloader(str(tmp_path / "downloads"), read_timeout=5, total_timeout=TOTAL_TIMEOUT, max_pixels=1_000_000)
+
+
+def test_downloads_image(downloader, server_url):
+    assert downloader.fetch(server_url + "/image") == IMAGE
+
+
+def test_rejects_too_large_image(downloader, server_url):
+    with pytest.raises(ImageBudgetExceededError):
+        downloader.fetch(server_url + "/large-image")
+
+
+@pytest.mark.parametrize("kind", ["content-length", "chunked", "close-delimited"])
+def test_aborts_dripping_download_at_deadline(downloader, server_url, kind):
+    start = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        downloader.fetch(f"{server_url}/drip/{kind}")
+    assert time.monotonic() - start < TOTAL_TIMEOUT + 2
@@ -0,0 +1,162 @@
+"""
+Downscaling of the working copy by the image ingestion for the different image modes and formats.
+"""
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+import image_ingestion  # noqa: E402
+from image_ingestion import (convert_to_rgb, decode_downscaled, get_raw_strips, ImageBudgetExceededError, ingest_image, reduce_strips,  # noqa: E402
+                             WORKING_PIXELS_FACTOR)
+
+MAX_WIDTH = 100
+WIDTH = 4 * MAX_WIDTH
+HEIGHT = 3 * MAX_WIDTH
+
+
+def create_gradient(mode):
+    """
+    Returns a horizontal gradient from black to (almost) white in the given mode.
+    """
+    values = np.tile(np.linspace(0, 255, WIDTH), (HEIGHT, 1))
+    if mode == "P":
+        # a palette with colors (GIF images with a gray palette are opened as L images)
+        image = Image.fromarray(values.astype(np.uint8), "P")
+        image.putpalette([channel for value in range(256) for channel in (value, value, value // 2)])
+        return image
+    if mode == "I;16":
+        return Image.fromarray((values * 257).astype(np.uint16), "I;16")
+    if mode in ("I", "F"):
+        return Image.fromarray(values.astype(np.int32 if mode == "I" else np.float32), mode)
+    return Image.fromarray(values.astype(np.uint8), "L").convert(mode)
+
+
+def encode(image, image_format, **params):
+    data = BytesIO()
+    image.save(data, image_format, **params)
+    return data.getvalue()
+
+
+def ingest(data, tmp_path, **kwargs):
+    output_filename = str(tmp_path / "working.png")
+    info = ingest_image(data, output_filename, max_width=MAX_WIDTH, **kwargs)
+    with Image.open(output_filename) as working_copy:
+        working_copy.load()
+    return info, working_copy
+
+
+@pytest.mark.parametrize("mode,image_format,params", [
+    ("P", "PNG", {}),
+    ("P", "GIF", {}),
+    ("1", "PNG", {}),
+    ("L", "PNG", {}),
+    ("LA", "PNG", {}),
+    ("I;16", "PNG", {}),
+    ("I;16", "TIFF", {}),
+    ("I", "TIFF", {"compression": "tiff_deflate"}),
+    ("F", "TIFF", {"compression": "tiff_deflate"}),
+    ("RGB", "JPEG", {}),
+    ("RGB", "TIFF", {}),
+    ("CMYK", "TIFF", {})
+])
+def test_downscales_image_mode(mode, image_format, params, tmp_path):
+    data = encode(create_gradient(mode), image_format, **params)
+    with Image.open(BytesIO(data)) as image:
+        assert image.mode == mode
+
+    info, working_copy = ingest(data, tmp_path)
+
+    assert (info["width"], info["height"]) == (WIDTH, HEIGHT)
+    assert working_copy.mode == ("RGBA" if mode == "LA" else "RGB")
+    assert working_copy.size == (WIDTH // 4, HEIGHT // 4)
+    if mode != "1":
+        # the gradient is kept (dithered 1-bit images just have black and white pixels)
+        row = np.asarray(working_copy.convert("L"))[working_copy.height // 2].astype(int)
+        assert row[0] < 16 and row[-1] > 224
+        assert np.all(np.diff(row) >= -2)
+
+
+def test_keeps_transparency_of_palette_image(tmp_path):
+    image = Image.new("P", (WIDTH, HEIGHT))
+    image.putpalette([0, 0, 0, 255, 255, 255])
+    image.paste(1, (WIDTH // 2, 0, WIDTH, HEIGHT))
+    data = encode(image, "PNG", transparency=0)
+
+    _, working_copy = ingest(data, tmp_path)
+
+    assert working_copy.mode == "RGBA"
+    assert working_copy.getpixel((0, 0))[3] == 0
+    assert working_copy.getpixel((working_copy.width - 1, 0))[3] == 255
+
+
+def test_averages_colors_instead_of_palette_indices(tmp_path):
+    # alternating red and blue columns: palette indices 0 and 1 would be averaged to index 0 (red) or 1 (blue)
+    image = Image.new("P", (WIDTH, HEIGHT))
+    image.putpalette([255, 0, 0, 0, 0, 255])
+    image.putdata([x % 2 for _ in range(HEIGHT) for x in range(WIDTH)])
+
+    _, working_copy = ingest(encode(image, "PNG"), tmp_path)
+
+    assert working_copy.getpixel((0, 0)) == (128, 0, 128)
+
+
+def test_bounds_pixels_of_tall_image(tmp_path):
+    image = Image.new("P", (MAX_WIDTH, 40 * MAX_WIDTH))
+
+    info, working_copy = ingest(encode(image, "PNG"), tmp_path)
+
+    assert (info["width"], info["height"]) == (MAX_WIDTH, 40 * MAX_WIDTH)
+    assert working_copy.width * working_copy.height <= WORKING_PIXELS_FACTOR * MAX_WIDTH * MAX_WIDTH
+
+
+def test_rejects_image_exceeding_pixel_budget(tmp_path):
+    data = encode(Image.new("1", (WIDTH, HEIGHT)), "PNG")
+
+    with pytest.raises(ImageBudgetExceededError):
+        ingest(data, tmp_path, max_pixels=WIDTH * HEIGHT - 1)
+
+
+def test_downscales_decoded_image():
+    # e.g., a copy of a frame of an animation, which has no raw tiles to read strip by strip
+    image = create_gradient("RGB")
+
+    working_copy = decode_downscaled(image.copy(), MAX_WIDTH)
+
+    assert working_copy.size == (WIDTH // 4, HEIGHT // 4)
+
+
+@pytest.mark.parametrize("mode,image_format", [
+    ("RGB", "TIFF"),
+    ("RGBA", "TIFF"),
+    ("L", "TIFF"),
+    ("I;16", "TIFF"),
+    ("RGB", "BMP"),
+    ("RGB", "PPM")
+])
+@pytest.mark.parametrize("factor", [2, 3, 7])
+def test_strip_reduction_matches_reduce(mode, image_format, factor, monkeypatch):
+    # a noisy image of a height that is not a multiple of the factor, read in bands of a few rows
+    rng = np.random.default_rng(factor)
+    image = Image.fromarray(rng.integers(0, 256, size=(HEIGHT + 1, WIDTH, 4), dtype=np.uint8), "RGBA")
+    image = image.convert(mode) if mode != "I;16" else create_gradient("I;16")
+    monkeypatch.setattr(image_ingestion, "STRIP_BYTES", 10 * WIDTH)
+    data = encode(image, image_format)
+
+    with Image.open(BytesIO(data)) as opened_image:
+        strips = get_raw_strips(opened_image)
+        assert strips is not None
+        reduced = reduce_strips(opened_image, strips, factor)
+    with Image.open(BytesIO(data)) as opened_image:
+        expected = convert_to_rgb(opened_image).reduce(factor)
+
+    assert reduced.mode == expected.mode and reduced.size == expected.size
+    assert np.array_equal(np.asarray(reduced), np.asarray(expected))
@@ -0,0 +1,47 @@
+"""
+Spans of the pipeline stages and their export in the Prometheus text format.
+"""
+import os
+import sys
+
+import pytest
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from metrics import Metrics, METRIC_PREFIX  # noqa: E402
+
+
+def test_records_spans():
+    metrics = Metrics(buckets=(1, 60))
+    with metrics.span("svg") as span:
+        span.output_bytes = 100
+        span.cache_hit = False
+    with pytest.raises(ValueError):
+        with metrics.span("svg"):
+            raise ValueError("failed")
+    metrics.record_cache("conversion_cache", True)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["peak_rss_bytes"] > 0
+    svg = snapshot["stages"]["svg"]
+    assert (svg["count"], svg["errors"], svg["output_bytes"], svg["cache_hits"], svg["cache_misses"]) == (2, 1, 100, 0, 1)
+    assert snapshot["stages"]["conversion_cache"]["count"] == 0
+
+
+def test_exports_prometheus_text():
+    metrics = Metrics(buckets=(1, 60))
+    with metrics.span("svg"):
+        pass
+    metrics.record_cache("conversion_cache", False)
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert f'{METRIC_PREFIX}_stage_duration_seconds_bucket{{stage="svg",le="1"}} 1' in lines
+    assert f'{METRIC_PREFIX}_stage_duration_seconds_count{{stage="svg"}} 1' in lines
+    assert f'{METRIC_PREFIX}_cache_requests_total{{stage="conversion_cache",result="miss"}} 1' in lines
+    # the peak RSS is a gauge of the process, not of the stages running in its threads
+    assert [line.split(" ")[0] for line in lines if "rss" in line and not line.startswith("#")] == [f"{METRIC_PREFIX}_process_peak_rss_bytes"]
@@ -0,0 +1,56 @@
+"""
+Baseline of the pipeline benchmark: durations relative to the calibration workload and one report per regressed stage.
+"""
+import json
+import os
+import sys
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, os.path.join(REPOSITORY_DIRECTORY, "benchmarks"))
+
+from pipeline_benchmark import compare_with_baseline, create_baseline, write_baseline  # noqa: E402
+
+MB = 2 ** 20
+RESULTS = {
+    "png|large-jpeg|300|With colors (I)": {"seconds": 0.5, "peak_rss_bytes": 100 * MB},
+    "svg|large-jpeg|300|With colors (I)": {"seconds": 0.1, "peak_rss_bytes": None}
+}
+
+
+def compare(results, baseline, calibration_seconds):
+    return compare_with_baseline(results, baseline, calibration_seconds, tolerance=1.25, minimum_seconds=0.005, minimum_bytes=16 * MB)
+
+
+def test_writes_relative_baseline(tmp_path):
+    filename = str(tmp_path / "baseline.json")
+
+    write_baseline(filename, create_baseline(RESULTS, calibration_seconds=0.25))
+
+    with open(filename) as f:
+        baseline = json.load(f)
+    assert baseline == {
+        "calibration_seconds": 0.25,
+        "stages": {
+            "png|large-jpeg|300|With colors (I)": {"relative_seconds": 2.0, "peak_rss_mb": 100.0},
+            "svg|large-jpeg|300|With colors (I)": {"relative_seconds": 0.4}
+        }
+    }
+    # no regressions on a machine twice as fast
+    fast_results = {key: dict(result, seconds=result["seconds"] / 2) for key, result in RESULTS.items()}
+    assert compare(fast_results, baseline, calibration_seconds=0.125) == []
+
+
+def test_reports_each_regression_once(capsys):
+    baseline = create_baseline(RESULTS, calibration_seconds=0.25)
+    results = dict(RESULTS, **{
+        "png|large-jpeg|300|With colors (I)": {"seconds": 1.0, "peak_rss_bytes": 200 * MB},
+        "html|large-jpeg|300|With colors (I)": {"seconds": 10.0, "peak_rss_bytes": None}
+    })
+
+    regressions = compare(results, baseline, calibration_seconds=0.25)
+
+    assert regressions == ["png|large-jpeg|300|With colors (I)"]
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == ["REGRESSION png|large-jpeg|300|With colors (I): 500.0 ms -> 1000.0 ms (2.00x), 100.0 MB -> 200.0 MB peak RSS"]
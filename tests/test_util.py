@@ -0,0 +1,82 @@
+"""
+Ingestion of uploaded files of the web UI: once per upload, even if the script is rerun.
+"""
+import os
+import sys
+from io import BytesIO
+
+from PIL import Image
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TESTS_DIRECTORY)
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+import util  # noqa: E402
+from util import save_uploaded_file  # noqa: E402
+
+MAX_WIDTH = 100
+
+
+class UploadedFile(BytesIO):
+    """
+    Like the UploadedFile of Streamlit: the bytes of an upload and the id of the upload, counting the reads.
+    """
+
+    def __init__(self, data, file_id):
+        super().__init__(data)
+        self.file_id = file_id
+        self.reads = 0
+
+    def read(self, *args):
+        self.reads += 1
+        return super().read(*args)
+
+
+def encode_png(color, width=300, height=200):
+    data = BytesIO()
+    Image.new("RGB", (width, height), color).save(data, "PNG")
+    return data.getvalue()
+
+
+def test_spools_file_once_per_upload(tmp_path):
+    input_filename = str(tmp_path / "image.png")
+    uploaded_file = UploadedFile(encode_png((255, 0, 0)), "upload-1")
+
+    image_info = save_uploaded_file(input_filename, uploaded_file, max_width=MAX_WIDTH)
+    reads = uploaded_file.reads
+    rerun_image_info = save_uploaded_file(input_filename, uploaded_file, max_width=MAX_WIDTH)
+
+    assert reads > 0 and uploaded_file.reads == reads
+    assert rerun_image_info == image_info
+    assert (image_info["width"], image_info["height"]) == (300, 200)
+    with Image.open(input_filename) as working_copy:
+        assert working_copy.width == MAX_WIDTH
+    # the spooled file is removed
+    assert sorted(os.listdir(tmp_path)) == ["image.png", "image.png.json"]
+
+
+def test_ingests_new_upload_of_same_name(tmp_path):
+    input_filename = str(tmp_path / "image.png")
+    first_image_info = save_uploaded_file(input_filename, UploadedFile(encode_png((255, 0, 0)), "upload-1"), max_width=MAX_WIDTH)
+
+    image_info = save_uploaded_file(input_filename, UploadedFile(encode_png((0, 0, 255)), "upload-2"), max_width=MAX_WIDTH)
+
+    assert image_info["hash"] != first_image_info["hash"]
+    with Image.open(input_filename) as working_copy:
+        assert working_copy.getpixel((0, 0)) == (0, 0, 255)
+
+
+def test_ingests_again_for_other_width(tmp_path, monkeypatch):
+    input_filename = str(tmp_path / "image.png")
+    uploaded_file = UploadedFile(encode_png((255, 0, 0)), "upload-1")
+    save_uploaded_file(input_filename, uploaded_file, max_width=MAX_WIDTH)
+    ingested = []
+    ingest_image = util.ingest_image
+    monkeypatch.setattr(util, "ingest_image", lambda *args, **kwargs: ingested.append(kwargs["max_width"]) or ingest_image(*args, **kwargs))
+
+    save_uploaded_file(input_filename, uploaded_file, max_width=MAX_WIDTH // 2)
+
+    assert ingested == [MAX_WIDTH // 2]
+    with Image.open(input_filename) as working_copy:
+        assert working_copy.width == MAX_WIDTH // 2
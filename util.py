@@ -1,17 +1,50 @@
 from PIL import Image
-import requests
+import json
 import logging
 import os
 import re
 import base64
+import shutil
+import tempfile
 from io import BytesIO
-import markdown
+from contextlib import contextmanager
+from functools import lru_cache
+from conversion_cache import hash_bytes
+from image_ingestion import ingest_image, map_file, DEFAULT_MAX_WIDTH, DEFAULT_MAX_PIXELS, DEFAULT_MAX_BYTES
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+@lru_cache(maxsize=None)
+def read_static_file(filename):
+    """
+        Returns the content of a static text file (CSS, JavaScript), it is read once per process.
+    """
+    with open(filename) as f:
+        return f.read()
+
+def create_thumbnail_png(filename, max_size):
+    """
+        Returns the image downscaled to at most max_size x max_size pixels as PNG bytes.
+    """
+    with Image.open(filename) as image:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buff = BytesIO()
+        image.save(buff, format="PNG")
+    return buff.getvalue()
+
+@lru_cache(maxsize=None)
+def get_image_as_png(filename, max_size):
+    """
+        Returns the image downscaled to at most max_size x max_size pixels as PNG bytes, it is created once per process.
+    """
+    return create_thumbnail_png(filename, max_size)
+
+@lru_cache(maxsize=None)
+def get_image_as_data_url(filename, max_size):
+    return "data:image/png;base64," + base64.b64encode(get_image_as_png(filename, max_size)).decode("utf-8")
 
 def include_css(st, filenames):
-    content = ""
-    for filename in filenames:
-        with open(filename) as f:
-            content += f.read()
+    content = "".join(read_static_file(filename) for filename in filenames)
     st.markdown(f"<style>{content}</style>", unsafe_allow_html=True)
 
 def get_size_of_image(pil_image):
@@ -19,17 +52,81 @@ def get_size_of_image(pil_image):
     width = pil_image.size[0]
     return {"width": width, "height": height}
 
-def download_image(url, download_filename):
-    im = Image.open(requests.get(url, stream=True).raw)
-    im.save(download_filename)
+def read_image_info(working_filename, max_width):
+    """
+        Returns the image information stored next to the working copy or None if there is no working copy for max_width.
+    """
+    try:
+        with open(working_filename + ".json") as f:
+            image_info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if image_info.get("max_width") != max_width or not os.path.isfile(working_filename):
+        return None
+    return image_info
+
+def write_image_info(working_filename, image_info):
+    with open(working_filename + ".json", "w") as f:
+        json.dump(image_info, f)
+
+def ingest_image_once(data, working_filename, max_width=DEFAULT_MAX_WIDTH, max_pixels=DEFAULT_MAX_PIXELS, max_bytes=DEFAULT_MAX_BYTES):
+    """
+        Stores a downscaled working copy of the image bytes unless the working copy of the same bytes
+        (identified by their hash) already exists, e.g., if the script is rerun after a widget change.
+        The image information is stored next to the working copy.
+    """
+    image_hash = hash_bytes(data)
+    image_info = read_image_info(working_filename, max_width)
+    if image_info is not None and image_info.get("hash") == image_hash:
+        return image_info
+    image_info = ingest_image(data, working_filename, max_width=max_width, max_pixels=max_pixels, max_bytes=max_bytes)
+    image_info["max_width"] = max_width
+    write_image_info(working_filename, image_info)
+    return image_info
+
+def download_image(url, download_filename, downloader, max_width=DEFAULT_MAX_WIDTH, max_pixels=DEFAULT_MAX_PIXELS, max_bytes=DEFAULT_MAX_BYTES):
+    """
+        Downloads the image (using the shared downloader and its cache) and stores a downscaled working copy (once per image).
+        Returns the original dimensions and the hash of the downloaded bytes.
+    """
+    with downloader.fetch_mapped(url) as data:
+        image_info = ingest_image_once(data, download_filename, max_width=max_width, max_pixels=max_pixels, max_bytes=max_bytes)
     logging.info(f"downloaded file from {url} to {download_filename}")
-    return get_size_of_image(im)
+    return image_info
 
-def save_uploaded_file(input_filename, uploaded_image_file):
-    uploaded_image = Image.open(uploaded_image_file)
-    uploaded_image.save(input_filename)
+@contextmanager
+def map_uploaded_file(uploaded_image_file, directory):
+    """
+        Spools the uploaded file to a temporary file in the given directory and yields it as read-only memory map,
+        s.t., it is not copied in memory as a whole (uncompressed images are read strip by strip by the ingestion).
+    """
+    file_descriptor, spool_filename = tempfile.mkstemp(prefix=".upload-", dir=directory)
+    try:
+        uploaded_image_file.seek(0)
+        with os.fdopen(file_descriptor, "wb") as f:
+            shutil.copyfileobj(uploaded_image_file, f, SPOOL_CHUNK_SIZE)
+        with map_file(spool_filename) as data:
+            yield data
+    finally:
+        os.remove(spool_filename)
+
+def save_uploaded_file(input_filename, uploaded_image_file, max_width=DEFAULT_MAX_WIDTH, max_pixels=DEFAULT_MAX_PIXELS, max_bytes=DEFAULT_MAX_BYTES):
+    """
+        Stores a downscaled working copy of the uploaded image (once per image).
+        Returns the original dimensions and the hash of the uploaded bytes.
+        The file is spooled and hashed once per upload: on reruns, the upload is recognized by its file_id.
+    """
+    file_id = getattr(uploaded_image_file, "file_id", None)
+    image_info = read_image_info(input_filename, max_width)
+    if file_id is not None and image_info is not None and image_info.get("file_id") == file_id:
+        return image_info
+    with map_uploaded_file(uploaded_image_file, os.path.dirname(input_filename)) as data:
+        image_info = ingest_image_once(data, input_filename, max_width=max_width, max_pixels=max_pixels, max_bytes=max_bytes)
+    if file_id is not None:
+        image_info["file_id"] = file_id
+        write_image_info(input_filename, image_info)
     logging.info("uploaded file to " + input_filename)
-    return get_size_of_image(uploaded_image)
+    return image_info
 
 def copy_file(src, dest):
     with open(src, 'r') as f:
@@ -124,6 +221,9 @@ def replace_values_in_index_html(st, activate, new_title, new_meta_description=N
     else:
         new_meta_description = ""
         
+    # only needed once per process, hence imported here
+    import markdown
+
     # render noscript content if it is not None and not empty as Markdown
     if new_noscript_content is not None and new_noscript_content != "":
         new_noscript_content = markdown.markdown(new_noscript_content)